@@ -41,6 +41,42 @@ class Config:
     
     # Security
     SESSION_TIMEOUT = int(os.environ.get('SESSION_TIMEOUT', 3600))
+    
+    # Consolidação do fluxo de caixa
+    # True: as rotas apenas enfileiram e o worker (python worker.py) consolida
+    CONSOLIDACAO_ASSINCRONA = os.environ.get('CONSOLIDACAO_ASSINCRONA', 'False') == 'True'
+    CONSOLIDACAO_JANELA_SEGUNDOS = int(os.environ.get('CONSOLIDACAO_JANELA_SEGUNDOS', 5))
+    CONSOLIDACAO_ESPERA_MAXIMA_SEGUNDOS = int(os.environ.get('CONSOLIDACAO_ESPERA_MAXIMA_SEGUNDOS', 60))
+    # Falha: nova tentativa após RETENTATIVA_SEGUNDOS * 2^(n-1); parada após MAX_TENTATIVAS falhas seguidas
+    CONSOLIDACAO_RETENTATIVA_SEGUNDOS = int(os.environ.get('CONSOLIDACAO_RETENTATIVA_SEGUNDOS', 30))
+    CONSOLIDACAO_MAX_TENTATIVAS = int(os.environ.get('CONSOLIDACAO_MAX_TENTATIVAS', 8))
+    # python: agrega na aplicação | sql: INSERT ... SELECT GROUP BY no banco
+    CONSOLIDACAO_ENGINE = os.environ.get('CONSOLIDACAO_ENGINE', 'python')
+    
+    # Cache do dashboard
+    # memoria: LRU em cada processo | sqlite: arquivo local compartilhado entre workers | desligado
+    DASHBOARD_CACHE = os.environ.get('DASHBOARD_CACHE', 'memoria')
+    DASHBOARD_CACHE_ARQUIVO = os.environ.get('DASHBOARD_CACHE_ARQUIVO', os.path.join(BASE_DIR, 'data', 'dashboard_cache.sqlite3'))
+    DASHBOARD_CACHE_MAX_ITENS = int(os.environ.get('DASHBOARD_CACHE_MAX_ITENS', 512))
+    DASHBOARD_CACHE_TTL_SEGUNDOS = int(os.environ.get('DASHBOARD_CACHE_TTL_SEGUNDOS', 300))
+    
+    # Cache de resultados dos relatórios (chave inclui a versão dos dados da empresa)
+    # Mesmos backends do dashboard; menos itens, pois cada resultado é maior
+    RELATORIOS_CACHE = os.environ.get('RELATORIOS_CACHE', 'memoria')
+    RELATORIOS_CACHE_ARQUIVO = os.environ.get('RELATORIOS_CACHE_ARQUIVO', os.path.join(BASE_DIR, 'data', 'relatorios_cache.sqlite3'))
+    RELATORIOS_CACHE_MAX_ITENS = int(os.environ.get('RELATORIOS_CACHE_MAX_ITENS', 64))
+    RELATORIOS_CACHE_TTL_SEGUNDOS = int(os.environ.get('RELATORIOS_CACHE_TTL_SEGUNDOS', 900))
+    
+    # Exportações em segundo plano (geradas pelo worker, baixadas depois)
+    EXPORTACAO_VALIDADE_HORAS = int(os.environ.get('EXPORTACAO_VALIDADE_HORAS', 24))
+    EXPORTACAO_MAX_FILA_POR_EMPRESA = int(os.environ.get('EXPORTACAO_MAX_FILA_POR_EMPRESA', 5))
+    EXPORTACAO_CONCORRENCIA_POR_EMPRESA = int(os.environ.get('EXPORTACAO_CONCORRENCIA_POR_EMPRESA', 1))
+    # Em andamento há mais tempo que isso: worker caiu, a exportação é marcada como erro
+    EXPORTACAO_TEMPO_MAXIMO_SEGUNDOS = int(os.environ.get('EXPORTACAO_TEMPO_MAXIMO_SEGUNDOS', 3600))
+
+    # Fontes TrueType Unicode dos relatórios em PDF (sem elas, Helvetica Latin-1)
+    PDF_FONTE = os.environ.get('PDF_FONTE', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    PDF_FONTE_NEGRITO = os.environ.get('PDF_FONTE_NEGRITO', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
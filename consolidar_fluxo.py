@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Reconsolidação completa do fluxo de caixa - LiveSun Financeiro
+
+As rotas de lançamentos atualizam o consolidado de forma incremental (apenas
+os buckets afetados). Este comando apaga e recalcula as tabelas
+fluxo_caixa_realizado/fluxo_caixa_previsto a partir de todos os lançamentos,
+e serve para reparar divergências ou popular o consolidado após migrações.
+
+As empresas são distribuídas entre processos (cada um com sua própria conexão
+e uma sessão por empresa). As empresas concluídas são gravadas no arquivo de
+checkpoint; com --retomar, uma execução interrompida continua de onde parou.
+
+Uso:
+  python consolidar_fluxo.py                  # Todas as empresas
+  python consolidar_fluxo.py --empresa 3      # Apenas a empresa 3
+  python consolidar_fluxo.py --engine sql     # Agregação no banco (INSERT ... SELECT)
+  python consolidar_fluxo.py --processos 8    # 8 processos em paralelo
+  python consolidar_fluxo.py --alteradas      # Só empresas alteradas desde a última reconsolidação completa
+  python consolidar_fluxo.py --retomar        # Pula as empresas já concluídas no checkpoint
+  python consolidar_fluxo.py --sem-diario     # Só empresas sem diário/fechamentos (release)
+"""
+
+import os
+import sys
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.app import create_app
+from src.models import db, Lancamento
+from src.services.fluxo_consolidado import consolidar_fluxo_caixa, ENGINES
+from src.services.fila_consolidacao import empresas_alteradas
+from src.services.fluxo_diario import empresas_sem_fluxo_diario
+from src.services.saldo_mensal import empresas_sem_saldo_mensal
+
+CHECKPOINT_PADRAO = os.path.join('data', 'consolidacao_checkpoint.txt')
+
+# App do processo filho (criada uma vez por processo no inicializador do pool)
+_app = None
+
+
+def _inicializar_processo():
+    global _app
+    _app = create_app()
+
+
+def _consolidar_empresa(empresa_id, engine):
+    """Rebuild one company in its own session; returns (empresa_id, stats, erro)."""
+    app = _app or create_app()
+    with app.app_context():
+        try:
+            return empresa_id, consolidar_fluxo_caixa(empresa_id, engine=engine)[0], None
+        except Exception as exc:
+            db.session.rollback()
+            return empresa_id, None, str(exc)
+        finally:
+            db.session.remove()
+
+
+def _ler_checkpoint(caminho):
+    if not os.path.exists(caminho):
+        return set()
+    with open(caminho, encoding='utf-8') as arquivo:
+        return {int(linha) for linha in arquivo if linha.strip()}
+
+
+def _gravar_checkpoint(arquivo, empresa_id):
+    # fsync por empresa: após uma queda o checkpoint reflete tudo que foi commitado
+    arquivo.write(f'{empresa_id}\n')
+    arquivo.flush()
+    os.fsync(arquivo.fileno())
+
+
+def _executar(empresa_ids, engine, processos):
+    """Yield (empresa_id, stats, erro) as each company finishes."""
+    if processos <= 1:
+        for empresa_id in empresa_ids:
+            yield _consolidar_empresa(empresa_id, engine)
+        return
+
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo) as pool:
+        futuros = [pool.submit(_consolidar_empresa, empresa_id, engine) for empresa_id in empresa_ids]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Reconsolida (rebuild completo) o fluxo de caixa realizado/previsto'
+    )
+    parser.add_argument(
+        '--empresa',
+        type=int,
+        action='append',
+        help='ID da empresa a reconsolidar (pode ser repetido). Padrão: todas'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=ENGINES,
+        help='Implementação da consolidação. Padrão: CONSOLIDACAO_ENGINE'
+    )
+    parser.add_argument(
+        '--processos',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Número de processos em paralelo (1 = sequencial). Padrão: núcleos da máquina'
+    )
+    parser.add_argument(
+        '--alteradas',
+        action='store_true',
+        help='Apenas empresas com dados alterados desde a última reconsolidação completa'
+    )
+    parser.add_argument(
+        '--sem-diario',
+        action='store_true',
+        help='Apenas empresas sem fluxo de caixa diário ou fechamentos mensais (backfill após o deploy)'
+    )
+    parser.add_argument(
+        '--retomar',
+        action='store_true',
+        help='Pula as empresas já concluídas no arquivo de checkpoint'
+    )
+    parser.add_argument(
+        '--checkpoint',
+        default=CHECKPOINT_PADRAO,
+        help=f'Arquivo de checkpoint. Padrão: {CHECKPOINT_PADRAO}'
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.empresa:
+            empresa_ids = args.empresa
+        else:
+            empresa_ids = [row[0] for row in db.session.query(Lancamento.empresa_id).distinct().all()]
+        if args.alteradas:
+            empresa_ids = empresas_alteradas(empresa_ids)
+        if args.sem_diario:
+            sem_diario = set(empresas_sem_fluxo_diario(empresa_ids)) | set(empresas_sem_saldo_mensal(empresa_ids))
+            empresa_ids = [empresa_id for empresa_id in empresa_ids if empresa_id in sem_diario]
+        db.session.remove()
+        # Conexões abertas não devem ser herdadas pelos processos filhos
+        db.engine.dispose()
+
+    concluidas = _ler_checkpoint(args.checkpoint) if args.retomar else set()
+    if not args.retomar and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    pendentes = [empresa_id for empresa_id in empresa_ids if empresa_id not in concluidas]
+
+    print('=' * 70)
+    print(f'[CONSOLIDAÇÃO] Reconsolidando {len(pendentes)} empresa(s) com {max(args.processos, 1)} processo(s)')
+    if len(pendentes) != len(empresa_ids):
+        print(f'[CONSOLIDAÇÃO] {len(empresa_ids) - len(pendentes)} empresa(s) já concluída(s) no checkpoint')
+    print('=' * 70)
+
+    checkpoint_dir = os.path.dirname(args.checkpoint)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    inicio = time.perf_counter()
+    falhas = 0
+    with open(args.checkpoint, 'a', encoding='utf-8') as checkpoint:
+        for posicao, (empresa_id, estatisticas, erro) in enumerate(
+            _executar(pendentes, args.engine, args.processos), start=1
+        ):
+            progresso = f'[{posicao}/{len(pendentes)}]'
+            if erro:
+                falhas += 1
+                print(f'  {progresso} ✗ Empresa {empresa_id}: {erro}')
+                continue
+            _gravar_checkpoint(checkpoint, empresa_id)
+            print(
+                f"  {progresso} ✓ Empresa {empresa_id}: {estatisticas['lancamentos']} lançamentos, "
+                f"{estatisticas['linhas']} linhas em {estatisticas['segundos']:.2f}s "
+                f"({estatisticas['lancamentos_por_segundo']:.0f} lançamentos/s)"
+            )
+
+    # Execução completa: o checkpoint só é mantido se houver falhas a retomar
+    if falhas == 0:
+        os.remove(args.checkpoint)
+
+    print(
+        f'\n[CONSOLIDAÇÃO] Concluída em {time.perf_counter() - inicio:.1f}s: '
+        f'{len(pendentes) - falhas} ok, {falhas} com erro'
+    )
+    return falhas == 0
+
+
+if __name__ == '__main__':
+    ok = main()
+    raise SystemExit(0 if ok else 1)
@@ -50,6 +50,18 @@ def create_app(config_name=None):
 
     db.init_app(app)
     
+    # Consolidação do fluxo de caixa a cada commit que altera lançamentos
+    from src.services.consolidacao_eventos import registrar_eventos_consolidacao
+    registrar_eventos_consolidacao()
+    
+    # Versão dos dados por empresa (ETag); depois da consolidação, que grava no before_commit
+    from src.services.versao_dados import registrar_eventos_versao
+    registrar_eventos_versao()
+    
+    # Invalidação do cache do dashboard a cada commit que altera dados da empresa
+    from src.services.dashboard_cache import registrar_eventos_cache
+    registrar_eventos_cache()
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -203,6 +215,13 @@ def _create_default_user():
 def _ensure_schema_compatibility():
     """Ensure required columns exist in databases created before recent releases."""
     try:
+        _ensure_columns(
+            'empresas',
+            {
+                'versao_dados': 'versao_dados INTEGER NOT NULL DEFAULT 0'
+            }
+        )
+
         _ensure_columns(
             'users',
             {
@@ -219,13 +238,47 @@ def _ensure_schema_compatibility():
             }
         )
 
+        _ensure_columns(
+            'fila_consolidacao',
+            {
+                'reconstruido_em': 'reconstruido_em DATETIME NULL',
+                'alterado_em': 'alterado_em DATETIME NULL',
+                'proxima_tentativa_em': 'proxima_tentativa_em DATETIME NULL'
+            }
+        )
+
+        # Coluna gerada; via ALTER TABLE o SQLite só aceita VIRTUAL (também indexável)
+        armazenamento = 'VIRTUAL' if db.engine.dialect.name == 'sqlite' else 'STORED'
         _ensure_columns(
             'lancamentos',
             {
                 'valor_imposto': 'valor_imposto DECIMAL(15,2) DEFAULT 0.00',
-                'valor_outros_custos': 'valor_outros_custos DECIMAL(15,2) DEFAULT 0.00'
+                'valor_outros_custos': 'valor_outros_custos DECIMAL(15,2) DEFAULT 0.00',
+                'data_referencia': (
+                    'data_referencia DATE GENERATED ALWAYS AS '
+                    f'(COALESCE(data_pagamento, data_vencimento)) {armazenamento}'
+                )
             }
         )
+
+        # Índices usados pela consolidação incremental do fluxo de caixa
+        _ensure_indexes(
+            'lancamentos',
+            {
+                'idx_lancamento_empresa_bucket': ('empresa_id', 'fluxo_conta_id', 'conta_banco_id'),
+                'idx_lancamento_empresa_pagamento': ('empresa_id', 'data_pagamento', 'id'),
+                'idx_lancamento_empresa_vencimento': ('empresa_id', 'data_vencimento', 'id'),
+                'idx_lancamento_empresa_referencia': ('empresa_id', 'data_referencia'),
+            }
+        )
+        _ensure_indexes(
+            'fluxo_caixa_realizado',
+            {'idx_fcr_empresa_bucket': ('empresa_id', 'fluxo_conta_id', 'conta_banco_id')}
+        )
+        _ensure_indexes(
+            'fluxo_caixa_previsto',
+            {'idx_fcp_empresa_bucket': ('empresa_id', 'fluxo_conta_id', 'conta_banco_id')}
+        )
     except Exception as exc:
         import traceback
         logger.error('Erro ao verificar/atualizar compatibilidade de schema: %s\n%s', exc, traceback.format_exc())
@@ -247,6 +300,21 @@ def _ensure_columns(table_name, expected_columns):
             logger.info('Coluna adicionada: %s.%s', table_name, column_name)
 
 
+def _ensure_indexes(table_name, expected_indexes):
+    """Create missing indexes on an existing table."""
+    inspector = inspect(db.engine)
+    if table_name not in set(inspector.get_table_names()):
+        return
+
+    existing_indexes = {idx['name'] for idx in inspector.get_indexes(table_name)}
+    with db.engine.begin() as conn:
+        for index_name, columns in expected_indexes.items():
+            if index_name in existing_indexes:
+                continue
+            conn.execute(text(f'CREATE INDEX {index_name} ON {table_name} ({", ".join(columns)})'))
+            logger.info('Índice criado: %s.%s', table_name, index_name)
+
+
 
 # Exporta o app para o Gunicorn
 app = create_app()
@@ -13,6 +13,8 @@ class Empresa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(150), nullable=False, unique=True)
     cnpj = db.Column(db.String(18), unique=True)
+    # Incrementada a cada commit que altera os dados financeiros (ETag das telas)
+    versao_dados = db.Column(db.Integer, nullable=False, default=0)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -176,6 +178,8 @@ class Lancamento(db.Model):
     data_evento = db.Column(db.Date, nullable=False, index=True)
     data_vencimento = db.Column(db.Date, nullable=False, index=True)
     data_pagamento = db.Column(db.Date, index=True)  # Nulo se não pago
+    # Data de referência das listagens: pagamento ou, se em aberto, vencimento (gerada pelo banco)
+    data_referencia = db.Column(db.Date, db.Computed('COALESCE(data_pagamento, data_vencimento)', persisted=True))
     
     # Status
     status = db.Column(db.String(20), nullable=False, default='aberto')  # aberto, pago, vencido
@@ -199,6 +203,14 @@ class Lancamento(db.Model):
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('idx_lancamento_empresa_bucket', 'empresa_id', 'fluxo_conta_id', 'conta_banco_id'),
+        # Paginação por cursor (data, id) das listas do fluxo de caixa
+        db.Index('idx_lancamento_empresa_pagamento', 'empresa_id', 'data_pagamento', 'id'),
+        db.Index('idx_lancamento_empresa_vencimento', 'empresa_id', 'data_vencimento', 'id'),
+        db.Index('idx_lancamento_empresa_referencia', 'empresa_id', 'data_referencia'),
+    )
+    
     def __repr__(self):
         return f'<Lancamento {self.numero_documento} - R$ {self.valor_real}>'
 
@@ -230,6 +242,10 @@ class FluxoCaixaRealizado(db.Model):
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('idx_fcr_empresa_bucket', 'empresa_id', 'fluxo_conta_id', 'conta_banco_id'),
+    )
+    
     def __repr__(self):
         return f'<FluxoCaixaRealizado {self.data}>'
 
@@ -261,10 +277,99 @@ class FluxoCaixaPrevisto(db.Model):
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
     atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('idx_fcp_empresa_bucket', 'empresa_id', 'fluxo_conta_id', 'conta_banco_id'),
+    )
+    
     def __repr__(self):
         return f'<FluxoCaixaPrevisto {self.data}>'
 
 
+class FluxoCaixaDiario(db.Model):
+    """Daily Cash Flow - Fluxo de Caixa Diário por conta bancária e conta de fluxo"""
+    __tablename__ = 'fluxo_caixa_diario'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresas.id'), nullable=False, index=True)
+    data = db.Column(db.Date, nullable=False)
+    conta_banco_id = db.Column(db.Integer, db.ForeignKey('contas_banco.id'), nullable=False)
+    fluxo_conta_id = db.Column(db.Integer, db.ForeignKey('fluxo_contas_modelo.id'), nullable=False)
+    
+    # Realizado: lançamentos pagos, pela data de pagamento (valor_pago)
+    valor_pago = db.Column(db.Numeric(15, 2), default=0.00)
+    valor_recebido = db.Column(db.Numeric(15, 2), default=0.00)
+    # Previsto: todos os lançamentos, pela data de vencimento (valor_real)
+    valor_previsto_pago = db.Column(db.Numeric(15, 2), default=0.00)
+    valor_previsto_recebido = db.Column(db.Numeric(15, 2), default=0.00)
+    
+    # Saldos acumulados (recebido - pago) do par conta bancária/conta de fluxo até o dia
+    saldo_realizado = db.Column(db.Numeric(15, 2), default=0.00)
+    saldo_previsto = db.Column(db.Numeric(15, 2), default=0.00)
+    
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('empresa_id', 'conta_banco_id', 'fluxo_conta_id', 'data', name='uq_fluxo_diario_bucket_data'),
+        db.Index('idx_fluxo_diario_empresa_data', 'empresa_id', 'data'),
+    )
+    
+    def __repr__(self):
+        return f'<FluxoCaixaDiario {self.data}>'
+
+
+class SaldoMensalConta(db.Model):
+    """Monthly closing balance - Saldo de fechamento mensal por conta bancária"""
+    __tablename__ = 'saldos_mensais_conta'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresas.id'), nullable=False, index=True)
+    conta_banco_id = db.Column(db.Integer, db.ForeignKey('contas_banco.id'), nullable=False)
+    mes = db.Column(db.Date, nullable=False)  # Primeiro dia do mês
+    
+    # Movimento acumulado (recebido - pago) até o fim do mês, sem o saldo inicial da conta
+    saldo_realizado = db.Column(db.Numeric(15, 2), default=0.00)
+    saldo_previsto = db.Column(db.Numeric(15, 2), default=0.00)
+    
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('empresa_id', 'conta_banco_id', 'mes', name='uq_saldo_mensal_conta_mes'),
+    )
+    
+    def __repr__(self):
+        return f'<SaldoMensalConta conta={self.conta_banco_id} {self.mes}>'
+
+
+class FilaConsolidacao(db.Model):
+    """Consolidation queue - Fila de consolidação do fluxo de caixa (uma linha por empresa)"""
+    __tablename__ = 'fila_consolidacao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresas.id'), nullable=False, unique=True, index=True)
+    empresa = db.relationship('Empresa', backref=db.backref('fila_consolidacao', uselist=False))
+    
+    # Solicitação pendente (nulo quando não há nada a consolidar)
+    pendente_desde = db.Column(db.DateTime, index=True)  # Primeira solicitação ainda não atendida
+    ultima_solicitacao_em = db.Column(db.DateTime)  # Última solicitação (janela de agrupamento)
+    
+    # Execução
+    iniciado_em = db.Column(db.DateTime)
+    consolidado_em = db.Column(db.DateTime)  # Consolidado reflete os lançamentos até este momento
+    reconstruido_em = db.Column(db.DateTime)  # Última reconsolidação completa (não a incremental)
+    alterado_em = db.Column(db.DateTime)  # Último commit que alterou lançamentos ou contas da empresa
+    tentativas = db.Column(db.Integer, default=0)  # Falhas seguidas; na última a empresa fica parada
+    proxima_tentativa_em = db.Column(db.DateTime)  # Espera exponencial após uma falha
+    ultimo_erro = db.Column(db.Text)
+    
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FilaConsolidacao empresa={self.empresa_id} pendente_desde={self.pendente_desde}>'
+
+
 class ParametroSistema(db.Model):
     """System Parameters - Parâmetros de Sistema"""
     __tablename__ = 'parametros_sistema'
@@ -333,3 +438,54 @@ class Comissao(db.Model):
     
     def __repr__(self):
         return f'<Comissao {self.id} - Apuração {self.id_apuracao} - R$ {self.vl_comissao}>'
+
+
+class TarefaExportacao(db.Model):
+    """Background export job - Exportação gerada pelo worker e baixada depois"""
+    __tablename__ = 'tarefas_exportacao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey('empresas.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    # Relatório e filtros (JSON com os parâmetros da tela)
+    tipo = db.Column(db.String(30), nullable=False)  # balancete, fluxo-caixa, comissoes
+    parametros = db.Column(db.Text, nullable=False, default='{}')
+    
+    # Execução
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, processando, concluida, erro, expirada
+    progresso = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    erro = db.Column(db.Text)
+    
+    # Arquivo gerado (conteúdo em partes_exportacao)
+    nome_arquivo = db.Column(db.String(200))
+    mimetype = db.Column(db.String(100))
+    
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime)
+    concluido_em = db.Column(db.DateTime)
+    expira_em = db.Column(db.DateTime, index=True)
+    
+    __table_args__ = (
+        db.Index('idx_tarefa_exportacao_empresa_status', 'empresa_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<TarefaExportacao {self.id} {self.tipo} empresa={self.empresa_id} {self.status}>'
+
+
+class ParteExportacao(db.Model):
+    """Export file chunk - Conteúdo do arquivo gerado, em blocos, visível para web e worker"""
+    __tablename__ = 'partes_exportacao'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tarefa_id = db.Column(db.Integer, db.ForeignKey('tarefas_exportacao.id'), nullable=False)
+    ordem = db.Column(db.Integer, nullable=False)
+    dados = db.Column(db.LargeBinary(length=2 ** 24 - 1), nullable=False)  # MEDIUMBLOB no MySQL
+    
+    __table_args__ = (
+        db.UniqueConstraint('tarefa_id', 'ordem', name='uq_parte_exportacao_tarefa_ordem'),
+    )
+    
+    def __repr__(self):
+        return f'<ParteExportacao tarefa={self.tarefa_id} ordem={self.ordem}>'
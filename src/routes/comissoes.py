@@ -10,6 +10,8 @@ from sqlalchemy import desc
 
 from src.models import db, Comissao, Entidade, Lancamento, ParametroSistema
 from src.services.comissoes import ServicoComissoes
+from src.services.exportacao import enviar_arquivo_temporario
+from src.services.relatorios import arquivo_comissoes
 
 comissoes_bp = Blueprint('comissoes', __name__, url_prefix='/comissoes')
 
@@ -277,74 +279,4 @@ def parametros():
 @comissoes_bp.route('/exportar-csv')
 def exportar_csv():
     """Exportar comissões para CSV"""
-    
-    from io import StringIO
-    import csv
-    
-    # Parâmetros de filtro
-    data_inicio = request.args.get('data_inicio')
-    data_fim = request.args.get('data_fim')
-    vendedor_id = request.args.get('vendedor_id', type=int)
-    cliente_id = request.args.get('cliente_id', type=int)
-    
-    try:
-        if data_inicio:
-            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-        if data_fim:
-            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
-    except ValueError:
-        data_inicio = None
-        data_fim = None
-    
-    if not data_fim:
-        data_fim = datetime.now().date()
-    if not data_inicio:
-        data_inicio = data_fim - timedelta(days=90)
-    
-    # Obter comissões
-    resumo_vendedores = ServicoComissoes.obter_resumo_por_vendedor(
-        current_user.empresa_id,
-        data_inicio,
-        data_fim,
-        vendedor_id,
-        cliente_id
-    )
-    
-    # Criar CSV
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';')
-    
-    # Cabeçalho
-    writer.writerow([
-        'Vendedor',
-        'Quantidade de Lançamentos',
-        'Total de Notas',
-        'Total de Repasse',
-        'Total Líquido',
-        'Total de Comissões'
-    ])
-    
-    # Dados
-    for resumo in resumo_vendedores:
-        writer.writerow([
-            resumo['vendedor'].nome,
-            resumo['quantidade_lancamentos'],
-            f"{resumo['total_notas']:.2f}".replace('.', ','),
-            f"{resumo['total_repasse']:.2f}".replace('.', ','),
-            f"{resumo['total_liquido']:.2f}".replace('.', ','),
-            f"{resumo['total_comissao']:.2f}".replace('.', ',')
-        ])
-    
-    # Retornar como arquivo
-    from flask import send_file
-    from io import BytesIO
-    
-    csv_bytes = BytesIO(output.getvalue().encode('utf-8-sig'))
-    csv_bytes.seek(0)
-    
-    return send_file(
-        csv_bytes,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"comissoes_{data_inicio}_{data_fim}.csv"
-    )
+    return enviar_arquivo_temporario(*arquivo_comissoes(current_user.empresa_id, request.args))
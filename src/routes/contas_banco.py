@@ -3,6 +3,7 @@ from flask_login import login_required
 from flask_login import current_user
 from src.models import db, ContaBanco, FluxoContaModel
 from src.tenant import scoped_query, scoped_get_or_404, tenant_id
+from src.services.versao_dados import condicional_por_versao
 
 contas_banco_bp = Blueprint('contas_banco', __name__, url_prefix='/contas-banco')
 
@@ -142,6 +143,7 @@ def deletar(id):
 
 @contas_banco_bp.route('/api/search')
 @login_required
+@condicional_por_versao
 def api_search():
     """API for bank accounts search"""
     termo = request.args.get('q', '')
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from src.models import db, Entidade
 from datetime import datetime
 from src.tenant import scoped_query, scoped_get_or_404, tenant_id
+from src.services.versao_dados import condicional_por_versao
 
 entidades_bp = Blueprint('entidades', __name__, url_prefix='/entidades')
 
@@ -213,6 +214,7 @@ def deletar(id):
 
 @entidades_bp.route('/api/search')
 @login_required
+@condicional_por_versao
 def api_search():
     """API for entity search - used in select fields"""
     termo = request.args.get('q', '')
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from src.models import db, FluxoContaModel
 from src.tenant import scoped_query, scoped_get_or_404, tenant_id
+from src.services.versao_dados import condicional_por_versao
 
 fluxo_bp = Blueprint('fluxo', __name__, url_prefix='/fluxo')
 
@@ -160,6 +161,7 @@ def deletar(id):
 
 @fluxo_bp.route('/api/search')
 @login_required
+@condicional_por_versao
 def api_search():
     """API for chart of accounts search"""
     termo = request.args.get('q', '')
@@ -1,8 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_login import login_required, current_user
+from flask_login import login_required
 from src.models import db, Lancamento, Entidade, FluxoContaModel, ContaBanco
 from datetime import datetime, date
-from src.services.fluxo_consolidado import consolidar_fluxo_caixa
 from src.tenant import scoped_query, scoped_get_or_404, tenant_id
 
 lancamentos_bp = Blueprint('lancamentos', __name__, url_prefix='/lancamentos')
@@ -71,7 +70,6 @@ def criar():
             
             db.session.add(lancamento)
             db.session.commit()
-            consolidar_fluxo_caixa(current_user.empresa_id)
             
             flash(f'Lançamento {lancamento.numero_documento} criado com sucesso', 'success')
             return redirect(url_for('lancamentos.index'))
@@ -124,7 +122,6 @@ def editar(id):
                 lancamento.status = 'aberto'
             
             db.session.commit()
-            consolidar_fluxo_caixa(current_user.empresa_id)
             
             flash(f'Lançamento {lancamento.numero_documento} atualizado com sucesso', 'success')
             return redirect(url_for('lancamentos.index'))
@@ -157,7 +154,6 @@ def pagar(id):
         lancamento.status = 'pago'
         
         db.session.commit()
-        consolidar_fluxo_caixa(current_user.empresa_id)
         
         flash(f'Lançamento {lancamento.numero_documento} marcado como pago', 'success')
     except Exception as e:
@@ -178,9 +174,6 @@ def deletar(id):
     try:
         db.session.delete(lancamento)
         db.session.commit()
-        # Recalcula o consolidado para remover reflexos do lançamento excluído
-        from src.services.fluxo_consolidado import consolidar_fluxo_caixa
-        consolidar_fluxo_caixa(current_user.empresa_id)
         flash(f'Lançamento deletado com sucesso', 'success')
     except Exception as e:
         import logging, traceback
@@ -0,0 +1,58 @@
+"""
+Cache de resultados dos relatórios
+
+Chave: (empresa, relatório, filtros normalizados, versão dos dados da
+empresa). Como `empresas.versao_dados` muda no commit que altera os dados,
+as entradas antigas ficam inalcançáveis em todos os processos sem
+invalidação explícita e saem pelo LRU/TTL. A tela e a exportação com os
+mesmos filtros compartilham a entrada.
+
+Backends (RELATORIOS_CACHE), como no dashboard:
+  memoria   - LRU no processo
+  sqlite    - arquivo SQLite local compartilhado entre os workers do gunicorn
+  desligado - sem cache
+"""
+
+from flask import current_app
+
+from src.services.dashboard_cache import criar_cache
+from src.services.versao_dados import versao_dados
+
+
+def obter_cache_relatorios():
+    """Return the application's report cache backend (None when disabled)."""
+    extensoes = current_app.extensions
+    if 'relatorios_cache' not in extensoes:
+        extensoes['relatorios_cache'] = criar_cache(current_app.config, 'RELATORIOS_CACHE')
+    return extensoes['relatorios_cache']
+
+
+def normalizar_filtros(filtros):
+    """Hashable form of the filters: sorted, stringified, empty values dropped."""
+    return tuple(sorted(
+        (chave, str(valor).strip()) for chave, valor in filtros.items() if valor not in (None, '')
+    ))
+
+
+def em_cache_relatorio(empresa_id, relatorio, filtros, calcular):
+    """Return the cached result of `relatorio` for these filters, computing it on a miss.
+
+    `filtros` must already have the defaults resolved (e.g. the current month
+    when no period was given), so equivalent requests share one entry.
+    """
+    cache = obter_cache_relatorios()
+    if cache is None:
+        return calcular()
+    chave = (empresa_id, relatorio, normalizar_filtros(filtros), versao_dados(empresa_id))
+    valor = cache.obter(chave)
+    if valor is None:
+        valor = calcular()
+        cache.gravar(chave, valor)
+    return valor
+
+
+def estatisticas_cache_relatorios():
+    cache = obter_cache_relatorios()
+    if cache is None:
+        return {'backend': 'desligado', 'itens': 0, 'hits': 0, 'misses': 0}
+    return cache.estatisticas()
@@ -0,0 +1,52 @@
+"""
+Empresas alteradas na transação - coleta única para os eventos da sessão
+
+Consolidação, versão dos dados e cache do dashboard precisam saber quais
+empresas tiveram registros criados, alterados ou excluídos na transação. Um
+único before_flush percorre a sessão e anota em `session.info[chave]`, para
+cada consumidor registrado com `registrar_coleta`, as empresas dos modelos que
+ele acompanha. Cada consumidor retira o seu conjunto com `empresas_coletadas`
+quando o usa; um rollback descarta todos.
+"""
+
+from itertools import chain
+
+from sqlalchemy import event
+
+from src.models import db
+
+# Chave em session.info -> modelos acompanhados
+_COLETAS = {}
+
+
+def registrar_coleta(chave, modelos):
+    """Collect under session.info[chave] the companies of `modelos` touched by each flush (idempotent)."""
+    _COLETAS[chave] = tuple(modelos)
+    for nome, funcao in (
+        ('before_flush', _coletar_empresas),
+        ('after_rollback', _descartar_empresas),
+    ):
+        if not event.contains(db.session, nome, funcao):
+            event.listen(db.session, nome, funcao)
+
+
+def empresas_coletadas(session, chave):
+    """Pop the companies collected under `chave` so far in the transaction."""
+    return session.info.pop(chave, None) or set()
+
+
+def _coletar_empresas(session, flush_context, instances):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        empresa_id = getattr(obj, 'empresa_id', None)
+        if empresa_id is None:
+            continue
+        for chave, modelos in _COLETAS.items():
+            if isinstance(obj, modelos):
+                session.info.setdefault(chave, set()).add(empresa_id)
+
+
+def _descartar_empresas(session):
+    for chave in _COLETAS:
+        session.info.pop(chave, None)
@@ -0,0 +1,145 @@
+"""
+Consolidação por unidade de trabalho - eventos da sessão SQLAlchemy
+
+Os lançamentos criados, alterados ou excluídos durante uma transação são
+coletados a cada flush (com o estado anterior à transação). No commit, cada
+empresa afetada recebe uma única atualização do consolidado, gravada na mesma
+transação dos lançamentos; as rotas não chamam mais o consolidador.
+
+Alterar o saldo inicial de uma conta bancária ou o tipo (P/R) de uma conta de
+fluxo muda as linhas de todos os lançamentos delas; nesses casos a empresa é
+reconsolidada por completo (ou enfileirada, no modo assíncrono) em vez de
+receber deltas.
+
+Todo commit que cria, altera ou exclui lançamentos, contas bancárias ou contas
+de fluxo grava `FilaConsolidacao.alterado_em`, que `consolidar_fluxo.py
+--alteradas` compara com a última reconsolidação completa.
+
+UPDATE/DELETE em massa (`query.update()`/`query.delete()`) não passam pela
+unidade de trabalho: quem os usar deve chamar `solicitar_consolidacao`.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from src.models import db, Lancamento, ContaBanco, FluxoContaModel
+from src.services.coleta_empresas import registrar_coleta, empresas_coletadas
+from src.services.fluxo_consolidado import estado_lancamento, aplicar_deltas_lancamentos, reconsolidar_empresa
+from src.services.fila_consolidacao import marcar_pendente, registrar_alteracao
+
+CHAVE_INFO = 'lancamentos_alterados'
+CHAVE_RECONSOLIDAR = 'empresas_reconsolidar'
+CHAVE_ALTERADAS = 'empresas_alteradas'
+
+# Colunas de cadastro que entram em todas as linhas consolidadas das contas
+COLUNAS_CADASTRO = {ContaBanco: 'saldo_inicial', FluxoContaModel: 'tipo'}
+
+COLUNAS_ESTADO = (
+    'empresa_id', 'fluxo_conta_id', 'conta_banco_id', 'status', 'valor_pago', 'valor_real',
+    'data_evento', 'data_vencimento', 'data_pagamento',
+)
+
+
+def registrar_eventos_consolidacao():
+    """Attach the consolidation hooks to the application session (idempotent)."""
+    registrar_coleta(CHAVE_ALTERADAS, (Lancamento, ContaBanco, FluxoContaModel))
+    for nome, funcao in (
+        ('before_flush', _coletar_alteracoes),
+        ('before_commit', _consolidar_alteracoes),
+        ('after_rollback', _descartar_alteracoes),
+    ):
+        if not event.contains(db.session, nome, funcao):
+            event.listen(db.session, nome, funcao)
+
+
+def _estado_gravado(lancamento):
+    """Snapshot of the values the lancamento had before the pending changes."""
+    estado = inspect(lancamento)
+    valores = {}
+    sem_historico = []
+    for coluna in COLUNAS_ESTADO:
+        historico = estado.attrs[coluna].history
+        if historico.deleted:
+            valores[coluna] = historico.deleted[0]
+        elif historico.unchanged:
+            valores[coluna] = historico.unchanged[0]
+        elif historico.added:
+            # Valor anterior None ou atributo expirado (ex.: após um commit)
+            # alterado sem ser lido: o valor gravado vem do banco
+            sem_historico.append(coluna)
+        else:
+            valores[coluna] = getattr(lancamento, coluna)
+    if sem_historico:
+        with estado.session.no_autoflush:
+            gravado = estado.session.query(
+                *[getattr(Lancamento, coluna) for coluna in sem_historico]
+            ).filter(Lancamento.id == lancamento.id).one()
+        valores.update(zip(sem_historico, gravado))
+    return estado_lancamento(SimpleNamespace(**valores))
+
+
+def _coletar_alteracoes(session, flush_context, instances):
+    alterados = None
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, (Lancamento, ContaBanco, FluxoContaModel)):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        coluna = COLUNAS_CADASTRO.get(type(obj))
+        if coluna is not None:
+            if obj in session.dirty and obj.empresa_id is not None and inspect(obj).attrs[coluna].history.has_changes():
+                session.info.setdefault(CHAVE_RECONSOLIDAR, set()).add(obj.empresa_id)
+            continue
+        if alterados is None:
+            alterados = session.info.setdefault(CHAVE_INFO, {})
+        # Guarda só o primeiro estado visto: o anterior à transação
+        if obj not in alterados:
+            alterados[obj] = None if obj in session.new else _estado_gravado(obj)
+
+
+def _consolidar_alteracoes(session):
+    # O commit só faz o flush depois deste evento: antecipa para coletar as
+    # alterações ainda não gravadas e para que os buckets leiam o estado novo
+    session.flush()
+    alterados = session.info.pop(CHAVE_INFO, None) or {}
+    reconsolidar = session.info.pop(CHAVE_RECONSOLIDAR, None) or set()
+    empresas = empresas_coletadas(session, CHAVE_ALTERADAS)
+    if not alterados and not reconsolidar and not empresas:
+        return
+
+    # Antes da reconsolidação abaixo, que registra um momento posterior
+    agora = datetime.utcnow()
+    for empresa_id in empresas:
+        registrar_alteracao(empresa_id, agora)
+
+    deltas_por_empresa = defaultdict(list)
+    for lancamento, antes in alterados.items():
+        depois = None if inspect(lancamento).was_deleted else estado_lancamento(lancamento)
+        if antes is None and depois is None:
+            continue  # Criado e excluído na mesma transação
+        deltas_por_empresa[(depois or antes)['empresa_id']].append((antes, depois))
+
+    assincrona = current_app.config.get('CONSOLIDACAO_ASSINCRONA')
+    for empresa_id in reconsolidar:
+        # A reconstrução lê o estado já gravado, inclusive os lançamentos desta transação
+        if assincrona:
+            marcar_pendente(empresa_id)
+        else:
+            reconsolidar_empresa(empresa_id)
+    for empresa_id, deltas in deltas_por_empresa.items():
+        if empresa_id in reconsolidar:
+            continue
+        if assincrona:
+            marcar_pendente(empresa_id)
+        else:
+            aplicar_deltas_lancamentos(empresa_id, deltas)
+
+
+def _descartar_alteracoes(session):
+    session.info.pop(CHAVE_INFO, None)
+    session.info.pop(CHAVE_RECONSOLIDAR, None)
@@ -0,0 +1,219 @@
+"""
+Indicadores do dashboard - todos os KPIs em uma única consulta
+
+Contagens e somas por tipo/status/data são feitas com agregação condicional
+(SUM CASE) sobre lancamentos; os totais das demais tabelas entram como
+subconsultas escalares no mesmo SELECT. Em um MySQL remoto isso troca cerca de
+uma dezena de round trips por um.
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, case, and_, select
+
+from src.models import db, Lancamento, FluxoContaModel, Entidade, ContaBanco, FluxoCaixaPrevisto, FluxoCaixaRealizado
+from src.services.dashboard_cache import em_cache
+from src.services.fluxo_diario import serie_diaria
+
+# Agrupamento padrão do gráfico pelo tamanho da janela (dias)
+LIMITE_PONTOS_DIARIOS = (('dia', 62), ('semana', 180))
+
+FORMATO_ROTULO = {'dia': '%d/%m', 'semana': '%d/%m', 'mes': '%m/%Y'}
+
+
+def _decimal(valor):
+    return Decimal(str(valor or 0))
+
+
+def indicadores_dashboard(empresa_id, hoje, periodo_grafico):
+    """Return the dashboard KPIs of the company as a dict (one round trip).
+
+    `periodo_grafico` (days) bounds the forecast window starting today.
+    """
+    despesa = FluxoContaModel.tipo == 'P'
+    receita = FluxoContaModel.tipo == 'R'
+    vencido_em_aberto = and_(Lancamento.status == 'aberto', Lancamento.data_vencimento <= hoje)
+    vence_hoje = Lancamento.data_vencimento == hoje
+    valor_pago = func.coalesce(Lancamento.valor_pago, 0)
+    previsto_fim = hoje + timedelta(days=periodo_grafico - 1)
+    mes_inicio = hoje.replace(day=1)
+
+    def escalar(coluna, *filtros):
+        return select(coluna).where(*filtros).scalar_subquery()
+
+    previsto_periodo = (
+        FluxoCaixaPrevisto.empresa_id == empresa_id,
+        FluxoCaixaPrevisto.data >= hoje,
+        FluxoCaixaPrevisto.data <= previsto_fim,
+    )
+    realizado_mes = (
+        FluxoCaixaRealizado.empresa_id == empresa_id,
+        FluxoCaixaRealizado.data >= mes_inicio,
+        FluxoCaixaRealizado.data <= hoje,
+    )
+    contas_ativas = (ContaBanco.empresa_id == empresa_id, ContaBanco.ativo.is_(True))
+
+    row = db.session.query(
+        func.sum(case((and_(despesa, vencido_em_aberto), 1), else_=0)).label('contas_pagar_aberto'),
+        func.sum(case((and_(receita, vencido_em_aberto), 1), else_=0)).label('contas_receber_aberto'),
+        func.sum(case((and_(despesa, vence_hoje), Lancamento.valor_real), else_=0)).label('pagar_previsto_hoje'),
+        func.sum(case((and_(receita, vence_hoje), Lancamento.valor_real), else_=0)).label('receber_previsto_hoje'),
+        # Movimento realizado com sinal: pagamentos subtraem, recebimentos somam
+        func.sum(case(
+            (and_(Lancamento.status == 'pago', despesa), -valor_pago),
+            (Lancamento.status == 'pago', valor_pago),
+            else_=0
+        )).label('movimento_pago'),
+        escalar(func.count(Entidade.id), Entidade.empresa_id == empresa_id, Entidade.ativo.is_(True)).label('total_entidades'),
+        escalar(func.count(ContaBanco.id), *contas_ativas).label('total_contas_banco'),
+        escalar(func.sum(ContaBanco.saldo_inicial), *contas_ativas).label('saldo_inicial_contas'),
+        escalar(func.sum(FluxoCaixaPrevisto.valor_previsto_recebido), *previsto_periodo).label('previsto_a_receber'),
+        escalar(func.sum(FluxoCaixaPrevisto.valor_previsto_pago), *previsto_periodo).label('previsto_a_pagar'),
+        escalar(func.sum(FluxoCaixaRealizado.valor_pago), *realizado_mes).label('total_pago_mes'),
+        escalar(func.sum(FluxoCaixaRealizado.valor_recebido), *realizado_mes).label('total_recebido_mes'),
+    ).select_from(Lancamento).join(
+        FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+    ).filter(Lancamento.empresa_id == empresa_id).one()
+
+    return {
+        'contas_pagar_aberto': int(row.contas_pagar_aberto or 0),
+        'contas_receber_aberto': int(row.contas_receber_aberto or 0),
+        'total_entidades': int(row.total_entidades or 0),
+        'total_contas_banco': int(row.total_contas_banco or 0),
+        'saldo_inicial_contas': _decimal(row.saldo_inicial_contas),
+        'pagar_previsto_hoje': _decimal(row.pagar_previsto_hoje),
+        'receber_previsto_hoje': _decimal(row.receber_previsto_hoje),
+        'movimento_pago': _decimal(row.movimento_pago),
+        'previsto_a_receber': _decimal(row.previsto_a_receber),
+        'previsto_a_pagar': _decimal(row.previsto_a_pagar),
+        'total_pago_mes': _decimal(row.total_pago_mes),
+        'total_recebido_mes': _decimal(row.total_recebido_mes),
+    }
+
+
+def _agrupamento_padrao(periodo_grafico):
+    for agrupamento, limite in LIMITE_PONTOS_DIARIOS:
+        if periodo_grafico <= limite:
+            return agrupamento
+    return 'mes'
+
+
+def _chave_ponto(dia, agrupamento, grafico_inicio):
+    if agrupamento == 'semana':
+        return grafico_inicio + timedelta(days=(dia - grafico_inicio).days // 7 * 7)
+    if agrupamento == 'mes':
+        return dia.replace(day=1)
+    return dia
+
+
+def series_grafico(empresa_id, hoje, periodo_grafico, agrupamento=None):
+    """Return the chart labels and the previsto/realizado series of the last `periodo_grafico` days.
+
+    The series come from `fluxo_caixa_diario`; `agrupamento` ('dia', 'semana'
+    or 'mes', by default chosen from the window length) downsamples them.
+    """
+    agrupamento = agrupamento or _agrupamento_padrao(periodo_grafico)
+    grafico_inicio = hoje - timedelta(days=periodo_grafico - 1)
+    por_dia = serie_diaria(empresa_id, grafico_inicio, hoje)
+
+    pontos = OrderedDict()
+    for i in range(periodo_grafico):
+        dia = grafico_inicio + timedelta(days=i)
+        previsto, realizado = por_dia.get(dia, (0, 0))
+        ponto = pontos.setdefault(_chave_ponto(dia, agrupamento, grafico_inicio), [0, 0])
+        ponto[0] += previsto
+        ponto[1] += realizado
+
+    formato = FORMATO_ROTULO[agrupamento]
+    return {
+        'agrupamento': agrupamento,
+        'grafico_labels': [inicio.strftime(formato) for inicio in pontos],
+        'grafico_previsto': [float(previsto) for previsto, _ in pontos.values()],
+        'grafico_realizado': [float(realizado) for _, realizado in pontos.values()],
+    }
+
+
+def _indicadores_em_cache(empresa_id, hoje, periodo_grafico):
+    def calcular():
+        indicadores = indicadores_dashboard(empresa_id, hoje, periodo_grafico)
+        saldo_total = indicadores.pop('saldo_inicial_contas') + indicadores.pop('movimento_pago')
+        pagar_previsto_hoje = indicadores['pagar_previsto_hoje']
+        receber_previsto_hoje = indicadores['receber_previsto_hoje']
+        return dict(
+            indicadores,
+            saldo_total=saldo_total,
+            disponibilidade_hoje=saldo_total + receber_previsto_hoje - pagar_previsto_hoje,
+            necessidade_hoje=max(Decimal('0.00'), pagar_previsto_hoje - (saldo_total + receber_previsto_hoje)),
+        )
+
+    return em_cache(empresa_id, ('indicadores', periodo_grafico, hoje.isoformat()), calcular)
+
+
+# Widgets do dashboard: cada grupo é carregado pela página em uma requisição própria
+
+def widget_kpis(empresa_id, hoje, periodo_grafico, parametros=None):
+    """Counts, forecast totals, today's need/availability and the total balance."""
+    indicadores = _indicadores_em_cache(empresa_id, hoje, periodo_grafico)
+    return {
+        campo: indicadores[campo] for campo in (
+            'contas_pagar_aberto', 'contas_receber_aberto', 'total_entidades', 'total_contas_banco',
+            'previsto_a_receber', 'previsto_a_pagar', 'pagar_previsto_hoje', 'receber_previsto_hoje',
+            'necessidade_hoje', 'disponibilidade_hoje', 'saldo_total',
+        )
+    }
+
+
+def widget_mes(empresa_id, hoje, periodo_grafico, parametros=None):
+    """Totals paid and received in the current month."""
+    indicadores = _indicadores_em_cache(empresa_id, hoje, periodo_grafico)
+    return {campo: indicadores[campo] for campo in ('total_pago_mes', 'total_recebido_mes')}
+
+
+def widget_grafico(empresa_id, hoje, periodo_grafico, parametros=None):
+    """Previsto x realizado chart series (`?agrupamento=dia|semana|mes`)."""
+    agrupamento = (parametros or {}).get('agrupamento')
+    if agrupamento not in FORMATO_ROTULO:
+        agrupamento = _agrupamento_padrao(periodo_grafico)
+    return em_cache(
+        empresa_id, ('grafico', periodo_grafico, agrupamento, hoje.isoformat()),
+        lambda: series_grafico(empresa_id, hoje, periodo_grafico, agrupamento)
+    )
+
+
+def widget_ultimos_lancamentos(empresa_id, hoje, periodo_grafico, parametros=None, limite=10):
+    """The most recent lancamentos (by event date), as plain rows."""
+    # Entidade e conta de fluxo no mesmo SELECT (sem lazy load por linha)
+    rows = db.session.query(
+        Lancamento.data_evento,
+        Lancamento.numero_documento,
+        Lancamento.valor_real,
+        Lancamento.status,
+        Entidade.nome,
+        FluxoContaModel.codigo,
+    ).outerjoin(
+        Entidade, Entidade.id == Lancamento.entidade_id
+    ).outerjoin(
+        FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+    ).filter(
+        Lancamento.empresa_id == empresa_id
+    ).order_by(Lancamento.data_evento.desc()).limit(limite).all()
+    return {
+        'lancamentos': [{
+            'data_evento': data_evento,
+            'numero_documento': numero_documento,
+            'entidade': entidade,
+            'fluxo_conta': fluxo_conta,
+            'valor_real': _decimal(valor_real),
+            'status': status,
+        } for data_evento, numero_documento, valor_real, status, entidade, fluxo_conta in rows]
+    }
+
+
+WIDGETS = {
+    'kpis': widget_kpis,
+    'mes': widget_mes,
+    'grafico': widget_grafico,
+    'ultimos-lancamentos': widget_ultimos_lancamentos,
+}
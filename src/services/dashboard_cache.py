@@ -0,0 +1,205 @@
+"""
+Cache do dashboard por empresa
+
+Os indicadores e séries do dashboard são guardados por (empresa, versão dos
+dados da empresa, dias do gráfico, data). Como `empresas.versao_dados` muda
+no commit que altera os dados, inclusive os feitos por outro worker do
+gunicorn ou pelo `worker.py`, as entradas antigas ficam inalcançáveis em
+todos os processos. O commit no próprio processo ainda remove as entradas da
+empresa (eventos da sessão SQLAlchemy), liberando o LRU antes do TTL.
+
+Backends (DASHBOARD_CACHE):
+  memoria   - LRU no processo; adequado a um único worker
+  sqlite    - arquivo SQLite local compartilhado entre os workers do gunicorn
+  desligado - sem cache
+"""
+
+from collections import OrderedDict
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from src.models import db
+from src.services.coleta_empresas import registrar_coleta, empresas_coletadas
+from src.services.versao_dados import MODELOS_VERSIONADOS, versao_dados
+
+CHAVE_INFO = 'dashboard_empresas_alteradas'
+
+
+class CacheMemoria:
+    """In-process LRU with a per-entry TTL."""
+
+    nome = 'memoria'
+
+    def __init__(self, max_itens=512, ttl=300):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.time():
+                self._itens.pop(chave, None)
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def gravar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.time() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def invalidar_empresa(self, empresa_id):
+        with self._lock:
+            for chave in [c for c in self._itens if c[0] == empresa_id]:
+                del self._itens[chave]
+
+    def estatisticas(self):
+        with self._lock:
+            return {'backend': self.nome, 'itens': len(self._itens), 'hits': self.hits, 'misses': self.misses}
+
+
+class CacheSqlite:
+    """Cache stored in a local SQLite file, shared by every worker of the host."""
+
+    nome = 'sqlite'
+
+    def __init__(self, arquivo, max_itens=512, ttl=300):
+        self.arquivo = arquivo
+        self.max_itens = max_itens
+        self.ttl = ttl
+        diretorio = os.path.dirname(arquivo)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        with self._conectar() as conexao:
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS dashboard_cache ('
+                ' chave TEXT PRIMARY KEY, empresa_id INTEGER NOT NULL,'
+                ' expira_em REAL NOT NULL, usado_em REAL NOT NULL, valor BLOB NOT NULL)'
+            )
+            conexao.execute('CREATE INDEX IF NOT EXISTS ix_dashboard_cache_empresa ON dashboard_cache (empresa_id)')
+            conexao.execute('CREATE TABLE IF NOT EXISTS dashboard_cache_contadores (nome TEXT PRIMARY KEY, total INTEGER NOT NULL)')
+            conexao.execute("INSERT OR IGNORE INTO dashboard_cache_contadores VALUES ('hits', 0), ('misses', 0)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.arquivo, timeout=5)
+
+    @staticmethod
+    def _chave(chave):
+        return repr(chave)
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._conectar() as conexao:
+            row = conexao.execute(
+                'SELECT valor FROM dashboard_cache WHERE chave = ? AND expira_em >= ?',
+                (self._chave(chave), agora)
+            ).fetchone()
+            contador = 'hits' if row else 'misses'
+            conexao.execute('UPDATE dashboard_cache_contadores SET total = total + 1 WHERE nome = ?', (contador,))
+            if row is None:
+                return None
+            conexao.execute('UPDATE dashboard_cache SET usado_em = ? WHERE chave = ?', (agora, self._chave(chave)))
+        return pickle.loads(row[0])
+
+    def gravar(self, chave, valor):
+        agora = time.time()
+        with self._conectar() as conexao:
+            conexao.execute(
+                'INSERT OR REPLACE INTO dashboard_cache VALUES (?, ?, ?, ?, ?)',
+                (self._chave(chave), chave[0], agora + self.ttl, agora, pickle.dumps(valor))
+            )
+            # Remove os expirados e, acima do limite, os menos usados
+            conexao.execute('DELETE FROM dashboard_cache WHERE expira_em < ?', (agora,))
+            conexao.execute(
+                'DELETE FROM dashboard_cache WHERE chave IN ('
+                ' SELECT chave FROM dashboard_cache ORDER BY usado_em DESC LIMIT -1 OFFSET ?)',
+                (self.max_itens,)
+            )
+
+    def invalidar_empresa(self, empresa_id):
+        with self._conectar() as conexao:
+            conexao.execute('DELETE FROM dashboard_cache WHERE empresa_id = ?', (empresa_id,))
+
+    def estatisticas(self):
+        with self._conectar() as conexao:
+            contadores = dict(conexao.execute('SELECT nome, total FROM dashboard_cache_contadores'))
+            itens = conexao.execute('SELECT COUNT(*) FROM dashboard_cache').fetchone()[0]
+        return {'backend': self.nome, 'itens': itens, 'hits': contadores['hits'], 'misses': contadores['misses']}
+
+
+def criar_cache(config, prefixo='DASHBOARD_CACHE'):
+    # prefixo: grupo de configurações (<prefixo>, <prefixo>_ARQUIVO, _MAX_ITENS, _TTL_SEGUNDOS)
+    backend = config.get(prefixo, 'memoria')
+    max_itens = config.get(f'{prefixo}_MAX_ITENS', 512)
+    ttl = config.get(f'{prefixo}_TTL_SEGUNDOS', 300)
+    if backend == 'desligado':
+        return None
+    if backend == 'sqlite':
+        return CacheSqlite(config[f'{prefixo}_ARQUIVO'], max_itens=max_itens, ttl=ttl)
+    if backend == 'memoria':
+        return CacheMemoria(max_itens=max_itens, ttl=ttl)
+    raise ValueError(f'{prefixo} inválido: {backend}')
+
+
+def obter_cache():
+    """Return the application's dashboard cache backend (None when disabled)."""
+    extensoes = current_app.extensions
+    if 'dashboard_cache' not in extensoes:
+        extensoes['dashboard_cache'] = criar_cache(current_app.config)
+    return extensoes['dashboard_cache']
+
+
+def em_cache(empresa_id, chave, calcular):
+    """Return the cached value for (empresa_id, data version, *chave), computing and storing it on a miss."""
+    cache = obter_cache()
+    if cache is None:
+        return calcular()
+    chave = (empresa_id, versao_dados(empresa_id), *chave)
+    valor = cache.obter(chave)
+    if valor is None:
+        valor = calcular()
+        cache.gravar(chave, valor)
+    return valor
+
+
+def invalidar_dashboard(empresa_id):
+    cache = obter_cache()
+    if cache is not None:
+        cache.invalidar_empresa(empresa_id)
+
+
+def estatisticas_cache():
+    cache = obter_cache()
+    if cache is None:
+        return {'backend': 'desligado', 'itens': 0, 'hits': 0, 'misses': 0}
+    return cache.estatisticas()
+
+
+def registrar_eventos_cache():
+    """Attach the invalidation hook to the application session (idempotent)."""
+    registrar_coleta(CHAVE_INFO, MODELOS_VERSIONADOS)
+    if not event.contains(db.session, 'after_commit', _invalidar_empresas):
+        event.listen(db.session, 'after_commit', _invalidar_empresas)
+
+
+def _invalidar_empresas(session):
+    empresas = empresas_coletadas(session, CHAVE_INFO)
+    if not empresas or not has_app_context():
+        return
+    for empresa_id in empresas:
+        invalidar_dashboard(empresa_id)
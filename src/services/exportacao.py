@@ -0,0 +1,115 @@
+"""
+Exportações em streaming
+
+As planilhas são geradas com o modo write-only do openpyxl: cada linha é
+serializada assim que é adicionada, sem manter a árvore de células em memória.
+O arquivo vai para um temporário em disco, enviado em blocos e apagado ao
+final da resposta.
+"""
+
+import csv
+import logging
+import os
+import tempfile
+
+from flask import send_file
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+except Exception:
+    Workbook = None
+    logging.getLogger(__name__).warning("openpyxl not available; Excel exports disabled", exc_info=True)
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MIMETYPE_CSV = 'text/csv'
+
+
+class Aba:
+    """One worksheet of a streamed export.
+
+    `linhas` may be any iterable (typically a generator over a server-side
+    cursor). `formatos` maps a 0-based column index to an Excel number format
+    and `larguras` maps a column letter to its width.
+    """
+
+    def __init__(self, titulo, cabecalho, linhas, formatos=None, larguras=None):
+        self.titulo = titulo
+        self.cabecalho = cabecalho
+        self.linhas = linhas
+        self.formatos = formatos or {}
+        self.larguras = larguras or {}
+
+
+def _gravar_aba(wb, aba):
+    ws = wb.create_sheet(aba.titulo)
+    # Em write-only as larguras precisam ser definidas antes da primeira linha
+    for coluna, largura in aba.larguras.items():
+        ws.column_dimensions[coluna].width = largura
+    if aba.cabecalho:
+        ws.append(aba.cabecalho)
+
+    for linha in aba.linhas:
+        if aba.formatos:
+            linha = list(linha)
+            for indice, formato in aba.formatos.items():
+                if indice < len(linha) and linha[indice] is not None:
+                    celula = WriteOnlyCell(ws, value=linha[indice])
+                    celula.number_format = formato
+                    linha[indice] = celula
+        ws.append(linha)
+
+
+def gerar_xlsx(abas, diretorio=None):
+    """Write the sheets to a temporary .xlsx file (in `diretorio`, if given) and return its path."""
+    wb = Workbook(write_only=True)
+    for aba in abas:
+        _gravar_aba(wb, aba)
+    arquivo = tempfile.NamedTemporaryFile(prefix='export_', suffix='.xlsx', dir=diretorio, delete=False)
+    arquivo.close()
+    try:
+        wb.save(arquivo.name)
+    except Exception:
+        os.remove(arquivo.name)
+        raise
+    return arquivo.name
+
+
+def gerar_csv(cabecalho, linhas, diretorio=None):
+    """Write a ';'-separated UTF-8 (with BOM, for Excel) .csv file and return its path."""
+    arquivo = tempfile.NamedTemporaryFile(
+        'w', prefix='export_', suffix='.csv', dir=diretorio, delete=False, encoding='utf-8-sig', newline=''
+    )
+    try:
+        with arquivo:
+            writer = csv.writer(arquivo, delimiter=';')
+            writer.writerow(cabecalho)
+            writer.writerows(linhas)
+    except Exception:
+        os.remove(arquivo.name)
+        raise
+    return arquivo.name
+
+
+def enviar_arquivo_temporario(caminho, download_name, mimetype):
+    """Send a temporary file in chunks and remove it once the response is closed."""
+    resposta = send_file(
+        caminho, as_attachment=True, download_name=download_name, mimetype=mimetype, conditional=False, etag=False
+    )
+
+    # Sem passthrough o servidor chama response.close() ao final, que fecha o
+    # arquivo e executa a remoção (com passthrough só o arquivo seria fechado)
+    resposta.direct_passthrough = False
+
+    def remover():
+        try:
+            os.remove(caminho)
+        except OSError:
+            logging.getLogger(__name__).warning('Não foi possível remover o temporário %s', caminho)
+
+    resposta.call_on_close(remover)
+    return resposta
+
+
+def resposta_xlsx(abas, download_name):
+    return enviar_arquivo_temporario(gerar_xlsx(abas), download_name, MIMETYPE_XLSX)
@@ -0,0 +1,162 @@
+"""
+Relatórios em PDF (fpdf2) para tabelas grandes
+
+Tabela de uma ou mais páginas A4 com o cabeçalho das colunas repetido em cada
+página e "Página N de M" no rodapé. O texto usa uma fonte TrueType Unicode
+(PDF_FONTE / PDF_FONTE_NEGRITO, DejaVu Sans por padrão) registrada com o
+`add_font` do fpdf2, que embute apenas os glifos usados. Sem as fontes no
+servidor, cai para a Helvetica padrão do PDF (Latin-1) com um aviso no log.
+
+O fpdf2 monta o documento em memória; o PDF é gravado em um arquivo (o
+temporário enviado em blocos, como as planilhas de `exportacao`, ou o arquivo
+da exportação em segundo plano).
+"""
+
+import logging
+import os
+import tempfile
+
+from flask import current_app
+
+try:
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+except Exception:
+    FPDF = None
+    logging.getLogger(__name__).warning("fpdf2 not available; PDF exports disabled", exc_info=True)
+
+logger = logging.getLogger(__name__)
+
+MIMETYPE_PDF = 'application/pdf'
+FONTE_PADRAO = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+FONTE_NEGRITO_PADRAO = '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+FAMILIA = 'relatorio'
+
+
+class Coluna:
+    """A table column: title, width in mm and alignment ('L', 'C' or 'R')."""
+
+    def __init__(self, titulo, largura, alinhamento='L'):
+        self.titulo = titulo
+        self.largura = largura
+        self.alinhamento = alinhamento
+
+
+class _Documento(FPDF if FPDF else object):
+    ALTURA_LINHA = 6
+    ALTURA_CABECALHO = 7
+
+    def __init__(self, colunas):
+        super().__init__('P', 'mm', 'A4')
+        self.colunas = colunas
+        self.repetir_cabecalho = False
+        self.set_margins(10, 10, 10)
+        self.set_auto_page_break(True, 15)
+        self.alias_nb_pages()
+        self.unicode = _registrar_fontes(self)
+        self.set_draw_color(160, 160, 160)
+
+    def fonte(self, negrito=False, tamanho=9):
+        familia = FAMILIA if self.unicode else 'helvetica'
+        self.set_font(familia, 'B' if negrito else '', tamanho)
+
+    def texto(self, valor):
+        texto = '' if valor is None else str(valor)
+        if not self.unicode:
+            # Helvetica padrão só tem Latin-1
+            texto = texto.encode('latin-1', 'replace').decode('latin-1')
+        return texto
+
+    def header(self):
+        if self.repetir_cabecalho:
+            self.cabecalho_tabela()
+
+    def footer(self):
+        self.set_y(-12)
+        self.fonte(tamanho=7)
+        self.set_text_color(110, 110, 110)
+        self._celula(0, 5, f'Página {self.page_no()} de {{nb}}', align='R')
+        self.set_text_color(0, 0, 0)
+
+    def cabecalho_tabela(self):
+        self.fonte(negrito=True)
+        self.set_fill_color(230, 230, 230)
+        for coluna in self.colunas:
+            self._celula(coluna.largura, self.ALTURA_CABECALHO, self.texto(coluna.titulo), border=1,
+                         align=coluna.alinhamento, fill=True)
+        self.ln()
+        self.fonte()
+
+    def linha(self, valores, negrito=False):
+        if negrito:
+            self.fonte(negrito=True)
+        for coluna, valor in zip(self.colunas, valores):
+            self._celula(coluna.largura, self.ALTURA_LINHA, self._caber(self.texto(valor), coluna.largura),
+                         border=1, align=coluna.alinhamento)
+        self.ln()
+        if negrito:
+            self.fonte()
+
+    def _celula(self, largura, altura, texto, **opcoes):
+        # Célula seguinte à direita, na mesma linha
+        self.cell(largura, altura, texto, new_x=XPos.RIGHT, new_y=YPos.TOP, **opcoes)
+
+    def _caber(self, texto, largura):
+        # Corta o texto que passaria da coluna (o cell do fpdf não recorta)
+        limite = largura - 2 * self.c_margin
+        if self.get_string_width(texto) <= limite:
+            return texto
+        while texto and self.get_string_width(texto + '...') > limite:
+            texto = texto[:-1]
+        return texto + '...'
+
+
+def _registrar_fontes(pdf):
+    """Register the Unicode fonts on `pdf`. False (Helvetica fallback) if a font file is missing."""
+    fontes = (
+        ('', current_app.config.get('PDF_FONTE', FONTE_PADRAO)),
+        ('B', current_app.config.get('PDF_FONTE_NEGRITO', FONTE_NEGRITO_PADRAO)),
+    )
+    ausentes = [caminho for _, caminho in fontes if not caminho or not os.path.exists(caminho)]
+    if ausentes:
+        logger.warning(
+            'Fontes do PDF não encontradas (%s); usando Helvetica (Latin-1), caracteres fora dela saem como "?". '
+            'Instale fonts-dejavu-core ou ajuste PDF_FONTE/PDF_FONTE_NEGRITO.',
+            ', '.join(str(caminho) for caminho in ausentes)
+        )
+        return False
+
+    for estilo, caminho in fontes:
+        pdf.add_font(FAMILIA, estilo, caminho)
+    return True
+
+
+def gerar_pdf(cabecalho, colunas, linhas, total=None, diretorio=None):
+    """Write a table report to a temporary .pdf file (in `diretorio`, if given) and return its path.
+
+    `cabecalho` holds the lines printed above the table on the first page,
+    `linhas` is any iterable of row values (one per column) and `total`, when
+    given, is a bold closing row.
+    """
+    pdf = _Documento(colunas)
+    pdf.add_page()
+    pdf.fonte(negrito=True, tamanho=11)
+    for texto in cabecalho:
+        pdf.cell(0, 6, pdf.texto(texto), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(3)
+
+    pdf.cabecalho_tabela()
+    pdf.repetir_cabecalho = True
+    for valores in linhas:
+        pdf.linha(valores)
+    if total is not None:
+        pdf.linha(total, negrito=True)
+
+    arquivo = tempfile.NamedTemporaryFile(prefix='export_', suffix='.pdf', dir=diretorio, delete=False)
+    arquivo.close()
+    try:
+        pdf.output(arquivo.name)
+    except Exception:
+        os.remove(arquivo.name)
+        raise
+    return arquivo.name
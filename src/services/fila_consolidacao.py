@@ -0,0 +1,165 @@
+"""
+Fila de consolidação do fluxo de caixa - execução fora da requisição HTTP
+
+Com CONSOLIDACAO_ASSINCRONA, o commit dos lançamentos apenas registra que a
+empresa precisa ser reconsolidada (ver consolidacao_eventos). O worker
+(`python worker.py`) processa a fila e agrupa as solicitações: várias edições
+da mesma empresa dentro da janela configurada resultam em uma única execução.
+
+Uma empresa cuja consolidação falha volta à fila com espera exponencial
+(CONSOLIDACAO_RETENTATIVA_SEGUNDOS, dobrando a cada falha) e, após
+CONSOLIDACAO_MAX_TENTATIVAS falhas seguidas, fica parada até uma
+reconsolidação completa (`python consolidar_fluxo.py --empresa ID`).
+"""
+
+from datetime import datetime, timedelta
+import logging
+
+from flask import current_app
+from sqlalchemy import update
+
+from src.models import db, FilaConsolidacao
+from src.services.fluxo_consolidado import consolidar_fluxo_caixa
+
+logger = logging.getLogger(__name__)
+
+
+def solicitar_consolidacao(empresa_id):
+    """Mark the company as pending consolidation (coalesces repeated calls)."""
+    marcar_pendente(empresa_id)
+    db.session.commit()
+
+
+def marcar_pendente(empresa_id):
+    """Queue the company for the worker within the current transaction. Does not commit."""
+    agora = datetime.utcnow()
+    fila = FilaConsolidacao.query.filter_by(empresa_id=empresa_id).with_for_update().first()
+    if fila is None:
+        fila = FilaConsolidacao(empresa_id=empresa_id)
+        db.session.add(fila)
+    if fila.pendente_desde is None:
+        fila.pendente_desde = agora
+    fila.ultima_solicitacao_em = agora
+
+
+def processar_pendentes(janela=None, espera_maxima=None):
+    """Consolidate every company whose queued requests are ready.
+
+    A company is ready once no new request arrived during `janela` seconds,
+    or once it has been waiting for `espera_maxima` seconds (so a tenant that
+    never stops editing is still consolidated). Companies backing off after a
+    failure, or parked after too many, are skipped. Returns the processed ids.
+    """
+    if janela is None:
+        janela = current_app.config.get('CONSOLIDACAO_JANELA_SEGUNDOS', 5)
+    if espera_maxima is None:
+        espera_maxima = current_app.config.get('CONSOLIDACAO_ESPERA_MAXIMA_SEGUNDOS', 60)
+
+    max_tentativas = current_app.config.get('CONSOLIDACAO_MAX_TENTATIVAS', 8)
+
+    agora = datetime.utcnow()
+    prontas = FilaConsolidacao.query.filter(
+        FilaConsolidacao.pendente_desde.isnot(None),
+        (FilaConsolidacao.ultima_solicitacao_em <= agora - timedelta(seconds=janela)) |
+        (FilaConsolidacao.pendente_desde <= agora - timedelta(seconds=espera_maxima)),
+        FilaConsolidacao.proxima_tentativa_em.is_(None) | (FilaConsolidacao.proxima_tentativa_em <= agora),
+        db.func.coalesce(FilaConsolidacao.tentativas, 0) < max_tentativas
+    ).order_by(FilaConsolidacao.pendente_desde.asc()).all()
+    candidatas = [(f.id, f.empresa_id, f.ultima_solicitacao_em) for f in prontas]
+    db.session.commit()
+
+    processadas = []
+    for fila_id, empresa_id, ultima_solicitacao_em in candidatas:
+        if not _reservar(fila_id, ultima_solicitacao_em):
+            continue
+        try:
+            consolidar_fluxo_caixa(empresa_id)
+        except Exception as exc:
+            db.session.rollback()
+            logger.exception('Erro ao consolidar empresa %s: %s', empresa_id, exc)
+            _registrar_falha(fila_id, empresa_id, exc, max_tentativas)
+            continue
+        fila = db.session.get(FilaConsolidacao, fila_id)
+        fila.tentativas = 0
+        fila.proxima_tentativa_em = None
+        fila.ultimo_erro = None
+        db.session.commit()
+        processadas.append(empresa_id)
+    return processadas
+
+
+def _registrar_falha(fila_id, empresa_id, exc, max_tentativas):
+    """Put a failed company back in the queue with exponential backoff, or park it."""
+    agora = datetime.utcnow()
+    fila = db.session.get(FilaConsolidacao, fila_id)
+    fila.pendente_desde = fila.pendente_desde or agora
+    fila.tentativas = (fila.tentativas or 0) + 1
+    fila.ultimo_erro = str(exc)
+    if fila.tentativas >= max_tentativas:
+        # Parada: continua pendente (e em empresas_alteradas) até a reconsolidação completa
+        fila.proxima_tentativa_em = None
+        logger.error(
+            'Consolidação da empresa %s parada após %s falhas seguidas; '
+            'corrija e execute python consolidar_fluxo.py --empresa %s', empresa_id, fila.tentativas, empresa_id
+        )
+    else:
+        espera = current_app.config.get('CONSOLIDACAO_RETENTATIVA_SEGUNDOS', 30) * 2 ** (fila.tentativas - 1)
+        fila.proxima_tentativa_em = agora + timedelta(seconds=espera)
+    db.session.commit()
+
+
+def _reservar(fila_id, ultima_solicitacao_em):
+    """Claim a queue row; fails if another worker took it or a new request arrived."""
+    resultado = db.session.execute(
+        update(FilaConsolidacao)
+        .where(
+            FilaConsolidacao.id == fila_id,
+            FilaConsolidacao.pendente_desde.isnot(None),
+            FilaConsolidacao.ultima_solicitacao_em == ultima_solicitacao_em
+        )
+        .values(pendente_desde=None, iniciado_em=datetime.utcnow())
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def status_consolidacao(empresa_id):
+    """Return {'consolidado_em', 'pendente'} for the UI, or None if never consolidated."""
+    fila = FilaConsolidacao.query.filter_by(empresa_id=empresa_id).first()
+    if fila is None or (fila.consolidado_em is None and fila.pendente_desde is None):
+        return None
+    return {
+        'consolidado_em': fila.consolidado_em,
+        'pendente': fila.pendente_desde is not None,
+    }
+
+
+def registrar_alteracao(empresa_id, momento):
+    """Record that the company's lancamentos or contas changed at `momento`. Does not commit."""
+    fila = FilaConsolidacao.query.filter_by(empresa_id=empresa_id).first()
+    if fila is None:
+        fila = FilaConsolidacao(empresa_id=empresa_id)
+        db.session.add(fila)
+    fila.alterado_em = momento
+
+
+def empresas_alteradas(empresa_ids):
+    """Filter `empresa_ids` down to companies whose data changed since their last full rebuild.
+
+    A company qualifies when it was never rebuilt, has a pending queue entry,
+    or had a lancamento, conta bancária or conta de fluxo created, updated or
+    deleted (`alterado_em`) after `reconstruido_em`. Incremental commits only
+    move `consolidado_em`, so they do not hide a change from this check.
+    """
+    filas = {
+        f.empresa_id: f
+        for f in FilaConsolidacao.query.filter(FilaConsolidacao.empresa_id.in_(empresa_ids))
+    }
+    alteradas = []
+    for empresa_id in empresa_ids:
+        fila = filas.get(empresa_id)
+        if fila is None or fila.reconstruido_em is None or fila.pendente_desde is not None:
+            alteradas.append(empresa_id)
+        elif fila.alterado_em is not None and fila.alterado_em > fila.reconstruido_em:
+            alteradas.append(empresa_id)
+    return alteradas
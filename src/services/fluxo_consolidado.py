@@ -1,100 +1,437 @@
 from decimal import Decimal
 from collections import defaultdict
-from src.models import db, Lancamento, FluxoContaModel, ContaBanco, FluxoCaixaRealizado, FluxoCaixaPrevisto, Empresa
+import logging
+import time
+from flask import current_app
+from sqlalchemy import func, insert, select, case, literal
+from src.models import db, Lancamento, FluxoContaModel, ContaBanco, FluxoCaixaRealizado, FluxoCaixaPrevisto, Empresa, FilaConsolidacao
+from src.services.fluxo_diario import reconstruir_fluxo_diario, aplicar_contribuicao_diaria, tem_fluxo_diario
+from src.services.saldo_mensal import tem_saldo_mensal
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
 
-def consolidar_fluxo_caixa(empresa_id=None):
-    """Consolidate cash flow per company.
+
+ENGINES = ('python', 'sql')
+
+# Linhas lidas por lote na consolidação em Python (yield_per)
+LOTE_LEITURA = 2000
+
+
+def consolidar_fluxo_caixa(empresa_id=None, engine=None):
+    """Consolidate cash flow per company (full rebuild).
 
     If `empresa_id` is provided, only that company's consolidated rows are
     recalculated. Otherwise the function iterates all companies present in
     `Lancamento`.
+
+    This is the repair path: it discards and rewrites every consolidated row
+    of the company. Day-to-day writes use `aplicar_deltas_lancamentos`, which
+    only touches the buckets affected by the changed lancamentos.
+
+    `engine` selects the implementation ('python' aggregates in the
+    application, 'sql' runs one INSERT ... SELECT GROUP BY per table); both
+    write identical rows. Defaults to the CONSOLIDACAO_ENGINE setting.
+
+    Returns one stats dict per company (see `_estatisticas`).
     """
+    engine = engine or current_app.config.get('CONSOLIDACAO_ENGINE', 'python')
+    if engine not in ENGINES:
+        raise ValueError(f'Engine de consolidação inválida: {engine}')
+    consolidar = _consolidar_empresa_sql if engine == 'sql' else _consolidar_empresa
+
     # Determine companies to process
     if empresa_id:
         empresa_ids = [empresa_id]
     else:
         empresa_ids = [row[0] for row in db.session.query(Lancamento.empresa_id).distinct().all()]
 
-    if not empresa_ids:
-        return
+    return [consolidar(empresa_id) for empresa_id in empresa_ids]
 
-    for empresa_id in empresa_ids:
-        # Remove previous consolidated rows only for this company
-        FluxoCaixaRealizado.query.filter_by(empresa_id=empresa_id).delete()
-        FluxoCaixaPrevisto.query.filter_by(empresa_id=empresa_id).delete()
-        db.session.commit()
 
-        # Load only active accounts/flows for this company
-        contas_fluxo = FluxoContaModel.query.filter_by(ativo=True, empresa_id=empresa_id).all()
-        contas_banco = ContaBanco.query.filter_by(ativo=True, empresa_id=empresa_id).all()
+def _consolidar_empresa(empresa_id):
+    inicio = datetime.utcnow()
+    cronometro = time.perf_counter()
 
-        saldos_realizado = defaultdict(lambda: {
-            'valor_pago': Decimal('0.00'),
-            'valor_recebido': Decimal('0.00'),
-            'datas': []
+    # Contas referenciadas pelos lançamentos da empresa: tipo e saldo inicial
+    # em uma consulta cada, em vez de um lazy load/get por lançamento/bucket.
+    contas_fluxo_ids = select(Lancamento.fluxo_conta_id).where(Lancamento.empresa_id == empresa_id).distinct()
+    tipos = dict(
+        db.session.query(FluxoContaModel.id, FluxoContaModel.tipo)
+        .filter(FluxoContaModel.id.in_(contas_fluxo_ids))
+        .all()
+    )
+    contas_banco_ids = select(Lancamento.conta_banco_id).where(Lancamento.empresa_id == empresa_id).distinct()
+    saldos_iniciais = dict(
+        db.session.query(ContaBanco.id, ContaBanco.saldo_inicial)
+        .filter(ContaBanco.id.in_(contas_banco_ids))
+        .all()
+    )
+
+    saldos_realizado = defaultdict(lambda: {
+        'valor_pago': Decimal('0.00'),
+        'valor_recebido': Decimal('0.00'),
+        'data': None
+    })
+    saldos_previsto = defaultdict(lambda: {
+        'valor_previsto_pago': Decimal('0.00'),
+        'valor_previsto_recebido': Decimal('0.00'),
+        'data': None
+    })
+
+    # Apenas as colunas necessárias, em lotes (cursor no servidor quando o
+    # driver suporta): a memória fica proporcional ao número de buckets, não
+    # ao de lançamentos da empresa.
+    resultado = db.session.execute(
+        select(
+            Lancamento.fluxo_conta_id,
+            Lancamento.conta_banco_id,
+            Lancamento.status,
+            Lancamento.valor_pago,
+            Lancamento.valor_real,
+            func.coalesce(Lancamento.data_pagamento, Lancamento.data_evento),
+            func.coalesce(Lancamento.data_vencimento, Lancamento.data_evento),
+        )
+        .where(Lancamento.empresa_id == empresa_id)
+        .execution_options(yield_per=LOTE_LEITURA)
+    )
+
+    total_lancamentos = 0
+    for fluxo_conta_id, conta_banco_id, status, valor_pago, valor_real, data_realizado, data_previsto in resultado:
+        total_lancamentos += 1
+        key = (fluxo_conta_id, conta_banco_id)
+        despesa = tipos.get(fluxo_conta_id) == 'P'
+        if status == 'pago':
+            bucket = saldos_realizado[key]
+            bucket['valor_pago' if despesa else 'valor_recebido'] += valor_pago or Decimal('0.00')
+            data = data_realizado
+        else:
+            bucket = saldos_previsto[key]
+            bucket['valor_previsto_pago' if despesa else 'valor_previsto_recebido'] += valor_real or Decimal('0.00')
+            data = data_previsto
+        # A data do consolidado é a mais recente do bucket (igual à do modo incremental)
+        if data is not None and (bucket['data'] is None or data > bucket['data']):
+            bucket['data'] = data
+
+    linhas_realizado = []
+    for (fluxo_conta_id, conta_banco_id), valores in saldos_realizado.items():
+        saldo_anterior = saldos_iniciais.get(conta_banco_id) or Decimal('0.00')
+        linhas_realizado.append({
+            'empresa_id': empresa_id,
+            'data': valores['data'] or inicio.date(),
+            'fluxo_conta_id': fluxo_conta_id,
+            'conta_banco_id': conta_banco_id,
+            'saldo_anterior': saldo_anterior,
+            'valor_pago': valores['valor_pago'],
+            'valor_recebido': valores['valor_recebido'],
+            'saldo_atual': saldo_anterior + valores['valor_recebido'] - valores['valor_pago'],
         })
-        saldos_previsto = defaultdict(lambda: {
-            'valor_previsto_pago': Decimal('0.00'),
-            'valor_previsto_recebido': Decimal('0.00'),
-            'datas': []
+
+    linhas_previsto = []
+    for (fluxo_conta_id, conta_banco_id), valores in saldos_previsto.items():
+        saldo_anterior = saldos_iniciais.get(conta_banco_id) or Decimal('0.00')
+        linhas_previsto.append({
+            'empresa_id': empresa_id,
+            'data': valores['data'] or inicio.date(),
+            'fluxo_conta_id': fluxo_conta_id,
+            'conta_banco_id': conta_banco_id,
+            'saldo_anterior': saldo_anterior,
+            'valor_previsto_pago': valores['valor_previsto_pago'],
+            'valor_previsto_recebido': valores['valor_previsto_recebido'],
+            'saldo_previsto': saldo_anterior + valores['valor_previsto_recebido'] - valores['valor_previsto_pago'],
         })
 
-        lancamentos = Lancamento.query.filter_by(empresa_id=empresa_id).all()
-
-        for lanc in lancamentos:
-            key = (lanc.fluxo_conta_id, lanc.conta_banco_id)
-            if lanc.status == 'pago':
-                if lanc.fluxo_conta and lanc.fluxo_conta.tipo == 'P':
-                    saldos_realizado[key]['valor_pago'] += lanc.valor_pago or Decimal('0.00')
-                else:
-                    saldos_realizado[key]['valor_recebido'] += lanc.valor_pago or Decimal('0.00')
-                saldos_realizado[key]['datas'].append(lanc.data_pagamento or lanc.data_evento)
-            else:
-                if lanc.fluxo_conta and lanc.fluxo_conta.tipo == 'P':
-                    saldos_previsto[key]['valor_previsto_pago'] += lanc.valor_real or Decimal('0.00')
-                else:
-                    saldos_previsto[key]['valor_previsto_recebido'] += lanc.valor_real or Decimal('0.00')
-                saldos_previsto[key]['datas'].append(lanc.data_vencimento or lanc.data_evento)
-
-        # Grava realizado
-        for (fluxo_conta_id, conta_banco_id), valores in saldos_realizado.items():
-            conta_banco = ContaBanco.query.get(conta_banco_id)
-            saldo_anterior = conta_banco.saldo_inicial if conta_banco else Decimal('0.00')
-            saldo_atual = saldo_anterior + valores['valor_recebido'] - valores['valor_pago']
-            data_consolidado = valores['datas'][-1] if valores['datas'] else datetime.utcnow().date()
-            consolidado = FluxoCaixaRealizado(
-                empresa_id=empresa_id,
-                data=data_consolidado,
-                fluxo_conta_id=fluxo_conta_id,
-                conta_banco_id=conta_banco_id,
-                saldo_anterior=saldo_anterior,
-                valor_pago=valores['valor_pago'],
-                valor_recebido=valores['valor_recebido'],
-                saldo_atual=saldo_atual
-            )
-            db.session.add(consolidado)
-
-        # Grava previsto
-        for (fluxo_conta_id, conta_banco_id), valores in saldos_previsto.items():
-            conta_banco = ContaBanco.query.get(conta_banco_id)
-            saldo_anterior = conta_banco.saldo_inicial if conta_banco else Decimal('0.00')
-            saldo_previsto = saldo_anterior + valores['valor_previsto_recebido'] - valores['valor_previsto_pago']
-            data_consolidado = valores['datas'][-1] if valores['datas'] else datetime.utcnow().date()
-            previsto = FluxoCaixaPrevisto(
-                empresa_id=empresa_id,
-                data=data_consolidado,
-                fluxo_conta_id=fluxo_conta_id,
-                conta_banco_id=conta_banco_id,
-                saldo_anterior=saldo_anterior,
-                valor_previsto_pago=valores['valor_previsto_pago'],
-                valor_previsto_recebido=valores['valor_previsto_recebido'],
-                saldo_previsto=saldo_previsto
+    # Substitui o consolidado da empresa em uma única transação (bulk insert)
+    FluxoCaixaRealizado.query.filter_by(empresa_id=empresa_id).delete()
+    FluxoCaixaPrevisto.query.filter_by(empresa_id=empresa_id).delete()
+    if linhas_realizado:
+        db.session.execute(insert(FluxoCaixaRealizado), linhas_realizado)
+    if linhas_previsto:
+        db.session.execute(insert(FluxoCaixaPrevisto), linhas_previsto)
+    linhas_diario = reconstruir_fluxo_diario(empresa_id)
+    _registrar_consolidacao(empresa_id, inicio, reconstrucao=True)
+    db.session.commit()
+
+    linhas = len(linhas_realizado) + len(linhas_previsto) + linhas_diario
+    return _estatisticas(empresa_id, total_lancamentos, linhas, cronometro)
+
+
+def _consolidar_empresa_sql(empresa_id):
+    """Set-based engine: the aggregation runs entirely in the database.
+
+    Uses only portable constructs (CASE, COALESCE, SUM, MAX) so MySQL and
+    SQLite produce the same rows as `_consolidar_empresa`.
+    """
+    inicio = datetime.utcnow()
+    cronometro = time.perf_counter()
+
+    linhas = _regravar_consolidado_sql(empresa_id)
+    linhas += reconstruir_fluxo_diario(empresa_id)
+    _registrar_consolidacao(empresa_id, inicio, reconstrucao=True)
+    db.session.commit()
+
+    lancamentos = db.session.query(func.count(Lancamento.id)).filter(Lancamento.empresa_id == empresa_id).scalar()
+    return _estatisticas(empresa_id, lancamentos, linhas, cronometro)
+
+
+def reconsolidar_empresa(empresa_id):
+    """Rebuild every consolidated, daily and monthly row of the company. Does not commit.
+
+    Used inside a commit that changed data the incremental deltas cannot
+    express (a conta bancária's saldo_inicial or a conta de fluxo's tipo).
+    """
+    linhas = _regravar_consolidado_sql(empresa_id)
+    linhas += reconstruir_fluxo_diario(empresa_id)
+    _registrar_consolidacao(empresa_id, datetime.utcnow(), reconstrucao=True)
+    return linhas
+
+
+def reconsolidar_particao(empresa_id, fluxo_conta_id, conta_banco_id):
+    """Rebuild the consolidated and daily rows of a single (fluxo_conta, conta_banco) bucket.
+
+    Used by the consistency verifier to repair only the buckets that drifted.
+    """
+    particao = (fluxo_conta_id, conta_banco_id)
+    linhas = _regravar_consolidado_sql(empresa_id, particao)
+    linhas += reconstruir_fluxo_diario(empresa_id, particao)
+    db.session.commit()
+    return linhas
+
+
+def _regravar_consolidado_sql(empresa_id, particao=None):
+    """Replace the realizado/previsto rows via INSERT ... SELECT. Does not commit.
+
+    `particao` limits the rewrite to one (fluxo_conta_id, conta_banco_id).
+    """
+    despesa = FluxoContaModel.tipo == 'P'
+    saldo_inicial = func.max(func.coalesce(ContaBanco.saldo_inicial, 0))
+    filtro_particao = []
+    if particao is not None:
+        filtro_particao = [Lancamento.fluxo_conta_id == particao[0], Lancamento.conta_banco_id == particao[1]]
+
+    def agregado(colunas, filtro):
+        return (
+            select(*colunas)
+            .select_from(Lancamento)
+            .outerjoin(FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id)
+            .outerjoin(ContaBanco, ContaBanco.id == Lancamento.conta_banco_id)
+            .where(Lancamento.empresa_id == empresa_id, filtro, *filtro_particao)
+            .group_by(Lancamento.fluxo_conta_id, Lancamento.conta_banco_id)
+        )
+
+    valor_pago = func.coalesce(Lancamento.valor_pago, 0)
+    pago = func.sum(case((despesa, valor_pago), else_=0))
+    recebido = func.sum(case((despesa, 0), else_=valor_pago))
+    select_realizado = agregado([
+        literal(empresa_id),
+        func.max(func.coalesce(Lancamento.data_pagamento, Lancamento.data_evento)),
+        Lancamento.fluxo_conta_id,
+        Lancamento.conta_banco_id,
+        saldo_inicial,
+        pago,
+        recebido,
+        saldo_inicial + recebido - pago,
+    ], Lancamento.status == 'pago')
+
+    valor_real = func.coalesce(Lancamento.valor_real, 0)
+    previsto_pago = func.sum(case((despesa, valor_real), else_=0))
+    previsto_recebido = func.sum(case((despesa, 0), else_=valor_real))
+    select_previsto = agregado([
+        literal(empresa_id),
+        func.max(func.coalesce(Lancamento.data_vencimento, Lancamento.data_evento)),
+        Lancamento.fluxo_conta_id,
+        Lancamento.conta_banco_id,
+        saldo_inicial,
+        previsto_pago,
+        previsto_recebido,
+        saldo_inicial + previsto_recebido - previsto_pago,
+    ], Lancamento.status != 'pago')
+
+    for modelo in (FluxoCaixaRealizado, FluxoCaixaPrevisto):
+        query = modelo.query.filter_by(empresa_id=empresa_id)
+        if particao is not None:
+            query = query.filter_by(fluxo_conta_id=particao[0], conta_banco_id=particao[1])
+        query.delete()
+    linhas = db.session.execute(
+        insert(FluxoCaixaRealizado).from_select(
+            ['empresa_id', 'data', 'fluxo_conta_id', 'conta_banco_id', 'saldo_anterior',
+             'valor_pago', 'valor_recebido', 'saldo_atual'],
+            select_realizado
+        )
+    ).rowcount
+    linhas += db.session.execute(
+        insert(FluxoCaixaPrevisto).from_select(
+            ['empresa_id', 'data', 'fluxo_conta_id', 'conta_banco_id', 'saldo_anterior',
+             'valor_previsto_pago', 'valor_previsto_recebido', 'saldo_previsto'],
+            select_previsto
+        )
+    ).rowcount
+    return linhas
+
+
+def _estatisticas(empresa_id, lancamentos, linhas, cronometro):
+    """Build and log the throughput figures of one company consolidation."""
+    segundos = time.perf_counter() - cronometro
+    por_segundo = lancamentos / segundos if segundos > 0 else float(lancamentos)
+    logger.info(
+        'Consolidação empresa=%s: %d lançamentos, %d linhas gravadas em %.3fs (%.0f lançamentos/s)',
+        empresa_id, lancamentos, linhas, segundos, por_segundo
+    )
+    return {
+        'empresa_id': empresa_id,
+        'lancamentos': lancamentos,
+        'linhas': linhas,
+        'segundos': segundos,
+        'lancamentos_por_segundo': por_segundo,
+    }
+
+
+# --- Modo incremental -------------------------------------------------------
+#
+# Cada lançamento contribui para exatamente um bucket (fluxo_conta_id,
+# conta_banco_id) de uma das tabelas consolidadas: realizado quando pago,
+# previsto nos demais status. Editar, pagar ou excluir um lançamento equivale
+# a remover a contribuição do estado antigo e somar a do estado novo.
+
+def estado_lancamento(lancamento):
+    """Capture the fields of a lancamento that feed the consolidated tables.
+
+    Accepts any object with the Lancamento columns (the session hooks pass
+    the pre-change values). The tipo is read by fluxo_conta_id, so a stale
+    `fluxo_conta` relationship after an edit does not leak into the snapshot.
+    """
+    if lancamento is None:
+        return None
+    fluxo_conta = db.session.get(FluxoContaModel, lancamento.fluxo_conta_id) if lancamento.fluxo_conta_id else None
+    return {
+        'empresa_id': lancamento.empresa_id,
+        'fluxo_conta_id': lancamento.fluxo_conta_id,
+        'conta_banco_id': lancamento.conta_banco_id,
+        'status': lancamento.status,
+        'tipo': fluxo_conta.tipo if fluxo_conta else None,
+        'valor_pago': Decimal(str(lancamento.valor_pago or 0)),
+        'valor_real': Decimal(str(lancamento.valor_real or 0)),
+        'data_realizado': lancamento.data_pagamento or lancamento.data_evento,
+        'data_previsto': lancamento.data_vencimento or lancamento.data_evento,
+        'data_pagamento': lancamento.data_pagamento,
+        'data_vencimento': lancamento.data_vencimento,
+    }
+
+
+def aplicar_deltas_lancamentos(empresa_id, deltas):
+    """Update only the consolidated buckets touched by the given lancamento changes.
+
+    `deltas` is a list of (antes, depois) snapshots from `estado_lancamento`
+    (None for a creation or a deletion). The lancamento changes must already
+    be flushed, so bucket dates can be re-read from `lancamentos`. Does not
+    commit.
+    """
+    # Sem nenhuma linha diária ou fechamento mensal (tabelas ainda não populadas
+    # após o deploy), os deltas partiriam de saldo zero: reconstrói a partir dos
+    # lançamentos já gravados
+    diario = tem_fluxo_diario(empresa_id) and tem_saldo_mensal(empresa_id)
+    for antes, depois in deltas:
+        if antes is not None:
+            _aplicar_contribuicao(antes, -1)
+            if diario:
+                aplicar_contribuicao_diaria(antes, -1)
+        if depois is not None:
+            _aplicar_contribuicao(depois, 1)
+            if diario:
+                aplicar_contribuicao_diaria(depois, 1)
+    if not diario:
+        reconstruir_fluxo_diario(empresa_id)
+    _registrar_consolidacao(empresa_id, datetime.utcnow())
+
+
+def _aplicar_contribuicao(estado, sinal):
+    if estado['status'] == 'pago':
+        modelo = FluxoCaixaRealizado
+        campo_pago, campo_recebido, campo_saldo = 'valor_pago', 'valor_recebido', 'saldo_atual'
+        valor = estado['valor_pago']
+        data = estado['data_realizado']
+    else:
+        modelo = FluxoCaixaPrevisto
+        campo_pago, campo_recebido, campo_saldo = 'valor_previsto_pago', 'valor_previsto_recebido', 'saldo_previsto'
+        valor = estado['valor_real']
+        data = estado['data_previsto']
+    campo_valor = campo_pago if estado['tipo'] == 'P' else campo_recebido
+
+    row = modelo.query.filter_by(
+        empresa_id=estado['empresa_id'],
+        fluxo_conta_id=estado['fluxo_conta_id'],
+        conta_banco_id=estado['conta_banco_id']
+    ).with_for_update().first()
+
+    if sinal < 0:
+        if row is None:
+            # Consolidado já divergente; a reconsolidação completa corrige.
+            return
+        setattr(row, campo_valor, Decimal(str(getattr(row, campo_valor) or 0)) - valor)
+        if data is None or row.data is None or data >= row.data:
+            # O lançamento removido podia ser o mais recente do bucket
+            data_bucket = _data_mais_recente(estado)
+            if data_bucket is None:
+                db.session.delete(row)
+                return
+            row.data = data_bucket
+    else:
+        if row is None:
+            row = modelo(
+                empresa_id=estado['empresa_id'],
+                fluxo_conta_id=estado['fluxo_conta_id'],
+                conta_banco_id=estado['conta_banco_id'],
+                data=data or datetime.utcnow().date(),
             )
-            db.session.add(previsto)
+            setattr(row, campo_pago, Decimal('0.00'))
+            setattr(row, campo_recebido, Decimal('0.00'))
+            db.session.add(row)
+        elif data and (row.data is None or data > row.data):
+            row.data = data
+        setattr(row, campo_valor, Decimal(str(getattr(row, campo_valor) or 0)) + valor)
+
+    conta_banco = db.session.get(ContaBanco, estado['conta_banco_id'])
+    saldo_anterior = Decimal(str(conta_banco.saldo_inicial or 0)) if conta_banco else Decimal('0.00')
+    row.saldo_anterior = saldo_anterior
+    setattr(
+        row,
+        campo_saldo,
+        saldo_anterior + Decimal(str(getattr(row, campo_recebido) or 0)) - Decimal(str(getattr(row, campo_pago) or 0))
+    )
 
-        db.session.commit()
+
+def _data_mais_recente(estado):
+    """Most recent date among the lancamentos still in the bucket (None if empty)."""
+    query = db.session.query(Lancamento).filter(
+        Lancamento.empresa_id == estado['empresa_id'],
+        Lancamento.fluxo_conta_id == estado['fluxo_conta_id'],
+        Lancamento.conta_banco_id == estado['conta_banco_id']
+    )
+    if estado['status'] == 'pago':
+        coluna = func.coalesce(Lancamento.data_pagamento, Lancamento.data_evento)
+        query = query.filter(Lancamento.status == 'pago')
+    else:
+        coluna = func.coalesce(Lancamento.data_vencimento, Lancamento.data_evento)
+        query = query.filter(Lancamento.status != 'pago')
+    return query.with_entities(func.max(coluna)).scalar()
+
+def _registrar_consolidacao(empresa_id, momento, reconstrucao=False):
+    """Record the moment up to which the company's consolidated rows are current.
+
+    `reconstrucao` marks a full rebuild, which `empresas_alteradas` compares
+    against the company's last data change.
+    """
+    fila = FilaConsolidacao.query.filter_by(empresa_id=empresa_id).first()
+    if fila is None:
+        fila = FilaConsolidacao(empresa_id=empresa_id)
+        db.session.add(fila)
+    fila.consolidado_em = momento
+    if reconstrucao:
+        fila.reconstruido_em = momento
+        # A reconsolidação completa libera uma empresa parada na fila após falhas
+        fila.tentativas = 0
+        fila.proxima_tentativa_em = None
+        fila.ultimo_erro = None
 
 # Para uso: from src.services.fluxo_consolidado import consolidar_fluxo_caixa
-# consolidar_fluxo_caixa()
\ No newline at end of file
+# consolidar_fluxo_caixa()
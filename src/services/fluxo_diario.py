@@ -0,0 +1,259 @@
+"""
+Fluxo de caixa diário consolidado - agregados por dia, conta bancária e conta de fluxo
+
+Mantido junto com o consolidado (incremental nos commits, reconstruído na
+consolidação completa) para que relatórios por período custem O(dias) em vez
+de O(lançamentos).
+
+A tabela nasce vazia no deploy: `consolidar_fluxo.py --sem-diario` (etapa de
+release) reconstrói as empresas que ainda não têm linhas diárias, e o modo
+incremental reconstrói em vez de somar deltas enquanto a empresa não tiver
+nenhuma, para não acumular saldos a partir de zero.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import func, case, select, update, insert, or_
+
+from src.models import db, Lancamento, FluxoContaModel, FluxoCaixaDiario
+from src.services.saldo_mensal import reconstruir_saldos_mensais, ajustar_saldo_mensal
+
+CAMPOS_VALOR = ('valor_pago', 'valor_recebido', 'valor_previsto_pago', 'valor_previsto_recebido')
+
+CENTAVO = Decimal('0.01')
+
+
+def _decimal(valor):
+    # SQLite devolve SUM de NUMERIC como float: normaliza para centavos
+    return Decimal(str(valor or 0)).quantize(CENTAVO)
+
+
+def calcular_fluxo_diario(empresa_id, particao=None):
+    """Daily rows the company should have, computed from two grouped queries on `lancamentos`.
+
+    Only per-day aggregates are read; the cumulative saldos are computed
+    while walking each (conta_banco, fluxo_conta) pair in date order.
+    `particao` limits the result to one (fluxo_conta_id, conta_banco_id).
+    Returns the row dicts in (conta_banco, fluxo_conta, data) order.
+    """
+    despesa = FluxoContaModel.tipo == 'P'
+    filtro_particao = []
+    if particao is not None:
+        filtro_particao = [Lancamento.fluxo_conta_id == particao[0], Lancamento.conta_banco_id == particao[1]]
+
+    def agregado(coluna_data, coluna_valor, filtro):
+        valor = func.coalesce(coluna_valor, 0)
+        return db.session.execute(
+            select(
+                Lancamento.conta_banco_id,
+                Lancamento.fluxo_conta_id,
+                coluna_data,
+                func.sum(case((despesa, valor), else_=0)),
+                func.sum(case((despesa, 0), else_=valor)),
+            )
+            .select_from(Lancamento)
+            .outerjoin(FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id)
+            .where(Lancamento.empresa_id == empresa_id, coluna_data.isnot(None), *filtro, *filtro_particao)
+            .group_by(Lancamento.conta_banco_id, Lancamento.fluxo_conta_id, coluna_data)
+        ).all()
+
+    dias = defaultdict(lambda: dict.fromkeys(CAMPOS_VALOR, Decimal('0.00')))
+    for banco, fluxo, data, pago, recebido in agregado(Lancamento.data_pagamento, Lancamento.valor_pago, [Lancamento.status == 'pago']):
+        dias[(banco, fluxo, data)]['valor_pago'] += Decimal(str(pago or 0))
+        dias[(banco, fluxo, data)]['valor_recebido'] += Decimal(str(recebido or 0))
+    for banco, fluxo, data, pago, recebido in agregado(Lancamento.data_vencimento, Lancamento.valor_real, []):
+        dias[(banco, fluxo, data)]['valor_previsto_pago'] += Decimal(str(pago or 0))
+        dias[(banco, fluxo, data)]['valor_previsto_recebido'] += Decimal(str(recebido or 0))
+
+    linhas = []
+    acumulado = {}
+    for (banco, fluxo, data) in sorted(dias, key=lambda chave: (chave[0] or 0, chave[1] or 0, chave[2])):
+        valores = dias[(banco, fluxo, data)]
+        if not any(valores.values()):
+            continue
+        saldo_realizado, saldo_previsto = acumulado.get((banco, fluxo), (Decimal('0.00'), Decimal('0.00')))
+        saldo_realizado += valores['valor_recebido'] - valores['valor_pago']
+        saldo_previsto += valores['valor_previsto_recebido'] - valores['valor_previsto_pago']
+        acumulado[(banco, fluxo)] = (saldo_realizado, saldo_previsto)
+        linhas.append(dict(
+            valores,
+            empresa_id=empresa_id,
+            conta_banco_id=banco,
+            fluxo_conta_id=fluxo,
+            data=data,
+            saldo_realizado=saldo_realizado,
+            saldo_previsto=saldo_previsto,
+        ))
+    return linhas
+
+
+def reconstruir_fluxo_diario(empresa_id, particao=None):
+    """Rebuild the company's daily rows from `calcular_fluxo_diario`.
+
+    `particao` limits the rebuild to one (fluxo_conta_id, conta_banco_id).
+    The monthly closings of the affected contas bancárias are rebuilt too.
+    Does not commit. Returns the number of rows written.
+    """
+    linhas = calcular_fluxo_diario(empresa_id, particao)
+    query = FluxoCaixaDiario.query.filter_by(empresa_id=empresa_id)
+    if particao is not None:
+        query = query.filter_by(fluxo_conta_id=particao[0], conta_banco_id=particao[1])
+    query.delete()
+    if linhas:
+        db.session.execute(insert(FluxoCaixaDiario), linhas)
+    mensais = reconstruir_saldos_mensais(empresa_id, particao[1] if particao is not None else None)
+    return len(linhas) + mensais
+
+
+def tem_fluxo_diario(empresa_id):
+    """Whether the company has any daily row (False before the post-deploy backfill)."""
+    return db.session.query(FluxoCaixaDiario.id).filter(
+        FluxoCaixaDiario.empresa_id == empresa_id
+    ).first() is not None
+
+
+def empresas_sem_fluxo_diario(empresa_ids):
+    """Filter `empresa_ids` down to companies with lancamentos but no daily rows."""
+    sem_diario = db.session.query(Lancamento.empresa_id).filter(
+        Lancamento.empresa_id.in_(empresa_ids),
+        ~select(FluxoCaixaDiario.id).where(FluxoCaixaDiario.empresa_id == Lancamento.empresa_id).exists()
+    ).distinct()
+    encontradas = {row[0] for row in sem_diario}
+    return [empresa_id for empresa_id in empresa_ids if empresa_id in encontradas]
+
+
+def aplicar_contribuicao_diaria(estado, sinal):
+    """Add (sinal=1) or remove (sinal=-1) one lancamento from the daily rows.
+
+    `estado` is a snapshot from `estado_lancamento`. Does not commit.
+    """
+    despesa = estado['tipo'] == 'P'
+    if estado['status'] == 'pago' and estado['data_pagamento']:
+        campo = 'valor_pago' if despesa else 'valor_recebido'
+        _somar(estado, estado['data_pagamento'], campo, 'saldo_realizado', sinal * estado['valor_pago'], despesa)
+    if estado['data_vencimento']:
+        campo = 'valor_previsto_pago' if despesa else 'valor_previsto_recebido'
+        _somar(estado, estado['data_vencimento'], campo, 'saldo_previsto', sinal * estado['valor_real'], despesa)
+
+
+def _somar(estado, data, campo, campo_saldo, valor, despesa):
+    chave = (
+        FluxoCaixaDiario.empresa_id == estado['empresa_id'],
+        FluxoCaixaDiario.conta_banco_id == estado['conta_banco_id'],
+        FluxoCaixaDiario.fluxo_conta_id == estado['fluxo_conta_id'],
+    )
+    row = FluxoCaixaDiario.query.filter(*chave, FluxoCaixaDiario.data == data).with_for_update().first()
+    if row is None:
+        anterior = FluxoCaixaDiario.query.filter(*chave, FluxoCaixaDiario.data < data).order_by(
+            FluxoCaixaDiario.data.desc()
+        ).first()
+        row = FluxoCaixaDiario(
+            empresa_id=estado['empresa_id'],
+            conta_banco_id=estado['conta_banco_id'],
+            fluxo_conta_id=estado['fluxo_conta_id'],
+            data=data,
+            saldo_realizado=anterior.saldo_realizado if anterior else Decimal('0.00'),
+            saldo_previsto=anterior.saldo_previsto if anterior else Decimal('0.00'),
+            **dict.fromkeys(CAMPOS_VALOR, Decimal('0.00'))
+        )
+        db.session.add(row)
+    setattr(row, campo, Decimal(str(getattr(row, campo) or 0)) + valor)
+    db.session.flush()
+
+    # O saldo acumulado do dia e de todos os dias seguintes do par muda pelo mesmo valor
+    variacao = -valor if despesa else valor
+    coluna_saldo = getattr(FluxoCaixaDiario, campo_saldo)
+    db.session.execute(
+        update(FluxoCaixaDiario)
+        .where(*chave, FluxoCaixaDiario.data >= data)
+        .values({campo_saldo: coluna_saldo + variacao}),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.expire(row)
+    if not any(getattr(row, c) for c in CAMPOS_VALOR):
+        db.session.delete(row)
+        db.session.flush()
+    ajustar_saldo_mensal(estado['empresa_id'], estado['conta_banco_id'], data, campo_saldo, variacao)
+
+
+def suporta_funcoes_janela():
+    """Whether the database runs SUM() OVER (...): SQLite 3.25+, MySQL 8.0+, MariaDB 10.2+."""
+    dialeto = db.engine.dialect
+    if dialeto.name == 'sqlite':
+        return dialeto.dbapi.sqlite_version_info >= (3, 25)
+    if dialeto.name == 'mysql':
+        versao = dialeto.server_version_info or ()
+        return versao >= ((10, 2) if getattr(dialeto, 'is_mariadb', False) else (8, 0))
+    return True
+
+
+def resumo_diario(empresa_id, previsto, saldo_inicial, data_inicio=None, data_fim=None,
+                  conta_banco_id=None, conta_fluxo_id=None):
+    """Per-day (data, saldo_anterior, pagar, receber, saldo_atual) rows of the company, in date order.
+
+    `previsto` selects the forecast columns (vencimento/valor_real) instead of
+    the realized ones (pagamento/valor_pago). Days are summed with GROUP BY and
+    the running saldo comes from a SUM() OVER window; on databases without
+    window functions it is accumulated here.
+    """
+    if previsto:
+        pagar, receber = FluxoCaixaDiario.valor_previsto_pago, FluxoCaixaDiario.valor_previsto_recebido
+    else:
+        pagar, receber = FluxoCaixaDiario.valor_pago, FluxoCaixaDiario.valor_recebido
+    filtros = [FluxoCaixaDiario.empresa_id == empresa_id]
+    if data_inicio:
+        filtros.append(FluxoCaixaDiario.data >= data_inicio)
+    if data_fim:
+        filtros.append(FluxoCaixaDiario.data <= data_fim)
+    if conta_banco_id:
+        filtros.append(FluxoCaixaDiario.conta_banco_id == conta_banco_id)
+    if conta_fluxo_id:
+        filtros.append(FluxoCaixaDiario.fluxo_conta_id == conta_fluxo_id)
+
+    dias = select(
+        FluxoCaixaDiario.data.label('data'),
+        func.sum(pagar).label('pagar'),
+        func.sum(receber).label('receber'),
+    ).where(*filtros).group_by(FluxoCaixaDiario.data).having(
+        or_(func.sum(pagar) != 0, func.sum(receber) != 0)
+    )
+
+    if suporta_funcoes_janela():
+        dias = dias.subquery()
+        query = select(
+            dias.c.data, dias.c.pagar, dias.c.receber,
+            func.sum(dias.c.receber - dias.c.pagar).over(order_by=dias.c.data).label('acumulado'),
+        ).order_by(dias.c.data)
+        rows = []
+        for data, total_pagar, total_receber, acumulado in db.session.execute(query):
+            total_pagar, total_receber = _decimal(total_pagar), _decimal(total_receber)
+            saldo_atual = saldo_inicial + _decimal(acumulado)
+            rows.append((data, saldo_atual - total_receber + total_pagar, total_pagar, total_receber, saldo_atual))
+        return rows
+
+    rows = []
+    saldo_atual = saldo_inicial
+    for data, total_pagar, total_receber in db.session.execute(dias.order_by(FluxoCaixaDiario.data)):
+        total_pagar, total_receber = _decimal(total_pagar), _decimal(total_receber)
+        saldo_anterior = saldo_atual
+        saldo_atual = saldo_anterior + total_receber - total_pagar
+        rows.append((data, saldo_anterior, total_pagar, total_receber, saldo_atual))
+    return rows
+
+
+def serie_diaria(empresa_id, data_inicio, data_fim):
+    """Per-day {data: (previsto, realizado)} gross movement of the company (pagar + receber)."""
+    rows = db.session.query(
+        FluxoCaixaDiario.data,
+        func.sum(FluxoCaixaDiario.valor_previsto_pago + FluxoCaixaDiario.valor_previsto_recebido),
+        func.sum(FluxoCaixaDiario.valor_pago + FluxoCaixaDiario.valor_recebido),
+    ).filter(
+        FluxoCaixaDiario.empresa_id == empresa_id,
+        FluxoCaixaDiario.data >= data_inicio,
+        FluxoCaixaDiario.data <= data_fim,
+    ).group_by(FluxoCaixaDiario.data).all()
+    return {
+        data: (Decimal(str(previsto or 0)), Decimal(str(realizado or 0)))
+        for data, previsto, realizado in rows
+    }
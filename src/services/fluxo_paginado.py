@@ -0,0 +1,160 @@
+"""
+Lançamentos do fluxo de caixa com saldo por conta, em páginas
+
+As listas realizado/previsto do relatório são servidas em páginas ordenadas
+por (data, id) com paginação por cursor (keyset): cada página lê apenas as
+suas linhas pelo índice (empresa_id, data, id). O saldo de abertura de cada
+conta na página é o saldo inicial do período mais a soma dos lançamentos
+anteriores ao cursor (um GROUP BY); dentro da página o saldo acumula com
+SUM() OVER (PARTITION BY conta_banco_id ORDER BY data, id).
+"""
+
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import and_, case, func, or_, select
+
+from src.models import db, Lancamento, FluxoContaModel, ContaBanco
+from src.services.fluxo_diario import CENTAVO, suporta_funcoes_janela
+
+TAMANHO_PAGINA = 200
+
+
+def codificar_cursor(data, lancamento_id):
+    return f'{data.isoformat()}.{lancamento_id}'
+
+
+def decodificar_cursor(texto):
+    """Parse a 'YYYY-MM-DD.id' cursor; returns None when absent or malformed."""
+    try:
+        data, lancamento_id = (texto or '').split('.')
+        return date.fromisoformat(data), int(lancamento_id)
+    except ValueError:
+        return None
+
+
+def _colunas(previsto):
+    if previsto:
+        return Lancamento.data_vencimento, Lancamento.valor_real
+    return Lancamento.data_pagamento, Lancamento.valor_pago
+
+
+def _filtros(empresa_id, previsto, data_inicio, data_fim, conta_banco_id, conta_fluxo_id):
+    coluna_data, _ = _colunas(previsto)
+    # Sem data (ex.: importado como pago sem data_pagamento) não entra no cursor nem nos saldos
+    filtros = [Lancamento.empresa_id == empresa_id, coluna_data.isnot(None)]
+    if not previsto:
+        filtros.append(Lancamento.status == 'pago')
+    if data_inicio:
+        filtros.append(coluna_data >= data_inicio)
+    if data_fim:
+        filtros.append(coluna_data <= data_fim)
+    if conta_banco_id:
+        filtros.append(Lancamento.conta_banco_id == conta_banco_id)
+    if conta_fluxo_id:
+        filtros.append(Lancamento.fluxo_conta_id == conta_fluxo_id)
+    return filtros
+
+
+def _centavos(valor):
+    return Decimal(str(valor or 0)).quantize(CENTAVO)
+
+
+def pagina_fluxo(empresa_id, previsto, saldo_inicial_por_conta, data_inicio=None, data_fim=None,
+                 conta_banco_id=None, conta_fluxo_id=None, apos=None, tamanho=TAMANHO_PAGINA):
+    """One page of the realized (or forecast) list with per-conta running saldos.
+
+    `apos` is the (data, id) of the last row of the previous page. Returns
+    (linhas, proximo) where each linha carries `lancamento`, `saldo_anterior`
+    and `saldo_atual`, and `proximo` is the cursor of the next page (None on
+    the last one).
+    """
+    coluna_data, coluna_valor = _colunas(previsto)
+    filtros = _filtros(empresa_id, previsto, data_inicio, data_fim, conta_banco_id, conta_fluxo_id)
+    valor_assinado = case(
+        (FluxoContaModel.tipo == 'P', -func.coalesce(coluna_valor, 0)),
+        else_=func.coalesce(coluna_valor, 0)
+    )
+
+    saldos = dict(saldo_inicial_por_conta)
+    filtro_pagina = []
+    if apos:
+        data_cursor, id_cursor = apos
+        filtro_pagina.append(or_(
+            coluna_data > data_cursor, and_(coluna_data == data_cursor, Lancamento.id > id_cursor)
+        ))
+        # Movimento de cada conta nas páginas anteriores
+        anteriores = select(Lancamento.conta_banco_id, func.sum(valor_assinado)).outerjoin(
+            FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+        ).where(
+            *filtros,
+            or_(coluna_data < data_cursor, and_(coluna_data == data_cursor, Lancamento.id <= id_cursor))
+        ).group_by(Lancamento.conta_banco_id)
+        for conta_id, movimento in db.session.execute(anteriores):
+            saldos[conta_id] = saldos.get(conta_id, Decimal('0.00')) + _centavos(movimento)
+
+    pagina = select(
+        Lancamento.id.label('id'),
+        Lancamento.conta_banco_id.label('conta_banco_id'),
+        coluna_data.label('data'),
+        Lancamento.data_pagamento.label('data_pagamento'),
+        Lancamento.data_vencimento.label('data_vencimento'),
+        Lancamento.valor_pago.label('valor_pago'),
+        Lancamento.valor_real.label('valor_real'),
+        valor_assinado.label('valor_assinado'),
+        FluxoContaModel.id.label('fluxo_id'),
+        FluxoContaModel.codigo.label('fluxo_codigo'),
+        FluxoContaModel.tipo.label('fluxo_tipo'),
+        ContaBanco.id.label('banco_id'),
+        ContaBanco.nome.label('banco_nome'),
+    ).outerjoin(
+        FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+    ).outerjoin(
+        ContaBanco, ContaBanco.id == Lancamento.conta_banco_id
+    ).where(*filtros, *filtro_pagina).order_by(coluna_data, Lancamento.id).limit(tamanho + 1)
+
+    com_janela = suporta_funcoes_janela()
+    if com_janela:
+        pagina = pagina.subquery()
+        query = select(
+            pagina,
+            func.sum(pagina.c.valor_assinado).over(
+                partition_by=pagina.c.conta_banco_id, order_by=(pagina.c.data, pagina.c.id)
+            ).label('acumulado'),
+        ).order_by(pagina.c.data, pagina.c.id)
+        rows = db.session.execute(query).all()
+    else:
+        rows = db.session.execute(pagina).all()
+
+    proximo = None
+    if len(rows) > tamanho:
+        # A linha extra só indica que há próxima página; o acumulado das demais não depende dela
+        rows = rows[:tamanho]
+        proximo = codificar_cursor(rows[-1].data, rows[-1].id)
+
+    acumulado_por_conta = {}
+    linhas = []
+    for row in rows:
+        base = saldos.get(row.conta_banco_id, Decimal('0.00'))
+        valor = _centavos(row.valor_assinado)
+        if com_janela:
+            acumulado = _centavos(row.acumulado)
+        else:
+            acumulado = acumulado_por_conta.get(row.conta_banco_id, Decimal('0.00')) + valor
+            acumulado_por_conta[row.conta_banco_id] = acumulado
+        linhas.append(SimpleNamespace(
+            lancamento=SimpleNamespace(
+                id=row.id,
+                conta_banco_id=row.conta_banco_id,
+                data_pagamento=row.data_pagamento,
+                data_vencimento=row.data_vencimento,
+                valor_pago=row.valor_pago,
+                valor_real=row.valor_real,
+                fluxo_conta=SimpleNamespace(codigo=row.fluxo_codigo, tipo=row.fluxo_tipo) if row.fluxo_id else None,
+                conta_banco=SimpleNamespace(nome=row.banco_nome) if row.banco_id else None,
+            ),
+            saldo_anterior=base + acumulado - valor,
+            saldo_atual=base + acumulado,
+        ))
+    return linhas, proximo
@@ -0,0 +1,262 @@
+"""
+Dados e arquivos dos relatórios, independentes da requisição
+
+Usados pelas telas e exportações de `src/routes/relatorios.py` e pelas
+exportações em segundo plano (`tarefas_exportacao`), que rodam no worker sem
+usuário logado: tudo recebe o empresa_id e os filtros (parâmetros da tela,
+como strings) explicitamente. Os dados do balancete e do fluxo de caixa
+passam pelo cache de relatórios, então a exportação reaproveita o que a tela
+acabou de calcular com os mesmos filtros.
+
+As funções `arquivo_*` gravam o relatório em disco e devolvem
+(caminho, nome para download, mimetype). `progresso`, quando informado,
+recebe o percentual concluído entre as etapas.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from src.models import db, Empresa, Lancamento, FluxoContaModel, ContaBanco
+from src.services.cache_relatorios import em_cache_relatorio
+from src.services.comissoes import ServicoComissoes
+from src.services.exportacao import Aba, MIMETYPE_CSV, MIMETYPE_XLSX, gerar_csv, gerar_xlsx
+from src.services.exportacao_pdf import Coluna, MIMETYPE_PDF, gerar_pdf
+from src.services.fluxo_diario import resumo_diario
+from src.services.saldo_mensal import movimento_antes_de
+
+
+def _data(texto):
+    return datetime.strptime(texto, '%Y-%m-%d').date() if texto else None
+
+
+def _inteiro(texto):
+    try:
+        return int(texto) if texto else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _avisar(progresso, percentual):
+    if progresso is not None:
+        progresso(percentual)
+
+
+def dados_balancete(empresa_id, parametros):
+    """Balancete lines and header fields for the filters of the balancete screen (cached)."""
+    filtros = {
+        'data_ini': parametros.get('data_ini', datetime.now().replace(day=1).strftime('%Y-%m-%d')),
+        'data_fim': parametros.get('data_fim', datetime.now().strftime('%Y-%m-%d')),
+        'conta_ini': parametros.get('conta_ini', ''),
+        'conta_fim': parametros.get('conta_fim', ''),
+        'entidade': parametros.get('entidade', ''),
+        'status': parametros.get('status', ''),
+    }
+    return em_cache_relatorio(empresa_id, 'balancete', filtros, lambda: _calcular_balancete(empresa_id, **filtros))
+
+
+def _calcular_balancete(empresa_id, data_ini, data_fim, conta_ini, conta_fim, entidade, status):
+    from src.balancete_financeiro import montar_balancete_estruturado
+
+    empresa = db.session.get(Empresa, empresa_id)
+
+    contas = FluxoContaModel.query.filter_by(empresa_id=empresa_id, ativo=True).order_by(FluxoContaModel.codigo.asc()).all()
+    if conta_ini or conta_fim:
+        contas = [
+            c for c in contas
+            if not (conta_ini and c.codigo < conta_ini) and not (conta_fim and c.codigo > conta_fim)
+        ]
+
+    lanc_query = Lancamento.query.filter_by(empresa_id=empresa_id)
+    if data_ini:
+        lanc_query = lanc_query.filter(Lancamento.data_evento >= data_ini)
+    if data_fim:
+        lanc_query = lanc_query.filter(Lancamento.data_evento <= data_fim)
+    if conta_ini or conta_fim:
+        lanc_query = lanc_query.filter(Lancamento.fluxo_conta_id.in_([c.id for c in contas]))
+    if entidade:
+        lanc_query = lanc_query.filter(Lancamento.entidade_id == int(entidade))
+    if status:
+        lanc_query = lanc_query.filter(Lancamento.status == status)
+
+    linhas, total = montar_balancete_estruturado(
+        contas_models=contas,
+        lancamentos_models=lanc_query.order_by(Lancamento.data_evento.asc()).all(),
+        usar_valor_pago=True,
+        incluir_zeradas=False
+    )
+    return {
+        'empresa_nome': (empresa.nome if empresa else None) or '-',
+        'empresa_cnpj': (empresa.cnpj if empresa else None) or '-',
+        'data_ini': data_ini,
+        'data_fim': data_fim,
+        'linhas': linhas,
+        'total': total,
+        'gerado_em': datetime.now().strftime('%d/%m/%Y %H:%M'),
+    }
+
+
+def arquivo_balancete(empresa_id, parametros, diretorio=None, progresso=None):
+    """Balancete as .xlsx, or as .pdf when parametros['formato'] is 'pdf'."""
+    dados = dados_balancete(empresa_id, parametros)
+    _avisar(progresso, 50)
+    nome = f"balancete_{dados['data_ini']}_{dados['data_fim']}"
+
+    if parametros.get('formato') == 'pdf':
+        caminho = gerar_pdf(
+            [
+                f"Empresa: {dados['empresa_nome']}",
+                f"CNPJ: {dados['empresa_cnpj']}",
+                f"Período: {dados['data_ini']} a {dados['data_fim']}",
+                f"Gerado em: {dados['gerado_em']}",
+            ],
+            [Coluna('Código', 35), Coluna('Conta', 115), Coluna('Valor', 40, 'R')],
+            (
+                [linha['codigo'], f"{'  ' * linha['nivel']}{linha['descricao']}", f"R$ {linha['valor']:,.2f}"]
+                for linha in dados['linhas']
+            ),
+            total=['TOTAL', '', f"R$ {dados['total']:,.2f}"],
+            diretorio=diretorio,
+        )
+        return caminho, f'{nome}.pdf', MIMETYPE_PDF
+
+    def linhas():
+        yield ['Empresa', dados['empresa_nome']]
+        yield ['CNPJ', dados['empresa_cnpj']]
+        yield ['Período', f"{dados['data_ini']} a {dados['data_fim']}"]
+        yield ['Gerado em', dados['gerado_em']]
+        yield []
+        yield ['Código', 'Conta', 'Valor']
+        for linha in dados['linhas']:
+            indent = '  ' * linha['nivel']
+            yield [linha['codigo'], f"{indent}{linha['descricao']}", f"R$ {linha['valor']:,.2f}"]
+        yield []
+        yield ['TOTAL', '', f"R$ {dados['total']:,.2f}"]
+
+    caminho = gerar_xlsx([Aba('Balancete Financeiro', None, linhas())], diretorio)
+    return caminho, f'{nome}.xlsx', MIMETYPE_XLSX
+
+
+def saldo_inicial_por_conta(empresa_id, previsto, data_inicio, conta_banco_id):
+    """Opening saldo of each conta bancária at data_inicio (the filtered one or all active)."""
+    if conta_banco_id:
+        contas = ContaBanco.query.filter(ContaBanco.empresa_id == empresa_id, ContaBanco.id == conta_banco_id).all()
+    else:
+        contas = ContaBanco.query.filter_by(empresa_id=empresa_id, ativo=True).all()
+    saldos = {c.id: Decimal(str(c.saldo_inicial or 0)) for c in contas}
+    if data_inicio:
+        # Saldo de abertura do período: fechamento mensal mais próximo + dias restantes
+        movimento = movimento_antes_de(empresa_id, data_inicio, previsto, conta_banco_id)
+        for conta_id in saldos:
+            saldos[conta_id] += movimento.get(conta_id, Decimal('0.00'))
+    return saldos
+
+
+def resumo_fluxo_caixa(empresa_id, previsto, saldos_iniciais, data_inicio, data_fim, conta_banco_id, conta_fluxo_id):
+    # Totais por dia e saldo acumulado calculados no banco (GROUP BY + SUM() OVER)
+    return resumo_diario(
+        empresa_id, previsto, sum(saldos_iniciais.values(), Decimal('0.00')),
+        data_inicio or None, data_fim or None, conta_banco_id, conta_fluxo_id
+    )
+
+
+def dados_fluxo_caixa(empresa_id, data_inicio, data_fim, conta_banco_id, conta_fluxo_id):
+    """Opening saldos per conta and daily summary, each keyed by previsto (True/False). Cached."""
+    filtros = {
+        'data_inicio': data_inicio.isoformat() if data_inicio else None,
+        'data_fim': data_fim.isoformat() if data_fim else None,
+        'conta_banco_id': conta_banco_id,
+        'conta_fluxo_id': conta_fluxo_id,
+    }
+
+    def calcular():
+        saldos, resumos = {}, {}
+        for previsto in (False, True):
+            saldos[previsto] = saldo_inicial_por_conta(empresa_id, previsto, data_inicio, conta_banco_id)
+            resumos[previsto] = resumo_fluxo_caixa(
+                empresa_id, previsto, saldos[previsto], data_inicio, data_fim, conta_banco_id, conta_fluxo_id
+            )
+        return {'saldos': saldos, 'resumos': resumos}
+
+    return em_cache_relatorio(empresa_id, 'fluxo-caixa', filtros, calcular)
+
+
+def arquivo_fluxo_caixa(empresa_id, parametros, diretorio=None, progresso=None):
+    resumos = dados_fluxo_caixa(
+        empresa_id,
+        _data(parametros.get('data_inicio')),
+        _data(parametros.get('data_fim')),
+        _inteiro(parametros.get('conta_banco_id')),
+        _inteiro(parametros.get('conta_fluxo_id')),
+    )['resumos']
+    _avisar(progresso, 80)
+
+    headers = ['Data', 'Saldo Anterior', 'Pagamentos', 'Recebimentos', 'Saldo do Dia']
+    # Formato numérico por coluna (B-E) em vez de percorrer todas as células
+    formatos = {indice: '#,##0.00' for indice in range(1, 5)}
+    larguras = {'A': 14, 'B': 18, 'C': 16, 'D': 16, 'E': 18}
+
+    def linhas(resumo):
+        for data_ref, saldo_anterior, pagar, receber, saldo_atual in resumo:
+            yield [data_ref.strftime('%d/%m/%Y'), float(saldo_anterior), float(pagar), float(receber), float(saldo_atual)]
+
+    caminho = gerar_xlsx([
+        Aba('Previsto', headers, linhas(resumos[True]), formatos, larguras),
+        Aba('Realizado', headers, linhas(resumos[False]), formatos, larguras),
+    ], diretorio)
+    return caminho, 'fluxo_caixa_diario.xlsx', MIMETYPE_XLSX
+
+
+def periodo_comissoes(parametros):
+    """(data_inicio, data_fim) of the comissões filters: the last 90 days by default."""
+    try:
+        data_inicio = _data(parametros.get('data_inicio'))
+        data_fim = _data(parametros.get('data_fim'))
+    except ValueError:
+        data_inicio = data_fim = None
+    if not data_fim:
+        data_fim = datetime.now().date()
+    if not data_inicio:
+        data_inicio = data_fim - timedelta(days=90)
+    return data_inicio, data_fim
+
+
+def arquivo_comissoes(empresa_id, parametros, diretorio=None, progresso=None):
+    data_inicio, data_fim = periodo_comissoes(parametros)
+    resumo_vendedores = ServicoComissoes.obter_resumo_por_vendedor(
+        empresa_id,
+        data_inicio,
+        data_fim,
+        _inteiro(parametros.get('vendedor_id')),
+        _inteiro(parametros.get('cliente_id'))
+    )
+    _avisar(progresso, 50)
+
+    cabecalho = [
+        'Vendedor',
+        'Quantidade de Lançamentos',
+        'Total de Notas',
+        'Total de Repasse',
+        'Total Líquido',
+        'Total de Comissões'
+    ]
+    linhas = (
+        [
+            resumo['vendedor'].nome,
+            resumo['quantidade_lancamentos'],
+            f"{resumo['total_notas']:.2f}".replace('.', ','),
+            f"{resumo['total_repasse']:.2f}".replace('.', ','),
+            f"{resumo['total_liquido']:.2f}".replace('.', ','),
+            f"{resumo['total_comissao']:.2f}".replace('.', ',')
+        ]
+        for resumo in resumo_vendedores
+    )
+    caminho = gerar_csv(cabecalho, linhas, diretorio)
+    return caminho, f'comissoes_{data_inicio}_{data_fim}.csv', MIMETYPE_CSV
+
+
+# Relatórios que podem ser gerados em segundo plano: tipo -> função arquivo_*
+ARQUIVOS = {
+    'balancete': arquivo_balancete,
+    'fluxo-caixa': arquivo_fluxo_caixa,
+    'comissoes': arquivo_comissoes,
+}
@@ -0,0 +1,191 @@
+"""
+Saldos de fechamento mensal por conta bancária
+
+Cada linha guarda o movimento acumulado (recebido - pago) da conta até o fim do
+mês, realizado e previsto, sem o saldo inicial da conta (que pode ser editado
+sem invalidar os fechamentos). O saldo em uma data parte do fechamento mais
+próximo e soma apenas os dias restantes do mês em fluxo_caixa_diario.
+
+Os fechamentos são semeados pela mesma reconstrução do fluxo diário
+(`consolidar_fluxo.py --sem-diario`). Empresa com linhas diárias e nenhum
+fechamento ainda não foi semeada: os ajustes incrementais dão lugar à
+reconstrução e as leituras somam o diário desde o início.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, select, update, insert
+
+from src.models import db, FluxoCaixaDiario, SaldoMensalConta
+
+CAMPOS_SALDO = ('saldo_realizado', 'saldo_previsto')
+
+
+def calcular_saldos_mensais(empresa_id, dias):
+    """Monthly closing rows from per-day movements.
+
+    `dias` yields (conta_banco_id, data, realizado, previsto), the day's
+    recebido - pago of one or more fluxo partitions. Returns the row dicts.
+    """
+    movimento = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00')])
+    for banco, data, realizado, previsto in dias:
+        mes = movimento[(banco, data.replace(day=1))]
+        mes[0] += Decimal(str(realizado or 0))
+        mes[1] += Decimal(str(previsto or 0))
+
+    linhas = []
+    acumulado = {}
+    for banco, mes in sorted(movimento, key=lambda chave: (chave[0] or 0, chave[1])):
+        realizado, previsto = acumulado.get(banco, (Decimal('0.00'), Decimal('0.00')))
+        realizado += movimento[(banco, mes)][0]
+        previsto += movimento[(banco, mes)][1]
+        acumulado[banco] = (realizado, previsto)
+        linhas.append({
+            'empresa_id': empresa_id,
+            'conta_banco_id': banco,
+            'mes': mes,
+            'saldo_realizado': realizado,
+            'saldo_previsto': previsto,
+        })
+    return linhas
+
+
+def reconstruir_saldos_mensais(empresa_id, conta_banco_id=None):
+    """Rebuild the company's monthly closings from the daily table. Does not commit.
+
+    Must run after `reconstruir_fluxo_diario`. Returns the number of rows written.
+    """
+    query = db.session.query(
+        FluxoCaixaDiario.conta_banco_id,
+        FluxoCaixaDiario.data,
+        func.sum(FluxoCaixaDiario.valor_recebido - FluxoCaixaDiario.valor_pago),
+        func.sum(FluxoCaixaDiario.valor_previsto_recebido - FluxoCaixaDiario.valor_previsto_pago),
+    ).filter(FluxoCaixaDiario.empresa_id == empresa_id)
+    if conta_banco_id is not None:
+        query = query.filter(FluxoCaixaDiario.conta_banco_id == conta_banco_id)
+    linhas = calcular_saldos_mensais(
+        empresa_id, query.group_by(FluxoCaixaDiario.conta_banco_id, FluxoCaixaDiario.data)
+    )
+
+    delete = SaldoMensalConta.query.filter_by(empresa_id=empresa_id)
+    if conta_banco_id is not None:
+        delete = delete.filter_by(conta_banco_id=conta_banco_id)
+    delete.delete()
+    if linhas:
+        db.session.execute(insert(SaldoMensalConta), linhas)
+    return len(linhas)
+
+
+def tem_saldo_mensal(empresa_id):
+    """Whether the company has any monthly closing (False before the post-deploy backfill)."""
+    return db.session.query(SaldoMensalConta.id).filter(
+        SaldoMensalConta.empresa_id == empresa_id
+    ).first() is not None
+
+
+def empresas_sem_saldo_mensal(empresa_ids):
+    """Filter `empresa_ids` down to companies with daily rows but no monthly closing."""
+    sem_mensal = db.session.query(FluxoCaixaDiario.empresa_id).filter(
+        FluxoCaixaDiario.empresa_id.in_(empresa_ids),
+        ~select(SaldoMensalConta.id).where(SaldoMensalConta.empresa_id == FluxoCaixaDiario.empresa_id).exists()
+    ).distinct()
+    encontradas = {row[0] for row in sem_mensal}
+    return [empresa_id for empresa_id in empresa_ids if empresa_id in encontradas]
+
+
+def ajustar_saldo_mensal(empresa_id, conta_banco_id, data, campo_saldo, variacao):
+    """Shift the closing of `data`'s month and of every later month by `variacao`. Does not commit."""
+    mes = data.replace(day=1)
+    chave = (SaldoMensalConta.empresa_id == empresa_id, SaldoMensalConta.conta_banco_id == conta_banco_id)
+    row = SaldoMensalConta.query.filter(*chave, SaldoMensalConta.mes == mes).with_for_update().first()
+    if row is None:
+        anterior = SaldoMensalConta.query.filter(*chave, SaldoMensalConta.mes < mes).order_by(
+            SaldoMensalConta.mes.desc()
+        ).first()
+        db.session.add(SaldoMensalConta(
+            empresa_id=empresa_id,
+            conta_banco_id=conta_banco_id,
+            mes=mes,
+            **{campo: getattr(anterior, campo) if anterior else Decimal('0.00') for campo in CAMPOS_SALDO}
+        ))
+        db.session.flush()
+    coluna = getattr(SaldoMensalConta, campo_saldo)
+    db.session.execute(
+        update(SaldoMensalConta)
+        .where(*chave, SaldoMensalConta.mes >= mes)
+        .values({campo_saldo: coluna + variacao}),
+        execution_options={'synchronize_session': False}
+    )
+
+    # Mês sem nenhum dia com movimento não tem fechamento (igual à reconstrução)
+    proximo_mes = (mes + timedelta(days=32)).replace(day=1)
+    tem_movimento = db.session.query(FluxoCaixaDiario.id).filter(
+        FluxoCaixaDiario.empresa_id == empresa_id,
+        FluxoCaixaDiario.conta_banco_id == conta_banco_id,
+        FluxoCaixaDiario.data >= mes,
+        FluxoCaixaDiario.data < proximo_mes
+    ).first()
+    if tem_movimento is None:
+        SaldoMensalConta.query.filter(*chave, SaldoMensalConta.mes == mes).delete(synchronize_session=False)
+
+
+def movimento_ate(empresa_id, data, previsto=False, conta_banco_id=None):
+    """Accumulated movement per conta_banco up to and including `data`.
+
+    Starts from the closing of the month before `data` and replays only the
+    days of `data`'s month. Add `ContaBanco.saldo_inicial` to get the balance.
+    While the company's closings were never seeded, every day up to `data`
+    is summed instead.
+    """
+    if not tem_saldo_mensal(empresa_id):
+        return _movimento_diario(empresa_id, None, data, previsto, conta_banco_id)
+
+    mes = data.replace(day=1)
+    campo_saldo = 'saldo_previsto' if previsto else 'saldo_realizado'
+    filtros = [SaldoMensalConta.empresa_id == empresa_id, SaldoMensalConta.mes < mes]
+    if conta_banco_id:
+        filtros.append(SaldoMensalConta.conta_banco_id == conta_banco_id)
+    ultimo_fechamento = db.session.query(
+        SaldoMensalConta.conta_banco_id,
+        func.max(SaldoMensalConta.mes).label('mes')
+    ).filter(*filtros).group_by(SaldoMensalConta.conta_banco_id).subquery()
+    fechamentos = db.session.query(
+        SaldoMensalConta.conta_banco_id,
+        getattr(SaldoMensalConta, campo_saldo)
+    ).join(
+        ultimo_fechamento,
+        (ultimo_fechamento.c.conta_banco_id == SaldoMensalConta.conta_banco_id) &
+        (ultimo_fechamento.c.mes == SaldoMensalConta.mes)
+    ).filter(SaldoMensalConta.empresa_id == empresa_id)
+
+    movimento = _movimento_diario(empresa_id, mes, data, previsto, conta_banco_id)
+    for banco, saldo in fechamentos:
+        movimento[banco] = movimento.get(banco, Decimal('0.00')) + Decimal(str(saldo or 0))
+    return movimento
+
+
+def _movimento_diario(empresa_id, inicio, fim, previsto, conta_banco_id):
+    """Summed daily movement per conta_banco between `inicio` (None: from the first day) and `fim`."""
+    if previsto:
+        valor = FluxoCaixaDiario.valor_previsto_recebido - FluxoCaixaDiario.valor_previsto_pago
+    else:
+        valor = FluxoCaixaDiario.valor_recebido - FluxoCaixaDiario.valor_pago
+    dias = db.session.query(FluxoCaixaDiario.conta_banco_id, func.sum(valor)).filter(
+        FluxoCaixaDiario.empresa_id == empresa_id,
+        FluxoCaixaDiario.data <= fim
+    )
+    if inicio is not None:
+        dias = dias.filter(FluxoCaixaDiario.data >= inicio)
+    if conta_banco_id:
+        dias = dias.filter(FluxoCaixaDiario.conta_banco_id == conta_banco_id)
+    movimento = defaultdict(lambda: Decimal('0.00'))
+    for banco, soma in dias.group_by(FluxoCaixaDiario.conta_banco_id):
+        movimento[banco] += Decimal(str(soma or 0))
+    return dict(movimento)
+
+
+def movimento_antes_de(empresa_id, data, previsto=False, conta_banco_id=None):
+    """Accumulated movement per conta_banco strictly before `data` (opening of a period)."""
+    return movimento_ate(empresa_id, data - timedelta(days=1), previsto, conta_banco_id)
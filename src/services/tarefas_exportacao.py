@@ -0,0 +1,214 @@
+"""
+Exportações em segundo plano - relatórios grandes gerados fora da requisição
+
+A tela registra a exportação (tipo + filtros) e o worker (`python worker.py`)
+gera o arquivo, atualizando o progresso; o usuário acompanha em
+/relatorios/exportacoes e baixa o arquivo quando pronto. O arquivo fica no
+banco (partes_exportacao, em blocos de TAMANHO_PARTE), que web e worker
+enxergam mesmo em contêineres separados. Arquivos concluídos expiram após
+EXPORTACAO_VALIDADE_HORAS.
+
+Cada empresa tem no máximo EXPORTACAO_MAX_FILA_POR_EMPRESA exportações
+pendentes ou em andamento e o worker executa no máximo
+EXPORTACAO_CONCORRENCIA_POR_EMPRESA de cada empresa ao mesmo tempo, para que
+um cliente não ocupe todos os workers.
+"""
+
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+
+from src.models import db, Empresa, TarefaExportacao, ParteExportacao
+from src.services.relatorios import ARQUIVOS
+
+logger = logging.getLogger(__name__)
+
+STATUS_ATIVOS = ('pendente', 'processando')
+
+# Bytes por linha de partes_exportacao (abaixo do max_allowed_packet padrão do MySQL)
+TAMANHO_PARTE = 1024 * 1024
+
+
+class LimiteExportacoes(Exception):
+    """The company already has the maximum number of queued exports."""
+
+
+def solicitar_exportacao(empresa_id, user_id, tipo, parametros):
+    """Queue an export of `tipo` with the screen filters and commit. Returns the job."""
+    if tipo not in ARQUIVOS:
+        raise ValueError(f'Exportação desconhecida: {tipo}')
+    limite = current_app.config.get('EXPORTACAO_MAX_FILA_POR_EMPRESA', 5)
+    ativas = TarefaExportacao.query.filter(
+        TarefaExportacao.empresa_id == empresa_id,
+        TarefaExportacao.status.in_(STATUS_ATIVOS)
+    ).count()
+    if ativas >= limite:
+        raise LimiteExportacoes(f'Já existem {ativas} exportações em andamento. Aguarde a conclusão.')
+
+    tarefa = TarefaExportacao(
+        empresa_id=empresa_id,
+        user_id=user_id,
+        tipo=tipo,
+        parametros=json.dumps(dict(parametros), sort_keys=True),
+    )
+    db.session.add(tarefa)
+    db.session.commit()
+    return tarefa
+
+
+def processar_exportacoes(limite=1):
+    """Run up to `limite` queued exports, oldest first. Returns the ids processed.
+
+    Companies already running EXPORTACAO_CONCORRENCIA_POR_EMPRESA exports are
+    skipped until one finishes, so the next company's jobs go first.
+    """
+    pendentes = db.session.query(TarefaExportacao.id, TarefaExportacao.empresa_id).filter(
+        TarefaExportacao.status == 'pendente'
+    ).order_by(TarefaExportacao.criado_em.asc(), TarefaExportacao.id.asc()).limit(100).all()
+    db.session.commit()
+
+    processadas = []
+    for tarefa_id, empresa_id in pendentes:
+        if len(processadas) >= limite:
+            break
+        if not _reservar(tarefa_id, empresa_id):
+            continue
+        _executar(tarefa_id)
+        processadas.append(tarefa_id)
+    return processadas
+
+
+def _reservar(tarefa_id, empresa_id):
+    """Claim a pending job unless its company is at the concurrency limit."""
+    concorrencia = current_app.config.get('EXPORTACAO_CONCORRENCIA_POR_EMPRESA', 1)
+    # O lock na linha da empresa serializa a reserva entre workers
+    Empresa.query.filter_by(id=empresa_id).with_for_update().first()
+    em_execucao = TarefaExportacao.query.filter_by(empresa_id=empresa_id, status='processando').count()
+    if em_execucao >= concorrencia:
+        db.session.commit()
+        return False
+    resultado = db.session.execute(
+        update(TarefaExportacao)
+        .where(TarefaExportacao.id == tarefa_id, TarefaExportacao.status == 'pendente')
+        .values(status='processando', iniciado_em=datetime.utcnow(), progresso=0)
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def _atualizar(tarefa_id, **valores):
+    # Conexão própria: o progresso aparece para a tela sem encerrar a transação do relatório
+    with db.engine.begin() as conexao:
+        conexao.execute(update(TarefaExportacao).where(TarefaExportacao.id == tarefa_id).values(**valores))
+
+
+def _executar(tarefa_id):
+    tarefa = db.session.get(TarefaExportacao, tarefa_id)
+    empresa_id, tipo, parametros = tarefa.empresa_id, tarefa.tipo, json.loads(tarefa.parametros or '{}')
+    db.session.commit()
+
+    caminho = None
+    try:
+        caminho, nome_arquivo, mimetype = ARQUIVOS[tipo](
+            empresa_id, parametros, progresso=lambda percentual: _atualizar(tarefa_id, progresso=percentual)
+        )
+        db.session.commit()
+        _gravar_partes(tarefa_id, caminho)
+    except Exception as exc:
+        db.session.rollback()
+        logger.exception('Erro na exportação %s (%s) da empresa %s: %s', tarefa_id, tipo, empresa_id, exc)
+        _atualizar(tarefa_id, status='erro', erro=str(exc), concluido_em=datetime.utcnow())
+        return
+    finally:
+        if caminho and os.path.exists(caminho):
+            os.remove(caminho)
+
+    agora = datetime.utcnow()
+    validade = timedelta(hours=current_app.config.get('EXPORTACAO_VALIDADE_HORAS', 24))
+    _atualizar(
+        tarefa_id, status='concluida', progresso=100, nome_arquivo=nome_arquivo,
+        mimetype=mimetype, concluido_em=agora, expira_em=agora + validade
+    )
+
+
+def _gravar_partes(tarefa_id, caminho):
+    """Copy the generated file into partes_exportacao, one chunk per row, in a single transaction."""
+    with open(caminho, 'rb') as arquivo:
+        ordem = 0
+        while True:
+            dados = arquivo.read(TAMANHO_PARTE)
+            if not dados:
+                break
+            db.session.execute(insert(ParteExportacao).values(tarefa_id=tarefa_id, ordem=ordem, dados=dados))
+            ordem += 1
+    db.session.commit()
+
+
+def ler_arquivo(tarefa_id):
+    """Yield the stored file of a finished job chunk by chunk, one row per query."""
+    ordem = 0
+    while True:
+        dados = db.session.execute(
+            select(ParteExportacao.dados).where(
+                ParteExportacao.tarefa_id == tarefa_id, ParteExportacao.ordem == ordem
+            )
+        ).scalar()
+        if dados is None:
+            return
+        yield dados
+        ordem += 1
+
+
+def tem_arquivo(tarefa_id):
+    return db.session.query(ParteExportacao.id).filter_by(tarefa_id=tarefa_id).first() is not None
+
+
+def limpar_exportacoes():
+    """Delete expired files and fail jobs left running by a dead worker. Returns the jobs touched."""
+    agora = datetime.utcnow()
+    expiradas = TarefaExportacao.query.filter(
+        TarefaExportacao.status == 'concluida',
+        TarefaExportacao.expira_em < agora
+    ).all()
+    if expiradas:
+        db.session.execute(
+            delete(ParteExportacao).where(ParteExportacao.tarefa_id.in_([tarefa.id for tarefa in expiradas]))
+        )
+    for tarefa in expiradas:
+        tarefa.status = 'expirada'
+
+    tempo_maximo = timedelta(seconds=current_app.config.get('EXPORTACAO_TEMPO_MAXIMO_SEGUNDOS', 3600))
+    interrompidas = TarefaExportacao.query.filter(
+        TarefaExportacao.status == 'processando',
+        TarefaExportacao.iniciado_em < agora - tempo_maximo
+    ).all()
+    for tarefa in interrompidas:
+        tarefa.status = 'erro'
+        tarefa.erro = 'Exportação interrompida'
+        tarefa.concluido_em = agora
+    db.session.commit()
+    return len(expiradas) + len(interrompidas)
+
+
+def exportacoes_do_usuario(empresa_id, user_id, limite=20):
+    return TarefaExportacao.query.filter_by(empresa_id=empresa_id, user_id=user_id).order_by(
+        TarefaExportacao.criado_em.desc(), TarefaExportacao.id.desc()
+    ).limit(limite).all()
+
+
+def situacao(tarefa):
+    """JSON-friendly status of a job for the polling screen."""
+    return {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'progresso': tarefa.progresso,
+        'erro': tarefa.erro,
+        'nome_arquivo': tarefa.nome_arquivo,
+        'criado_em': tarefa.criado_em.isoformat() if tarefa.criado_em else None,
+        'expira_em': tarefa.expira_em.isoformat() if tarefa.expira_em else None,
+    }
@@ -0,0 +1,289 @@
+"""
+Verificação do consolidado do fluxo de caixa contra os lançamentos
+
+Para cada partição (empresa, fluxo_conta, conta_banco) calcula, no banco, as
+somas e datas que o consolidado deveria conter a partir dos lançamentos e as
+compara com as das tabelas consolidadas (realizado, previsto e diário). No
+diário, os dois lados são resumidos no banco por partição: quantidade de dias,
+somas dos valores, primeiro/último dia e a soma dos saldos acumulados, que
+muda quando um UPDATE incremental desloca o saldo de dias errados. Só os
+agregados chegam à aplicação; as partições divergentes são reconsolidadas.
+
+Os fechamentos mensais (saldos_mensais_conta), deslocados a cada commit por
+`ajustar_saldo_mensal`, são conferidos por conta bancária contra os dias do
+diário (já verificado) e reconstruídos quando divergem.
+"""
+
+from decimal import Decimal
+import hashlib
+import logging
+
+from sqlalchemy import func, case, select, literal, union_all, and_, or_
+
+from src.models import (
+    db, Lancamento, FluxoContaModel, ContaBanco,
+    FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta
+)
+from src.services.fluxo_consolidado import reconsolidar_particao
+from src.services.fluxo_diario import suporta_funcoes_janela
+from src.services.saldo_mensal import calcular_saldos_mensais, reconstruir_saldos_mensais
+
+logger = logging.getLogger(__name__)
+
+CENTAVO = Decimal('0.01')
+
+def _valor(valor):
+    return Decimal(str(valor or 0)).quantize(CENTAVO)
+
+
+def _digest(componentes):
+    return hashlib.sha1(repr(componentes).encode('utf-8')).hexdigest()
+
+
+def _resumo_diario(row):
+    """Normalize one (count, 4 sums, 2 saldo sums, min, max) daily aggregate row."""
+    quantidade, *somas, primeiro, ultimo = row
+    return (quantidade, *(_valor(soma) for soma in somas), str(primeiro), str(ultimo))
+
+
+def _dias_lancamentos(empresa_id):
+    """Per (fluxo_conta, conta_banco, data) totals the daily table should hold, as a subquery.
+
+    Mirrors `calcular_fluxo_diario`: realizado by data_pagamento of paid
+    lancamentos, previsto by every data_vencimento, days with no value left out.
+    """
+    despesa = FluxoContaModel.tipo == 'P'
+    valor_pago = func.coalesce(Lancamento.valor_pago, 0)
+    valor_real = func.coalesce(Lancamento.valor_real, 0)
+
+    def movimentos(coluna_data, pago, recebido, previsto_pago, previsto_recebido, *filtro):
+        return select(
+            Lancamento.fluxo_conta_id.label('fluxo_conta_id'),
+            Lancamento.conta_banco_id.label('conta_banco_id'),
+            coluna_data.label('data'),
+            pago.label('valor_pago'),
+            recebido.label('valor_recebido'),
+            previsto_pago.label('valor_previsto_pago'),
+            previsto_recebido.label('valor_previsto_recebido'),
+        ).select_from(Lancamento).outerjoin(
+            FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+        ).where(Lancamento.empresa_id == empresa_id, coluna_data.isnot(None), *filtro)
+
+    todos = union_all(
+        movimentos(
+            Lancamento.data_pagamento,
+            case((despesa, valor_pago), else_=0), case((despesa, 0), else_=valor_pago), literal(0), literal(0),
+            Lancamento.status == 'pago',
+        ),
+        movimentos(
+            Lancamento.data_vencimento,
+            literal(0), literal(0), case((despesa, valor_real), else_=0), case((despesa, 0), else_=valor_real),
+        ),
+    ).subquery()
+    somas = [
+        func.sum(getattr(todos.c, campo)).label(campo)
+        for campo in ('valor_pago', 'valor_recebido', 'valor_previsto_pago', 'valor_previsto_recebido')
+    ]
+    return select(
+        todos.c.fluxo_conta_id, todos.c.conta_banco_id, todos.c.data, *somas
+    ).group_by(
+        todos.c.fluxo_conta_id, todos.c.conta_banco_id, todos.c.data
+    ).having(or_(*(soma != 0 for soma in somas))).subquery()
+
+
+def _acumulados(dias):
+    """Add the running saldo_realizado/saldo_previsto of each day to the `dias` subquery."""
+    realizado = dias.c.valor_recebido - dias.c.valor_pago
+    previsto = dias.c.valor_previsto_recebido - dias.c.valor_previsto_pago
+    if suporta_funcoes_janela():
+        janela = dict(partition_by=(dias.c.fluxo_conta_id, dias.c.conta_banco_id), order_by=dias.c.data)
+        return select(
+            dias,
+            func.sum(realizado).over(**janela).label('saldo_realizado'),
+            func.sum(previsto).over(**janela).label('saldo_previsto'),
+        ).subquery()
+
+    # Sem funções de janela: autojunção com os dias anteriores da partição
+    anteriores = dias.alias()
+    return select(
+        dias,
+        func.sum(anteriores.c.valor_recebido - anteriores.c.valor_pago).label('saldo_realizado'),
+        func.sum(anteriores.c.valor_previsto_recebido - anteriores.c.valor_previsto_pago).label('saldo_previsto'),
+    ).join(anteriores, and_(
+        anteriores.c.fluxo_conta_id == dias.c.fluxo_conta_id,
+        anteriores.c.conta_banco_id == dias.c.conta_banco_id,
+        anteriores.c.data <= dias.c.data,
+    )).group_by(*dias.c).subquery()
+
+
+def _agregado_diario(tabela):
+    """Per-partition daily checksum columns over a table/subquery with the fluxo_caixa_diario columns."""
+    return (
+        tabela.c.fluxo_conta_id,
+        tabela.c.conta_banco_id,
+        func.count(),
+        func.sum(tabela.c.valor_pago),
+        func.sum(tabela.c.valor_recebido),
+        func.sum(tabela.c.valor_previsto_pago),
+        func.sum(tabela.c.valor_previsto_recebido),
+        func.sum(tabela.c.saldo_realizado),
+        func.sum(tabela.c.saldo_previsto),
+        func.min(tabela.c.data),
+        func.max(tabela.c.data),
+    )
+
+
+def checksums_lancamentos(empresa_id):
+    """Expected checksum components per (fluxo_conta_id, conta_banco_id), from `lancamentos`."""
+    despesa = FluxoContaModel.tipo == 'P'
+    # Sem conta de fluxo (ou tipo diferente de 'P') o lançamento conta como recebimento
+    receita = or_(FluxoContaModel.tipo.is_(None), FluxoContaModel.tipo != 'P')
+    pago = Lancamento.status == 'pago'
+    valor_pago = func.coalesce(Lancamento.valor_pago, 0)
+    valor_real = func.coalesce(Lancamento.valor_real, 0)
+
+    def soma(condicao, valor):
+        return func.sum(case((condicao, valor), else_=0))
+
+    rows = db.session.query(
+        Lancamento.fluxo_conta_id,
+        Lancamento.conta_banco_id,
+        func.max(func.coalesce(ContaBanco.saldo_inicial, 0)),
+        # Consolidado realizado (pagos) e previsto (demais status)
+        soma(pago, 1),
+        soma(and_(pago, despesa), valor_pago),
+        soma(and_(pago, receita), valor_pago),
+        func.max(case((pago, func.coalesce(Lancamento.data_pagamento, Lancamento.data_evento)))),
+        soma(~pago, 1),
+        soma(and_(~pago, despesa), valor_real),
+        soma(and_(~pago, receita), valor_real),
+        func.max(case((~pago, func.coalesce(Lancamento.data_vencimento, Lancamento.data_evento)))),
+    ).select_from(Lancamento).outerjoin(
+        FluxoContaModel, FluxoContaModel.id == Lancamento.fluxo_conta_id
+    ).outerjoin(
+        ContaBanco, ContaBanco.id == Lancamento.conta_banco_id
+    ).filter(
+        Lancamento.empresa_id == empresa_id
+    ).group_by(Lancamento.fluxo_conta_id, Lancamento.conta_banco_id)
+
+    # Diário: dias recalculados e acumulados no banco, resumidos por partição
+    acumulados = _acumulados(_dias_lancamentos(empresa_id))
+    diario = {
+        (row[0], row[1]): _resumo_diario(row[2:])
+        for row in db.session.execute(
+            select(*_agregado_diario(acumulados)).group_by(acumulados.c.fluxo_conta_id, acumulados.c.conta_banco_id)
+        )
+    }
+
+    esperado = {}
+    for fluxo, banco, saldo_inicial, pagos, pago_p, pago_r, data_r, abertos, prev_p, prev_r, data_p in rows:
+        saldo_inicial = _valor(saldo_inicial)
+        realizado = previsto = None
+        if pagos:
+            realizado = (_valor(pago_p), _valor(pago_r), str(data_r), saldo_inicial + _valor(pago_r) - _valor(pago_p), 1)
+        if abertos:
+            previsto = (_valor(prev_p), _valor(prev_r), str(data_p), saldo_inicial + _valor(prev_r) - _valor(prev_p), 1)
+        esperado[(fluxo, banco)] = (realizado, previsto, diario.get((fluxo, banco)))
+    return esperado
+
+
+def checksums_consolidado(empresa_id):
+    """Stored checksum components per (fluxo_conta_id, conta_banco_id), from the consolidated tables."""
+    def por_particao(modelo, colunas):
+        return {
+            (row[0], row[1]): row[2:]
+            for row in db.session.query(
+                modelo.fluxo_conta_id, modelo.conta_banco_id, *colunas
+            ).filter(modelo.empresa_id == empresa_id).group_by(modelo.fluxo_conta_id, modelo.conta_banco_id)
+        }
+
+    realizado = por_particao(FluxoCaixaRealizado, [
+        func.sum(FluxoCaixaRealizado.valor_pago), func.sum(FluxoCaixaRealizado.valor_recebido),
+        func.max(FluxoCaixaRealizado.data), func.sum(FluxoCaixaRealizado.saldo_atual), func.count(FluxoCaixaRealizado.id),
+    ])
+    previsto = por_particao(FluxoCaixaPrevisto, [
+        func.sum(FluxoCaixaPrevisto.valor_previsto_pago), func.sum(FluxoCaixaPrevisto.valor_previsto_recebido),
+        func.max(FluxoCaixaPrevisto.data), func.sum(FluxoCaixaPrevisto.saldo_previsto), func.count(FluxoCaixaPrevisto.id),
+    ])
+    tabela = FluxoCaixaDiario.__table__
+    diario = {
+        (row[0], row[1]): _resumo_diario(row[2:])
+        for row in db.session.execute(
+            select(*_agregado_diario(tabela))
+            .where(tabela.c.empresa_id == empresa_id)
+            .group_by(tabela.c.fluxo_conta_id, tabela.c.conta_banco_id)
+        )
+    }
+
+    armazenado = {}
+    for chave in set(realizado) | set(previsto) | set(diario):
+        r, p = realizado.get(chave), previsto.get(chave)
+        armazenado[chave] = (
+            (_valor(r[0]), _valor(r[1]), str(r[2]), _valor(r[3]), r[4]) if r else None,
+            (_valor(p[0]), _valor(p[1]), str(p[2]), _valor(p[3]), p[4]) if p else None,
+            diario.get(chave),
+        )
+    return armazenado
+
+
+def verificar_consolidado(empresa_id, corrigir=False):
+    """Compare per-partition digests and return the divergent (fluxo_conta_id, conta_banco_id) keys.
+
+    With `corrigir`, each divergent partition is reconsolidated on its own.
+    """
+    esperado = {chave: _digest(valor) for chave, valor in checksums_lancamentos(empresa_id).items()}
+    armazenado = {chave: _digest(valor) for chave, valor in checksums_consolidado(empresa_id).items()}
+    db.session.commit()
+
+    divergentes = sorted(
+        (chave for chave in set(esperado) | set(armazenado) if esperado.get(chave) != armazenado.get(chave)),
+        key=lambda chave: (chave[0] or 0, chave[1] or 0)
+    )
+    for fluxo_conta_id, conta_banco_id in divergentes:
+        logger.warning(
+            'Consolidado divergente: empresa=%s fluxo_conta=%s conta_banco=%s',
+            empresa_id, fluxo_conta_id, conta_banco_id
+        )
+        if corrigir:
+            reconsolidar_particao(empresa_id, fluxo_conta_id, conta_banco_id)
+    return divergentes
+
+
+def verificar_saldos_mensais(empresa_id, corrigir=False):
+    """Compare each monthly closing with the one recomputed from the daily table; return the divergent conta_banco ids.
+
+    The daily rows are the reference, so run it after `verificar_consolidado`
+    has repaired them. With `corrigir`, the closings of each divergent conta
+    bancária are rebuilt.
+    """
+    dias = db.session.query(
+        FluxoCaixaDiario.conta_banco_id,
+        FluxoCaixaDiario.data,
+        func.sum(FluxoCaixaDiario.valor_recebido - FluxoCaixaDiario.valor_pago),
+        func.sum(FluxoCaixaDiario.valor_previsto_recebido - FluxoCaixaDiario.valor_previsto_pago),
+    ).filter(
+        FluxoCaixaDiario.empresa_id == empresa_id
+    ).group_by(FluxoCaixaDiario.conta_banco_id, FluxoCaixaDiario.data)
+    esperado = {}
+    for linha in calcular_saldos_mensais(empresa_id, dias):
+        esperado.setdefault(linha['conta_banco_id'], []).append(
+            (str(linha['mes']), _valor(linha['saldo_realizado']), _valor(linha['saldo_previsto']))
+        )
+    armazenado = {}
+    for banco, mes, realizado, previsto in db.session.query(
+        SaldoMensalConta.conta_banco_id, SaldoMensalConta.mes,
+        SaldoMensalConta.saldo_realizado, SaldoMensalConta.saldo_previsto
+    ).filter(SaldoMensalConta.empresa_id == empresa_id).order_by(SaldoMensalConta.mes):
+        armazenado.setdefault(banco, []).append((str(mes), _valor(realizado), _valor(previsto)))
+    db.session.commit()
+
+    divergentes = sorted(
+        (banco for banco in set(esperado) | set(armazenado) if esperado.get(banco) != armazenado.get(banco)),
+        key=lambda banco: banco or 0
+    )
+    for conta_banco_id in divergentes:
+        logger.warning('Saldos mensais divergentes: empresa=%s conta_banco=%s', empresa_id, conta_banco_id)
+        if corrigir:
+            reconstruir_saldos_mensais(empresa_id, conta_banco_id)
+            db.session.commit()
+    return divergentes
@@ -0,0 +1,123 @@
+"""
+Versão dos dados por empresa e GET condicional (ETag)
+
+`empresas.versao_dados` é incrementado na mesma transação de qualquer commit
+que altere as tabelas financeiras da empresa. As telas de leitura decoradas
+com `condicional_por_versao` respondem 304 quando o ETag enviado pelo
+navegador (ou pelo proxy) corresponde à versão atual, sem consultar nem
+renderizar nada. Downloads e exportações (anexos) não são decorados: um 304
+não daria ao navegador nada para salvar.
+
+O incremento é um UPDATE simples de `versao_dados`, sem passar pelo
+`atualizado_em` da empresa. Tabelas de controle (fila de consolidação,
+exportações) não versionam: não mudam o que as telas exibem.
+
+UPDATE/DELETE em massa (`query.update()`/`query.delete()`) não passam pela
+unidade de trabalho: quem os usar deve chamar `incrementar_versao`.
+"""
+
+from datetime import date
+from functools import wraps
+import hashlib
+import os
+
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from sqlalchemy import bindparam, event, text
+
+from src.models import (
+    db, Empresa, Lancamento, ContaBanco, FluxoContaModel, Entidade,
+    FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta
+)
+from src.services.coleta_empresas import registrar_coleta, empresas_coletadas
+
+CHAVE_INFO = 'empresas_versionadas'
+
+# Tabelas cujas alterações mudam o que os relatórios e o dashboard exibem
+MODELOS_VERSIONADOS = (
+    Lancamento, ContaBanco, FluxoContaModel, Entidade,
+    FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta,
+)
+
+# Sem o ORM: o onupdate de empresas.atualizado_em não entra no SET
+_SQL_INCREMENTAR = text(
+    'UPDATE empresas SET versao_dados = versao_dados + 1 WHERE id IN :empresa_ids'
+).bindparams(bindparam('empresa_ids', expanding=True))
+
+_versao_aplicacao = None
+
+
+def versao_dados(empresa_id):
+    return db.session.query(Empresa.versao_dados).filter(Empresa.id == empresa_id).scalar() or 0
+
+
+def incrementar_versao(empresa_ids):
+    """Bump the data version of the companies within the current transaction. Does not commit."""
+    db.session.execute(_SQL_INCREMENTAR, {'empresa_ids': sorted(empresa_ids)})
+
+
+def registrar_eventos_versao():
+    """Attach the version hooks to the application session (idempotent).
+
+    Must be registered after the consolidation hooks, so the consolidated rows
+    they write in before_commit are flushed (and counted) here.
+    """
+    registrar_coleta(CHAVE_INFO, MODELOS_VERSIONADOS)
+    if not event.contains(db.session, 'before_commit', _incrementar_versoes):
+        event.listen(db.session, 'before_commit', _incrementar_versoes)
+
+
+def _incrementar_versoes(session):
+    session.flush()
+    empresas = empresas_coletadas(session, CHAVE_INFO)
+    if empresas:
+        incrementar_versao(empresas)
+
+
+def _versao_aplicacao_atual():
+    # Um deploy novo (VERSION.txt) muda os templates: invalida os ETags antigos
+    global _versao_aplicacao
+    if _versao_aplicacao is None:
+        caminho = os.path.join(os.path.dirname(current_app.root_path), 'VERSION.txt')
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                _versao_aplicacao = arquivo.readline().strip()
+        except OSError:
+            _versao_aplicacao = ''
+    return _versao_aplicacao
+
+
+def etag_requisicao(empresa_id):
+    """ETag of the current GET: tenant data version, user, day, URL and app version."""
+    componentes = (
+        empresa_id,
+        versao_dados(empresa_id),
+        current_user.id,
+        current_user.dashboard_chart_days,
+        date.today().isoformat(),
+        request.full_path,
+        _versao_aplicacao_atual(),
+    )
+    return hashlib.sha1(repr(componentes).encode('utf-8')).hexdigest()
+
+
+def condicional_por_versao(view):
+    """Answer GETs with 304 Not Modified while the tenant's data version is unchanged."""
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        # Mensagens flash pendentes são consumidas pela renderização: não pode haver 304
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        etag = etag_requisicao(current_user.empresa_id)
+        if request.if_none_match.contains_weak(etag):
+            resposta = make_response('', 304)
+        else:
+            resposta = make_response(view(*args, **kwargs))
+            if resposta.status_code != 200:
+                return resposta
+        resposta.set_etag(etag, weak=True)
+        # O navegador sempre revalida; a resposta é por usuário
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+        return resposta
+    return decorated
@@ -0,0 +1,246 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import update
+
+from src.app import create_app
+from src.models import db, Empresa, User, Entidade, FluxoContaModel, ContaBanco, Lancamento
+from src.services.dashboard import indicadores_dashboard, widget_kpis
+from src.services.dashboard_cache import CacheSqlite, estatisticas_cache
+from src.services.fila_consolidacao import solicitar_consolidacao
+
+
+class DashboardTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app('testing')
+        cls.app.config['WTF_CSRF_ENABLED'] = False
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        empresa = Empresa(nome='Empresa Dashboard', cnpj='44444444000144')
+        outra = Empresa(nome='Outra Empresa', cnpj='55555555000155')
+        db.session.add_all([empresa, outra])
+        db.session.flush()
+
+        user = User(
+            empresa_id=empresa.id,
+            username='financeiro',
+            email='dashboard@test.local',
+            full_name='User Dashboard',
+            is_active=True,
+            is_admin=True,
+        )
+        user.set_password('123456')
+        db.session.add(user)
+
+        despesa = FluxoContaModel(empresa_id=empresa.id, codigo='2.1', descricao='Despesa', tipo='P', ativo=True)
+        receita = FluxoContaModel(empresa_id=empresa.id, codigo='1.1', descricao='Receita', tipo='R', ativo=True)
+        receita_outra = FluxoContaModel(empresa_id=outra.id, codigo='1.1', descricao='Receita', tipo='R', ativo=True)
+        db.session.add_all([despesa, receita, receita_outra])
+        db.session.flush()
+
+        banco = ContaBanco(
+            empresa_id=empresa.id, nome='Banco', banco='B1', agencia='0001',
+            numero_conta='111', ativo=True, saldo_inicial=1000,
+        )
+        banco_inativo = ContaBanco(
+            empresa_id=empresa.id, nome='Inativo', banco='B2', agencia='0002',
+            numero_conta='222', ativo=False, saldo_inicial=300,
+        )
+        banco_outra = ContaBanco(
+            empresa_id=outra.id, nome='Banco', banco='B3', agencia='0003',
+            numero_conta='333', ativo=True, saldo_inicial=5000,
+        )
+        entidade = Entidade(empresa_id=empresa.id, tipo='C', cnpj_cpf='00000000000004', nome='Cliente', ativo=True)
+        entidade_outra = Entidade(empresa_id=outra.id, tipo='C', cnpj_cpf='00000000000005', nome='Cliente', ativo=True)
+        db.session.add_all([banco, banco_inativo, banco_outra, entidade, entidade_outra])
+        db.session.flush()
+
+        hoje = date.today()
+        dados = [
+            # (empresa, fluxo, banco, entidade, vencimento, pagamento, valor)
+            (empresa.id, despesa.id, banco.id, entidade.id, hoje, None, 100),
+            (empresa.id, despesa.id, banco.id, entidade.id, hoje - timedelta(days=3), None, 40),
+            (empresa.id, despesa.id, banco.id, entidade.id, hoje + timedelta(days=5), None, 70),
+            (empresa.id, receita.id, banco.id, entidade.id, hoje, None, 250),
+            (empresa.id, receita.id, banco.id, entidade.id, hoje, hoje, 90),
+            (empresa.id, despesa.id, banco_inativo.id, entidade.id, hoje - timedelta(days=1), hoje, 30),
+            (outra.id, receita_outra.id, banco_outra.id, entidade_outra.id, hoje, None, 999),
+        ]
+        for numero, (empresa_id, fluxo, conta, entidade_id, vencimento, pagamento, valor) in enumerate(dados):
+            db.session.add(Lancamento(
+                empresa_id=empresa_id,
+                data_evento=hoje - timedelta(days=numero),
+                data_vencimento=vencimento,
+                data_pagamento=pagamento,
+                status='pago' if pagamento else 'aberto',
+                fluxo_conta_id=fluxo,
+                conta_banco_id=conta,
+                entidade_id=entidade_id,
+                valor_real=valor,
+                valor_pago=valor if pagamento else 0,
+                numero_documento=f'DASH-{numero}',
+            ))
+        db.session.commit()
+
+        cls.empresa_id = empresa.id
+        cls.hoje = hoje
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.ctx.pop()
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        response = self.client.post(
+            '/auth/login',
+            data={'empresa_cnpj': '44444444000144', 'username': 'financeiro', 'password': '123456'},
+            follow_redirects=True,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_indicadores_em_uma_consulta(self):
+        indicadores = indicadores_dashboard(self.empresa_id, self.hoje, 30)
+
+        self.assertEqual(indicadores['contas_pagar_aberto'], 2)
+        self.assertEqual(indicadores['contas_receber_aberto'], 1)
+        self.assertEqual(indicadores['total_entidades'], 1)
+        self.assertEqual(indicadores['total_contas_banco'], 1)
+        self.assertEqual(indicadores['saldo_inicial_contas'], Decimal('1000'))
+        self.assertEqual(indicadores['pagar_previsto_hoje'], Decimal('100'))
+        self.assertEqual(indicadores['receber_previsto_hoje'], Decimal('340'))
+        # Pagos de qualquer conta: +90 recebido, -30 pago
+        self.assertEqual(indicadores['movimento_pago'], Decimal('60'))
+        # Consolidado: previsto do período a partir de hoje e realizado do mês
+        self.assertEqual(indicadores['previsto_a_pagar'], Decimal('210'))
+        self.assertEqual(indicadores['previsto_a_receber'], Decimal('250'))
+        self.assertEqual(indicadores['total_pago_mes'], Decimal('30'))
+        self.assertEqual(indicadores['total_recebido_mes'], Decimal('90'))
+
+    def test_dashboard_renderiza(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/dashboard/api/WIDGET', response.get_data(as_text=True))
+
+    def test_api_widgets(self):
+        kpis = self.client.get('/dashboard/api/kpis').get_json()
+        self.assertEqual(kpis['saldo_total'], '1060.00')
+        self.assertEqual(kpis['contas_pagar_aberto'], 2)
+
+        mes = self.client.get('/dashboard/api/mes').get_json()
+        self.assertEqual(mes, {'total_pago_mes': '30.00', 'total_recebido_mes': '90.00'})
+
+        grafico = self.client.get('/dashboard/api/grafico').get_json()
+        self.assertEqual(grafico['agrupamento'], 'dia')
+        self.assertEqual(len(grafico['grafico_labels']), 30)
+        self.assertEqual(grafico['grafico_realizado'][-1], 120.0)
+        self.assertEqual(grafico['grafico_previsto'][-1], 440.0)
+
+        semanal = self.client.get('/dashboard/api/grafico?agrupamento=semana').get_json()
+        self.assertEqual(len(semanal['grafico_labels']), 5)
+        self.assertEqual(sum(semanal['grafico_previsto']), sum(grafico['grafico_previsto']))
+        self.assertEqual(sum(semanal['grafico_realizado']), sum(grafico['grafico_realizado']))
+
+        ultimos = self.client.get('/dashboard/api/ultimos-lancamentos').get_json()['lancamentos']
+        self.assertEqual([l['numero_documento'] for l in ultimos][:2], ['DASH-0', 'DASH-1'])
+        self.assertEqual(ultimos[0]['data_evento'], self.hoje.isoformat())
+        self.assertEqual(len(ultimos), 6)
+
+        self.assertEqual(self.client.get('/dashboard/api/inexistente').status_code, 404)
+
+    def test_cache_invalidado_no_commit(self):
+        kpis = widget_kpis(self.empresa_id, self.hoje, 30)
+        antes = estatisticas_cache()
+        self.assertEqual(widget_kpis(self.empresa_id, self.hoje, 30), kpis)
+        self.assertEqual(estatisticas_cache()['hits'], antes['hits'] + 1)
+
+        lancamento = Lancamento.query.filter_by(numero_documento='DASH-0').one()
+        lancamento.valor_real = 150
+        db.session.commit()
+        try:
+            atualizado = widget_kpis(self.empresa_id, self.hoje, 30)
+            self.assertEqual(atualizado['pagar_previsto_hoje'], Decimal('150'))
+            self.assertEqual(estatisticas_cache()['misses'], antes['misses'] + 1)
+        finally:
+            lancamento.valor_real = 100
+            db.session.commit()
+
+    def test_cache_segue_a_versao_dos_dados_de_outro_processo(self):
+        kpis = widget_kpis(self.empresa_id, self.hoje, 30)
+        lancamento_id = Lancamento.query.filter_by(numero_documento='DASH-0').one().id
+
+        def alterar_em_outro_worker(valor):
+            # Commit de outro processo: não passa pelos eventos desta sessão
+            with db.engine.begin() as conexao:
+                conexao.execute(update(Lancamento).where(Lancamento.id == lancamento_id).values(valor_real=valor))
+                conexao.execute(update(Empresa).where(Empresa.id == self.empresa_id).values(
+                    versao_dados=Empresa.versao_dados + 1
+                ))
+            db.session.expire_all()
+
+        alterar_em_outro_worker(175)
+        try:
+            atualizado = widget_kpis(self.empresa_id, self.hoje, 30)
+            self.assertEqual(atualizado['pagar_previsto_hoje'], Decimal('175'))
+            self.assertNotEqual(atualizado, kpis)
+        finally:
+            alterar_em_outro_worker(100)
+
+    def test_etag_por_versao_dos_dados(self):
+        response = self.client.get('/dashboard/api/kpis')
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/dashboard/api/kpis', headers={'If-None-Match': etag}).status_code, 304)
+        # Outra URL tem outro ETag
+        self.assertEqual(self.client.get('/dashboard/api/mes', headers={'If-None-Match': etag}).status_code, 200)
+
+        versao = db.session.get(Empresa, self.empresa_id).versao_dados
+        banco = ContaBanco.query.filter_by(empresa_id=self.empresa_id, numero_conta='111').one()
+        banco.nome = 'Banco Principal'
+        db.session.commit()
+        self.assertEqual(db.session.get(Empresa, self.empresa_id).versao_dados, versao + 1)
+
+        response = self.client.get('/dashboard/api/kpis', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_versao_sem_atualizado_em_e_sem_tabelas_de_controle(self):
+        empresa = db.session.get(Empresa, self.empresa_id)
+        versao, atualizado_em = empresa.versao_dados, empresa.atualizado_em
+
+        # A fila de consolidação não muda o que as telas exibem
+        solicitar_consolidacao(self.empresa_id)
+        db.session.refresh(empresa)
+        self.assertEqual(empresa.versao_dados, versao)
+
+        banco = ContaBanco.query.filter_by(empresa_id=self.empresa_id, numero_conta='111').one()
+        banco.agencia = '0002'
+        db.session.commit()
+        db.session.refresh(empresa)
+        self.assertEqual((empresa.versao_dados, empresa.atualizado_em), (versao + 1, atualizado_em))
+
+    def test_cache_sqlite_compartilhado(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = os.path.join(diretorio, 'cache.sqlite3')
+            worker_a, worker_b = CacheSqlite(arquivo), CacheSqlite(arquivo)
+            worker_a.gravar((1, 30, '2026-01-01'), {'saldo_total': Decimal('10')})
+            worker_a.gravar((2, 30, '2026-01-01'), {'saldo_total': Decimal('20')})
+
+            self.assertEqual(worker_b.obter((1, 30, '2026-01-01')), {'saldo_total': Decimal('10')})
+            worker_b.invalidar_empresa(1)
+            self.assertIsNone(worker_a.obter((1, 30, '2026-01-01')))
+            self.assertIsNotNone(worker_a.obter((2, 30, '2026-01-01')))
+            self.assertEqual(worker_a.estatisticas()['hits'], 2)
+            self.assertEqual(worker_a.estatisticas()['misses'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,468 @@
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from src.app import create_app
+from src.models import (
+    db, Empresa, User, Entidade, FluxoContaModel, ContaBanco, Lancamento,
+    FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta, FilaConsolidacao
+)
+from src.services.fluxo_consolidado import consolidar_fluxo_caixa
+from src.services.fila_consolidacao import solicitar_consolidacao, processar_pendentes, empresas_alteradas
+from src.services.verificacao_consolidado import verificar_consolidado, verificar_saldos_mensais
+from src.services import consolidacao_eventos
+from src.services.saldo_mensal import movimento_antes_de, empresas_sem_saldo_mensal
+from src.services.fluxo_diario import empresas_sem_fluxo_diario
+
+
+class FluxoConsolidadoIncrementalTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app('testing')
+        cls.app.config['WTF_CSRF_ENABLED'] = False
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        empresa = Empresa(nome='Empresa Consolidado', cnpj='33333333000133')
+        db.session.add(empresa)
+        db.session.flush()
+
+        user = User(
+            empresa_id=empresa.id,
+            username='financeiro',
+            email='consolidado@test.local',
+            full_name='User Consolidado',
+            is_active=True,
+            is_admin=True,
+        )
+        user.set_password('123456')
+        db.session.add(user)
+
+        despesa = FluxoContaModel(empresa_id=empresa.id, codigo='2.1', descricao='Despesa', tipo='P', ativo=True)
+        receita = FluxoContaModel(empresa_id=empresa.id, codigo='1.1', descricao='Receita', tipo='R', ativo=True)
+        db.session.add_all([despesa, receita])
+        db.session.flush()
+
+        banco_1 = ContaBanco(
+            empresa_id=empresa.id, nome='Banco 1', banco='B1', agencia='0001',
+            numero_conta='111', ativo=True, saldo_inicial=1000,
+        )
+        banco_2 = ContaBanco(
+            empresa_id=empresa.id, nome='Banco 2', banco='B2', agencia='0002',
+            numero_conta='222', ativo=True, saldo_inicial=500,
+        )
+        entidade = Entidade(empresa_id=empresa.id, tipo='C', cnpj_cpf='00000000000003', nome='Cliente', ativo=True)
+        db.session.add_all([banco_1, banco_2, entidade])
+        db.session.commit()
+
+        cls.empresa_id = empresa.id
+        cls.despesa_id = despesa.id
+        cls.receita_id = receita.id
+        cls.banco_1_id = banco_1.id
+        cls.banco_2_id = banco_2.id
+        cls.entidade_id = entidade.id
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.ctx.pop()
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        response = self.client.post(
+            '/auth/login',
+            data={'empresa_cnpj': '33333333000133', 'username': 'financeiro', 'password': '123456'},
+            follow_redirects=True,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def tearDown(self):
+        for model in (Lancamento, FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta, FilaConsolidacao):
+            model.query.delete()
+        db.session.commit()
+
+    def _form(self, documento, fluxo_conta_id, conta_banco_id, valor, vencimento, pagamento=''):
+        return {
+            'data_evento': '2026-03-01',
+            'data_vencimento': vencimento,
+            'data_pagamento': pagamento,
+            'fluxo_conta_id': fluxo_conta_id,
+            'conta_banco_id': conta_banco_id,
+            'entidade_id': self.entidade_id,
+            'valor_real': valor,
+            'valor_pago': valor,
+            'numero_documento': documento,
+        }
+
+    def _consolidado(self):
+        db.session.expire_all()
+        realizado = sorted(
+            (r.fluxo_conta_id, r.conta_banco_id, r.data, r.saldo_anterior, r.valor_pago, r.valor_recebido, r.saldo_atual)
+            for r in FluxoCaixaRealizado.query.filter_by(empresa_id=self.empresa_id)
+        )
+        previsto = sorted(
+            (p.fluxo_conta_id, p.conta_banco_id, p.data, p.saldo_anterior, p.valor_previsto_pago,
+             p.valor_previsto_recebido, p.saldo_previsto)
+            for p in FluxoCaixaPrevisto.query.filter_by(empresa_id=self.empresa_id)
+        )
+        diario = sorted(
+            (d.conta_banco_id, d.fluxo_conta_id, d.data, d.valor_pago, d.valor_recebido, d.valor_previsto_pago,
+             d.valor_previsto_recebido, d.saldo_realizado, d.saldo_previsto)
+            for d in FluxoCaixaDiario.query.filter_by(empresa_id=self.empresa_id)
+        )
+        mensal = sorted(
+            (m.conta_banco_id, m.mes, m.saldo_realizado, m.saldo_previsto)
+            for m in SaldoMensalConta.query.filter_by(empresa_id=self.empresa_id)
+        )
+        return realizado, previsto, diario, mensal
+
+    def _assert_igual_rebuild(self):
+        incremental = self._consolidado()
+        consolidar_fluxo_caixa(self.empresa_id)
+        self.assertEqual(incremental, self._consolidado())
+
+    def test_operacoes_incrementais_equivalem_ao_rebuild(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'INC-1', self.despesa_id, self.banco_1_id, '100.00', '2026-03-05'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'INC-2', self.receita_id, self.banco_1_id, '250.00', '2026-03-10', '2026-03-09'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'INC-3', self.despesa_id, self.banco_2_id, '40.00', '2026-03-20'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'INC-4', self.receita_id, self.banco_1_id, '30.00', '2026-04-02', '2026-04-03'))
+        self._assert_igual_rebuild()
+
+        inc_1 = Lancamento.query.filter_by(numero_documento='INC-1').one()
+        inc_3 = Lancamento.query.filter_by(numero_documento='INC-3').one()
+
+        self.client.post(f'/lancamentos/{inc_1.id}/pagar')
+        self._assert_igual_rebuild()
+
+        # Troca de banco e de valor: sai de um bucket e entra em outro
+        self.client.post(f'/lancamentos/{inc_3.id}/editar', data=self._form(
+            'INC-3', self.despesa_id, self.banco_1_id, '55.00', '2026-03-25'))
+        self._assert_igual_rebuild()
+
+        self.client.post(f'/lancamentos/{inc_1.id}/deletar')
+        self._assert_igual_rebuild()
+
+        realizado, previsto, diario, mensal = self._consolidado()
+        self.assertEqual(len(realizado), 1)
+        self.assertEqual(len(previsto), 1)
+        self.assertEqual(previsto[0][2], date(2026, 3, 25))
+
+        # Abertura de abril = saldos iniciais (1000 + 500) + fechamento de março (250 recebidos)
+        self.assertEqual(movimento_antes_de(self.empresa_id, date(2026, 4, 3))[self.banco_1_id], 250)
+        self.assertEqual(movimento_antes_de(self.empresa_id, date(2026, 4, 4))[self.banco_1_id], 280)
+        response = self.client.get('/relatorios/fluxo-caixa?data_inicio=2026-04-01')
+        self.assertIn('R$ 1.750,00', response.get_data(as_text=True))
+
+    def test_diario_vazio_apos_deploy_e_reconstruido(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'DEP-1', self.receita_id, self.banco_1_id, '80.00', '2026-03-05', '2026-03-05'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'DEP-2', self.despesa_id, self.banco_1_id, '20.00', '2026-03-12'))
+        self.assertEqual(empresas_sem_fluxo_diario([self.empresa_id]), [])
+
+        # Tabela diária criada vazia pelo deploy, com lançamentos já existentes
+        FluxoCaixaDiario.query.delete()
+        db.session.commit()
+        self.assertEqual(empresas_sem_fluxo_diario([self.empresa_id]), [self.empresa_id])
+
+        # A primeira edição não soma deltas sobre saldo zero: reconstrói a empresa
+        self.client.post('/lancamentos/novo', data=self._form(
+            'DEP-3', self.receita_id, self.banco_1_id, '5.00', '2026-03-20', '2026-03-20'))
+        self.assertEqual(empresas_sem_fluxo_diario([self.empresa_id]), [])
+        self._assert_igual_rebuild()
+
+    def test_fechamentos_vazios_apos_deploy_nao_distorcem_o_saldo(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'FEC-1', self.receita_id, self.banco_1_id, '90.00', '2026-01-10', '2026-01-10'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'FEC-2', self.despesa_id, self.banco_1_id, '25.00', '2026-02-10', '2026-02-10'))
+        self.assertEqual(movimento_antes_de(self.empresa_id, date(2026, 3, 1))[self.banco_1_id], 65)
+
+        # Fechamentos mensais criados vazios pelo deploy, com o diário já populado
+        SaldoMensalConta.query.delete()
+        db.session.commit()
+        self.assertEqual(empresas_sem_saldo_mensal([self.empresa_id]), [self.empresa_id])
+        self.assertEqual(movimento_antes_de(self.empresa_id, date(2026, 3, 1))[self.banco_1_id], 65)
+
+        self.client.post('/lancamentos/novo', data=self._form(
+            'FEC-3', self.receita_id, self.banco_1_id, '5.00', '2026-03-05', '2026-03-05'))
+        self.assertEqual(empresas_sem_saldo_mensal([self.empresa_id]), [])
+        self._assert_igual_rebuild()
+        self.assertEqual(movimento_antes_de(self.empresa_id, date(2026, 4, 1))[self.banco_1_id], 70)
+
+    def test_commit_com_varios_lancamentos_consolida_uma_vez_por_empresa(self):
+        def novo(documento, fluxo, banco, valor):
+            return Lancamento(
+                empresa_id=self.empresa_id, data_evento=date(2026, 3, 1), data_vencimento=date(2026, 3, 8),
+                status='aberto', fluxo_conta_id=fluxo, conta_banco_id=banco, entidade_id=self.entidade_id,
+                valor_real=valor, valor_pago=0, numero_documento=documento,
+            )
+
+        with mock.patch.object(
+            consolidacao_eventos, 'aplicar_deltas_lancamentos',
+            wraps=consolidacao_eventos.aplicar_deltas_lancamentos
+        ) as aplicar:
+            db.session.add_all([
+                novo('LOTE-1', self.despesa_id, self.banco_1_id, 10),
+                novo('LOTE-2', self.receita_id, self.banco_1_id, 20),
+            ])
+            db.session.flush()
+            db.session.add(novo('LOTE-3', self.despesa_id, self.banco_2_id, 30))
+            db.session.commit()
+            self.assertEqual(aplicar.call_count, 1)
+            self.assertEqual(len(aplicar.call_args[0][1]), 3)
+
+            # Alterações descartadas no rollback não chegam ao consolidado
+            lote_1 = Lancamento.query.filter_by(numero_documento='LOTE-1').one()
+            lote_1.valor_real = 999
+            db.session.flush()
+            db.session.rollback()
+            db.session.commit()
+            self.assertEqual(aplicar.call_count, 1)
+
+        # Atributos expirados pelo commit alterados sem leitura prévia
+        lote_2 = Lancamento.query.filter_by(numero_documento='LOTE-2').one()
+        db.session.commit()
+        lote_2.valor_real = 45
+        lote_2.data_pagamento = date(2026, 3, 9)
+        lote_2.status = 'pago'
+        lote_2.valor_pago = 45
+        db.session.commit()
+        self._assert_igual_rebuild()
+
+    def test_saldo_inicial_e_tipo_da_conta_reconsolidam_a_empresa(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'CAD-1', self.despesa_id, self.banco_1_id, '100.00', '2026-03-05', '2026-03-06'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'CAD-2', self.receita_id, self.banco_1_id, '80.00', '2026-03-12'))
+
+        banco = db.session.get(ContaBanco, self.banco_1_id)
+        despesa = db.session.get(FluxoContaModel, self.despesa_id)
+        try:
+            banco.saldo_inicial = 1200
+            db.session.commit()
+            realizado = FluxoCaixaRealizado.query.filter_by(empresa_id=self.empresa_id).one()
+            self.assertEqual((realizado.saldo_anterior, realizado.saldo_atual), (1200, 1100))
+            self._assert_igual_rebuild()
+
+            despesa.tipo = 'R'
+            db.session.commit()
+            realizado = FluxoCaixaRealizado.query.filter_by(empresa_id=self.empresa_id).one()
+            self.assertEqual((realizado.valor_pago, realizado.valor_recebido), (0, 100))
+            self._assert_igual_rebuild()
+
+            # Deltas posteriores partem das linhas já corrigidas
+            self.client.post('/lancamentos/novo', data=self._form(
+                'CAD-3', self.despesa_id, self.banco_1_id, '15.00', '2026-03-20', '2026-03-21'))
+            self._assert_igual_rebuild()
+        finally:
+            banco.saldo_inicial = 1000
+            despesa.tipo = 'P'
+            db.session.commit()
+
+        self.app.config['CONSOLIDACAO_ASSINCRONA'] = True
+        try:
+            banco.saldo_inicial = 1300
+            db.session.commit()
+            self.assertIsNotNone(FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one().pendente_desde)
+        finally:
+            self.app.config['CONSOLIDACAO_ASSINCRONA'] = False
+            banco.saldo_inicial = 1000
+            db.session.commit()
+
+    def test_engine_sql_gera_as_mesmas_linhas_que_python(self):
+        dados = [
+            ('ENG-1', self.despesa_id, self.banco_1_id, '100.00', '2026-03-05', ''),
+            ('ENG-2', self.despesa_id, self.banco_1_id, '30.50', '2026-03-15', '2026-03-16'),
+            ('ENG-3', self.receita_id, self.banco_1_id, '250.00', '2026-03-10', '2026-03-09'),
+            ('ENG-4', self.receita_id, self.banco_2_id, '75.25', '2026-04-01', ''),
+            ('ENG-5', self.despesa_id, self.banco_2_id, '12.00', '2026-02-20', '2026-02-21'),
+        ]
+        for documento, fluxo, banco, valor, vencimento, pagamento in dados:
+            self.client.post('/lancamentos/novo', data=self._form(documento, fluxo, banco, valor, vencimento, pagamento))
+
+        consolidar_fluxo_caixa(self.empresa_id, engine='python')
+        python = self._consolidado()
+        consolidar_fluxo_caixa(self.empresa_id, engine='sql')
+        sql = self._consolidado()
+
+        self.assertEqual(len(python[0]), 3)
+        self.assertEqual(len(python[1]), 2)
+        self.assertEqual(python, sql)
+
+    def test_verificador_reconsolida_apenas_particoes_divergentes(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'VER-1', self.despesa_id, self.banco_1_id, '100.00', '2026-03-05', '2026-03-06'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'VER-2', self.receita_id, self.banco_2_id, '80.00', '2026-03-12'))
+        consolidar_fluxo_caixa(self.empresa_id)
+        correto = self._consolidado()
+        self.assertEqual(verificar_consolidado(self.empresa_id), [])
+
+        realizado = FluxoCaixaRealizado.query.filter_by(empresa_id=self.empresa_id).one()
+        realizado.valor_pago = 1
+        FluxoCaixaDiario.query.filter_by(conta_banco_id=self.banco_2_id).delete()
+        db.session.commit()
+
+        esperado = [(self.despesa_id, self.banco_1_id), (self.receita_id, self.banco_2_id)]
+        self.assertEqual(verificar_consolidado(self.empresa_id), esperado)
+        self.assertEqual(verificar_consolidado(self.empresa_id, corrigir=True), esperado)
+        self.assertEqual(verificar_consolidado(self.empresa_id), [])
+        self.assertEqual(self._consolidado(), correto)
+
+    def test_verificador_detecta_saldo_diario_divergente(self):
+        for documento, vencimento in (('DIA-1', '2026-03-05'), ('DIA-2', '2026-03-09'), ('DIA-3', '2026-03-20')):
+            self.client.post('/lancamentos/novo', data=self._form(
+                documento, self.despesa_id, self.banco_1_id, '10.00', vencimento))
+        correto = self._consolidado()
+        self.assertEqual(verificar_consolidado(self.empresa_id), [])
+
+        # Somas do dia intactas, só o saldo acumulado de um dia intermediário errado
+        dia = FluxoCaixaDiario.query.filter_by(empresa_id=self.empresa_id, data=date(2026, 3, 9)).one()
+        dia.saldo_previsto = dia.saldo_previsto + 5
+        db.session.commit()
+
+        esperado = [(self.despesa_id, self.banco_1_id)]
+        # Os dois lados são agregados no banco, sem recalcular o diário em Python
+        with mock.patch('src.services.fluxo_diario.calcular_fluxo_diario', side_effect=AssertionError):
+            self.assertEqual(verificar_consolidado(self.empresa_id), esperado)
+        # Bancos sem funções de janela acumulam os saldos por autojunção
+        with mock.patch('src.services.verificacao_consolidado.suporta_funcoes_janela', return_value=False):
+            self.assertEqual(verificar_consolidado(self.empresa_id), esperado)
+        self.assertEqual(verificar_consolidado(self.empresa_id, corrigir=True), esperado)
+        self.assertEqual(verificar_consolidado(self.empresa_id), [])
+        with mock.patch('src.services.verificacao_consolidado.suporta_funcoes_janela', return_value=False):
+            self.assertEqual(verificar_consolidado(self.empresa_id), [])
+        self.assertEqual(self._consolidado(), correto)
+
+    def test_verificador_reconstroi_saldos_mensais_divergentes(self):
+        self.client.post('/lancamentos/novo', data=self._form(
+            'MES-1', self.receita_id, self.banco_1_id, '70.00', '2026-02-10', '2026-02-11'))
+        self.client.post('/lancamentos/novo', data=self._form(
+            'MES-2', self.despesa_id, self.banco_2_id, '30.00', '2026-03-15'))
+        correto = self._consolidado()
+        self.assertEqual(verificar_saldos_mensais(self.empresa_id), [])
+
+        # Um deslocamento perdido no fechamento de fevereiro
+        fevereiro = SaldoMensalConta.query.filter_by(conta_banco_id=self.banco_1_id, mes=date(2026, 2, 1)).one()
+        fevereiro.saldo_realizado = 0
+        db.session.commit()
+
+        self.assertEqual(verificar_consolidado(self.empresa_id), [])
+        self.assertEqual(verificar_saldos_mensais(self.empresa_id, corrigir=True), [self.banco_1_id])
+        self.assertEqual(verificar_saldos_mensais(self.empresa_id), [])
+        self.assertEqual(self._consolidado(), correto)
+
+    def test_fila_agrupa_solicitacoes_da_mesma_empresa(self):
+        for _ in range(3):
+            solicitar_consolidacao(self.empresa_id)
+
+        # Dentro da janela de agrupamento nada é processado
+        self.assertEqual(processar_pendentes(janela=3600, espera_maxima=3600), [])
+
+        self.assertEqual(processar_pendentes(janela=0, espera_maxima=3600), [self.empresa_id])
+        self.assertEqual(processar_pendentes(janela=0, espera_maxima=3600), [])
+
+        fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+        self.assertIsNone(fila.pendente_desde)
+        self.assertIsNotNone(fila.consolidado_em)
+
+    def test_fila_espera_apos_falha_e_para_apos_o_limite(self):
+        self.app.config.update(CONSOLIDACAO_RETENTATIVA_SEGUNDOS=60, CONSOLIDACAO_MAX_TENTATIVAS=3)
+        alvo = 'src.services.fila_consolidacao.consolidar_fluxo_caixa'
+        try:
+            solicitar_consolidacao(self.empresa_id)
+            with mock.patch(alvo, side_effect=RuntimeError('falha')) as consolidar:
+                self.assertEqual(processar_pendentes(janela=0, espera_maxima=0), [])
+                fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+                self.assertEqual((fila.tentativas, fila.ultimo_erro), (1, 'falha'))
+                self.assertIsNotNone(fila.pendente_desde)
+
+                # Dentro da espera a empresa não é reprocessada a cada varredura
+                processar_pendentes(janela=0, espera_maxima=0)
+                self.assertEqual(consolidar.call_count, 1)
+
+                # A espera dobra a cada falha; na terceira a empresa fica parada
+                esperas = []
+                for _ in range(2):
+                    fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+                    fila.proxima_tentativa_em = datetime.utcnow() - timedelta(seconds=1)
+                    db.session.commit()
+                    inicio = datetime.utcnow()
+                    processar_pendentes(janela=0, espera_maxima=0)
+                    fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+                    if fila.proxima_tentativa_em:
+                        esperas.append(round((fila.proxima_tentativa_em - inicio).total_seconds()))
+                self.assertEqual(esperas, [120])
+                self.assertEqual(fila.tentativas, 3)
+                self.assertIsNone(fila.proxima_tentativa_em)
+                processar_pendentes(janela=0, espera_maxima=0)
+                self.assertEqual(consolidar.call_count, 3)
+
+            # Parada até a reconsolidação completa, que zera as tentativas
+            self.assertEqual(empresas_alteradas([self.empresa_id]), [self.empresa_id])
+            consolidar_fluxo_caixa(self.empresa_id)
+            fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+            self.assertEqual((fila.tentativas, fila.ultimo_erro), (0, None))
+            self.assertEqual(processar_pendentes(janela=0, espera_maxima=0), [self.empresa_id])
+        finally:
+            self.app.config.update(CONSOLIDACAO_RETENTATIVA_SEGUNDOS=30, CONSOLIDACAO_MAX_TENTATIVAS=8)
+
+    def test_empresas_alteradas_desde_a_ultima_consolidacao(self):
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [self.empresa_id])
+
+        consolidar_fluxo_caixa(self.empresa_id)
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [])
+
+        banco = db.session.get(ContaBanco, self.banco_2_id)
+        banco.nome = 'Banco 2 (renomeado)'
+        db.session.commit()
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [self.empresa_id])
+        banco.nome = 'Banco 2'
+        db.session.commit()
+
+    def test_empresas_alteradas_apos_commit_incremental(self):
+        # Execução do CLI seguida de edições consolidadas incrementalmente no commit
+        consolidar_fluxo_caixa(self.empresa_id)
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [])
+
+        self.client.post('/lancamentos/novo', data=self._form(
+            'ALT-1', self.receita_id, self.banco_1_id, '15.00', '2026-05-01'))
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [self.empresa_id])
+
+        consolidar_fluxo_caixa(self.empresa_id)
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [])
+
+        # Exclusões não atualizam nenhum atualizado_em, mas contam como alteração
+        lancamento = Lancamento.query.filter_by(numero_documento='ALT-1').one()
+        db.session.delete(lancamento)
+        db.session.commit()
+        self.assertEqual(empresas_alteradas([self.empresa_id]), [self.empresa_id])
+
+    def test_modo_assincrono_apenas_enfileira(self):
+        self.app.config['CONSOLIDACAO_ASSINCRONA'] = True
+        try:
+            antes = self._consolidado()
+            self.client.post('/lancamentos/novo', data=self._form(
+                'ASYNC-1', self.receita_id, self.banco_2_id, '10.00', '2026-04-01'))
+            self.assertEqual(antes, self._consolidado())
+
+            fila = FilaConsolidacao.query.filter_by(empresa_id=self.empresa_id).one()
+            self.assertIsNotNone(fila.pendente_desde)
+
+            processar_pendentes(janela=0, espera_maxima=0)
+            self.assertNotEqual(antes, self._consolidado())
+        finally:
+            self.app.config['CONSOLIDACAO_ASSINCRONA'] = False
+
+
+if __name__ == '__main__':
+    unittest.main()
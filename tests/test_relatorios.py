@@ -0,0 +1,482 @@
+import io
+import os
+import re
+import tempfile
+import unittest
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from openpyxl import load_workbook
+from sqlalchemy import event
+
+from src.app import create_app
+from src.models import (
+    db, Empresa, User, Entidade, FluxoContaModel, ContaBanco, Lancamento, TarefaExportacao, ParteExportacao
+)
+from src.services import fluxo_diario, fluxo_paginado
+from src.services.cache_relatorios import estatisticas_cache_relatorios
+from src.services.exportacao_pdf import Coluna, gerar_pdf
+from src.services.tarefas_exportacao import (
+    LimiteExportacoes, solicitar_exportacao, processar_exportacoes, limpar_exportacoes
+)
+
+
+class RelatoriosExportacaoTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app('testing')
+        cls.app.config['WTF_CSRF_ENABLED'] = False
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        empresa = Empresa(nome='Empresa Relatórios', cnpj='66666666000166')
+        db.session.add(empresa)
+        db.session.flush()
+
+        user = User(
+            empresa_id=empresa.id,
+            username='financeiro',
+            email='relatorios@test.local',
+            full_name='User Relatórios',
+            is_active=True,
+            is_admin=True,
+        )
+        user.set_password('123456')
+        db.session.add(user)
+
+        despesa = FluxoContaModel(empresa_id=empresa.id, codigo='2.1', descricao='Fornecedores', tipo='P', ativo=True)
+        receita = FluxoContaModel(empresa_id=empresa.id, codigo='1.1', descricao='Vendas', tipo='R', ativo=True)
+        banco = ContaBanco(
+            empresa_id=empresa.id, nome='Banco Caixa', banco='B1', agencia='0001',
+            numero_conta='111', ativo=True, saldo_inicial=1000,
+        )
+        entidade = Entidade(empresa_id=empresa.id, tipo='C', cnpj_cpf='00000000000006', nome='Cliente', ativo=True)
+        db.session.add_all([despesa, receita, banco, entidade])
+        db.session.flush()
+
+        dados = [
+            # (documento, fluxo, vencimento, pagamento, valor)
+            ('REL-1', despesa.id, date(2026, 3, 5), date(2026, 3, 5), 100),
+            ('REL-2', receita.id, date(2026, 3, 10), date(2026, 3, 9), 1250.5),
+            ('REL-3', despesa.id, date(2026, 3, 20), None, 40),
+        ]
+        for documento, fluxo, vencimento, pagamento, valor in dados:
+            db.session.add(Lancamento(
+                empresa_id=empresa.id,
+                data_evento=date(2026, 3, 1),
+                data_vencimento=vencimento,
+                data_pagamento=pagamento,
+                status='pago' if pagamento else 'aberto',
+                fluxo_conta_id=fluxo,
+                conta_banco_id=banco.id,
+                entidade_id=entidade.id,
+                valor_real=valor,
+                valor_pago=valor if pagamento else 0,
+                numero_documento=documento,
+            ))
+        db.session.commit()
+
+        cls.empresa_id = empresa.id
+        cls.entidade_id = entidade.id
+        cls.user_id = user.id
+        cls.banco_id = banco.id
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.ctx.pop()
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        response = self.client.post(
+            '/auth/login',
+            data={'empresa_cnpj': '66666666000166', 'username': 'financeiro', 'password': '123456'},
+            follow_redirects=True,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def _planilha(self, url):
+        temporarios = set(os.listdir(tempfile.gettempdir()))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        conteudo = response.get_data()
+        response.close()
+        # O temporário da exportação é removido ao fim da resposta
+        novos = set(os.listdir(tempfile.gettempdir())) - temporarios
+        self.assertFalse([nome for nome in novos if nome.startswith('export_')])
+        return load_workbook(io.BytesIO(conteudo))
+
+    def test_exportacao_diaria_com_formato_por_coluna(self):
+        wb = self._planilha('/relatorios/fluxo-caixa/export?data_inicio=2026-03-01&data_fim=2026-03-31')
+        self.assertEqual(wb.sheetnames, ['Previsto', 'Realizado'])
+
+        realizado = list(wb['Realizado'].iter_rows(values_only=True))
+        self.assertEqual(realizado[0], ('Data', 'Saldo Anterior', 'Pagamentos', 'Recebimentos', 'Saldo do Dia'))
+        self.assertEqual(realizado[1:], [
+            ('05/03/2026', 1000.0, 100.0, 0.0, 900.0),
+            ('09/03/2026', 900.0, 0.0, 1250.5, 2150.5),
+        ])
+        self.assertEqual(wb['Realizado']['C2'].number_format, '#,##0.00')
+        self.assertEqual(wb['Realizado'].column_dimensions['B'].width, 18)
+
+    def test_exportacao_lancamentos(self):
+        wb = self._planilha('/relatorios/fluxo-caixa-csv/export')
+        linhas = list(wb['Fluxo de Caixa'].iter_rows(values_only=True))
+        self.assertEqual(linhas[0], ('Data', 'Descrição', 'Categoria', 'Conta Banco', 'Tipo', 'Valor (R$)'))
+        self.assertEqual(linhas[1], ('05/03/2026', 'REL-1', 'Fornecedores', 'Banco Caixa', 'Despesa', 'R$ 100,00'))
+        self.assertEqual(linhas[2], ('09/03/2026', 'REL-2', 'Vendas', 'Banco Caixa', 'Receita', 'R$ 1.250,50'))
+        self.assertEqual(linhas[3], ('-', 'REL-3', 'Fornecedores', 'Banco Caixa', 'Despesa', 'R$ 40,00'))
+
+    def test_exportacao_balancete(self):
+        wb = self._planilha('/relatorios/exportar/balancete?data_ini=2026-03-01&data_fim=2026-03-31')
+        linhas = list(wb['Balancete Financeiro'].iter_rows(values_only=True))
+        self.assertEqual(linhas[0], ('Empresa', 'Empresa Relatórios', None))
+        self.assertIn(('Código', 'Conta', 'Valor'), linhas)
+        self.assertEqual(linhas[-1][0], 'TOTAL')
+
+        response = self.client.get('/relatorios/exportar/balancete?formato=doc')
+        self.assertEqual(response.status_code, 302)
+        with mock.patch.dict('src.routes.relatorios.FORMATOS_BALANCETE', {'pdf': ('PDF', None)}):
+            response = self.client.get('/relatorios/exportar/balancete?formato=pdf')
+        self.assertEqual(response.status_code, 302)
+
+    def test_exportacao_balancete_pdf(self):
+        # Anexo: sempre gerado, mesmo com If-None-Match do navegador
+        response = self.client.get(
+            '/relatorios/exportar/balancete?formato=pdf&data_ini=2026-03-01&data_fim=2026-03-31',
+            headers={'If-None-Match': '*'}
+        )
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertTrue(response.get_data().startswith(b'%PDF'))
+        response.close()
+
+        self.client.post('/relatorios/exportacoes', data={
+            'tipo': 'balancete', 'formato': 'pdf', 'data_ini': '2026-03-01', 'data_fim': '2026-03-31',
+        })
+        tarefa_id = self.client.get('/relatorios/exportacoes/situacao').get_json()[0]['id']
+        self.assertEqual(processar_exportacoes(), [tarefa_id])
+        response = self.client.get(f'/relatorios/exportacoes/{tarefa_id}/download')
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertTrue(response.get_data().startswith(b'%PDF'))
+        response.close()
+
+    def test_pdf_repete_o_cabecalho_em_cada_pagina(self):
+        colunas = [Coluna('Código', 35), Coluna('Conta', 115), Coluna('Valor', 40, 'R')]
+        linhas = [[f'1.{i}', f'Conta nº {i} – ação', f'R$ {i},00'] for i in range(300)]
+        for fonte in (self.app.config['PDF_FONTE'], '/nao/existe.ttf'):
+            with mock.patch.dict(self.app.config, {'PDF_FONTE': fonte}):
+                if os.path.exists(fonte):
+                    caminho = gerar_pdf(['Empresa: Açaí'], colunas, linhas, total=['TOTAL', '', 'R$ 1,00'])
+                else:
+                    # Sem a fonte Unicode o PDF sai em Helvetica, com aviso no log
+                    with self.assertLogs('src.services.exportacao_pdf', 'WARNING') as avisos:
+                        caminho = gerar_pdf(['Empresa: Açaí'], colunas, linhas, total=['TOTAL', '', 'R$ 1,00'])
+                    self.assertIn('/nao/existe.ttf', avisos.output[0])
+            with open(caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+            os.remove(caminho)
+            paginas = self._paginas_pdf(conteudo)
+            self.assertGreater(len(paginas), 1)
+            for pagina in paginas:
+                # Só as células do cabeçalho das colunas são preenchidas ("re B")
+                self.assertEqual(pagina.count(b' re B '), len(colunas))
+
+    def _paginas_pdf(self, conteudo):
+        paginas = []
+        for stream in re.findall(rb'stream\n(.*?)\nendstream', conteudo, re.S):
+            try:
+                stream = zlib.decompress(stream)
+            except zlib.error:
+                continue
+            if b' Tj ET' in stream:
+                paginas.append(stream)
+        return paginas
+
+    def test_download_csv_em_streaming(self):
+        response = self.client.get('/relatorios/fluxo-caixa-csv/download?data_inicio=2026-03-01&data_fim=2026-03-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        linhas = response.get_data().decode('utf-8-sig').splitlines()
+        self.assertEqual(linhas[0], 'Data;Descrição;Categoria;Conta Banco;Tipo;Valor (R$)')
+        self.assertEqual(linhas[1:], [
+            '05/03/2026;REL-1;2.1 - Fornecedores;Banco Caixa;Despesa;100,00',
+            '09/03/2026;REL-2;1.1 - Vendas;Banco Caixa;Receita;1250,50',
+            '20/03/2026;REL-3;2.1 - Fornecedores;Banco Caixa;Despesa;40,00',
+        ])
+
+        listagem = self.client.get('/relatorios/fluxo-caixa-csv?data_inicio=2026-03-01&data_fim=2026-03-31')
+        self.assertIn('2.1 - Fornecedores', listagem.get_data(as_text=True))
+        self.assertEqual(self.client.get('/relatorios/fluxo-caixa-csv/download?data_inicio=x').status_code, 302)
+
+    def test_listagem_filtra_pela_data_de_pagamento_ou_vencimento(self):
+        # Pago entra pelo pagamento, mesmo com o vencimento em outro período;
+        # só o que está em aberto entra pelo vencimento
+        fluxo_id = FluxoContaModel.query.filter_by(empresa_id=self.empresa_id, codigo='1.1').one().id
+        lancamentos = [
+            Lancamento(
+                empresa_id=self.empresa_id, data_evento=date(2026, 3, 1), data_vencimento=vencimento,
+                data_pagamento=pagamento, status='pago', fluxo_conta_id=fluxo_id, conta_banco_id=self.banco_id,
+                entidade_id=self.entidade_id, valor_real=10, valor_pago=10, numero_documento=documento,
+            )
+            for documento, vencimento, pagamento in (
+                ('VENC-MARCO', date(2026, 3, 15), date(2026, 4, 2)),
+                ('PAGO-MARCO', date(2026, 2, 25), date(2026, 3, 3)),
+            )
+        ]
+        db.session.add_all(lancamentos)
+        db.session.commit()
+        try:
+            def documentos(periodo):
+                response = self.client.get(f'/relatorios/fluxo-caixa-csv/download?{periodo}')
+                return [linha.split(';')[1] for linha in response.get_data().decode('utf-8-sig').splitlines()[1:]]
+
+            marco = documentos('data_inicio=2026-03-01&data_fim=2026-03-31')
+            self.assertIn('PAGO-MARCO', marco)
+            self.assertNotIn('VENC-MARCO', marco)
+            self.assertEqual(documentos('data_inicio=2026-04-01&data_fim=2026-04-30'), ['VENC-MARCO'])
+        finally:
+            for lancamento in lancamentos:
+                db.session.delete(lancamento)
+            db.session.commit()
+
+    def test_resumo_diario_com_e_sem_funcoes_de_janela(self):
+        argumentos = (self.empresa_id, True, Decimal('1000.00'), date(2026, 3, 1), date(2026, 3, 31))
+        self.assertTrue(fluxo_diario.suporta_funcoes_janela())
+        com_janela = fluxo_diario.resumo_diario(*argumentos)
+        with mock.patch.object(fluxo_diario, 'suporta_funcoes_janela', return_value=False):
+            sem_janela = fluxo_diario.resumo_diario(*argumentos)
+        self.assertEqual(com_janela, sem_janela)
+        self.assertEqual(com_janela, [
+            (date(2026, 3, 5), Decimal('1000.00'), Decimal('100.00'), Decimal('0.00'), Decimal('900.00')),
+            (date(2026, 3, 10), Decimal('900.00'), Decimal('0.00'), Decimal('1250.50'), Decimal('2150.50')),
+            (date(2026, 3, 20), Decimal('2150.50'), Decimal('40.00'), Decimal('0.00'), Decimal('2110.50')),
+        ])
+
+    def test_paginas_do_fluxo_mantem_o_saldo_por_conta(self):
+        saldos = {self.banco_id: Decimal('1000.00')}
+        argumentos = (self.empresa_id, True, saldos, date(2026, 3, 1), date(2026, 3, 31))
+        completa, proximo = fluxo_paginado.pagina_fluxo(*argumentos)
+        self.assertIsNone(proximo)
+        self.assertEqual(
+            [(item.saldo_anterior, item.saldo_atual) for item in completa],
+            [
+                (Decimal('1000.00'), Decimal('900.00')),
+                (Decimal('900.00'), Decimal('2150.50')),
+                (Decimal('2150.50'), Decimal('2110.50')),
+            ]
+        )
+
+        for com_janela in (True, False):
+            with mock.patch.object(fluxo_paginado, 'suporta_funcoes_janela', return_value=com_janela):
+                paginas, cursor = [], None
+                while True:
+                    pagina, proximo = fluxo_paginado.pagina_fluxo(
+                        *argumentos, apos=fluxo_paginado.decodificar_cursor(cursor), tamanho=2
+                    )
+                    paginas.extend(pagina)
+                    if proximo is None:
+                        break
+                    cursor = proximo
+            self.assertEqual(len(paginas), 3)
+            self.assertEqual(
+                [(item.lancamento.id, item.saldo_anterior, item.saldo_atual) for item in paginas],
+                [(item.lancamento.id, item.saldo_anterior, item.saldo_atual) for item in completa]
+            )
+
+        # Legado pago sem data de pagamento: fica fora das páginas e dos saldos
+        legado = Lancamento(
+            empresa_id=self.empresa_id, data_evento=date(2026, 3, 1), data_vencimento=date(2026, 3, 8), status='pago',
+            fluxo_conta_id=FluxoContaModel.query.filter_by(empresa_id=self.empresa_id, codigo='1.1').one().id,
+            conta_banco_id=self.banco_id,
+            entidade_id=self.entidade_id, valor_real=50, valor_pago=50, numero_documento='LEGADO-1',
+        )
+        db.session.add(legado)
+        db.session.commit()
+        try:
+            realizado, cursor = [], None
+            while True:
+                pagina, cursor = fluxo_paginado.pagina_fluxo(
+                    self.empresa_id, False, saldos, apos=fluxo_paginado.decodificar_cursor(cursor), tamanho=1
+                )
+                realizado.extend(pagina)
+                if cursor is None:
+                    break
+            self.assertNotIn(legado.id, [item.lancamento.id for item in realizado])
+            self.assertEqual(realizado[-1].saldo_atual, Decimal('2150.50'))
+        finally:
+            db.session.delete(legado)
+            db.session.commit()
+
+        # Cursor inválido volta à primeira página
+        response = self.client.get('/relatorios/fluxo-caixa?data_inicio=2026-03-01&data_fim=2026-03-31&previsto_apos=x')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Próximos', response.get_data(as_text=True))
+
+    def test_exportacao_em_segundo_plano(self):
+        response = self.client.post('/relatorios/exportacoes', data={
+            'tipo': 'fluxo-caixa', 'data_inicio': '2026-03-01', 'data_fim': '2026-03-31', 'conta_banco_id': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        situacao = self.client.get('/relatorios/exportacoes/situacao').get_json()
+        self.assertEqual((situacao[0]['status'], situacao[0]['progresso']), ('pendente', 0))
+        tarefa_id = situacao[0]['id']
+        self.assertEqual(self.client.get(f'/relatorios/exportacoes/{tarefa_id}/download').status_code, 302)
+
+        self.assertEqual(processar_exportacoes(), [tarefa_id])
+        situacao = self.client.get('/relatorios/exportacoes/situacao').get_json()[0]
+        self.assertEqual((situacao['status'], situacao['progresso']), ('concluida', 100))
+        self.assertIn('fluxo_caixa_diario.xlsx', self.client.get('/relatorios/exportacoes').get_data(as_text=True))
+
+        response = self.client.get(f'/relatorios/exportacoes/{tarefa_id}/download')
+        self.assertEqual(response.status_code, 200)
+        wb = load_workbook(io.BytesIO(response.get_data()))
+        response.close()
+        self.assertEqual(wb['Realizado']['E3'].value, 2150.5)
+
+        self.assertNotIn('ETag', response.headers)
+
+        # Expirada: indisponível mesmo antes da limpeza do worker, que depois remove o arquivo do banco
+        tarefa = db.session.get(TarefaExportacao, tarefa_id)
+        tarefa.expira_em = datetime.utcnow() - timedelta(minutes=1)
+        db.session.commit()
+        self.assertEqual(self.client.get(f'/relatorios/exportacoes/{tarefa_id}/download').status_code, 302)
+        self.assertGreater(ParteExportacao.query.filter_by(tarefa_id=tarefa_id).count(), 0)
+        self.assertEqual(limpar_exportacoes(), 1)
+        self.assertEqual(ParteExportacao.query.filter_by(tarefa_id=tarefa_id).count(), 0)
+        self.assertEqual(self.client.get(f'/relatorios/exportacoes/{tarefa_id}/download').status_code, 302)
+
+    def test_limites_de_exportacao_por_empresa(self):
+        self.app.config['EXPORTACAO_MAX_FILA_POR_EMPRESA'] = 2
+        try:
+            primeira = solicitar_exportacao(self.empresa_id, self.user_id, 'balancete', {'data_ini': '2026-03-01'}).id
+            segunda = solicitar_exportacao(self.empresa_id, self.user_id, 'comissoes', {}).id
+            with self.assertRaises(LimiteExportacoes):
+                solicitar_exportacao(self.empresa_id, self.user_id, 'balancete', {})
+
+            # Com uma exportação da empresa em andamento, a próxima espera
+            db.session.get(TarefaExportacao, primeira).status = 'processando'
+            db.session.commit()
+            self.assertEqual(processar_exportacoes(), [])
+            db.session.get(TarefaExportacao, primeira).status = 'pendente'
+            db.session.commit()
+            self.assertEqual(processar_exportacoes(limite=2), [primeira, segunda])
+            self.assertEqual(
+                [db.session.get(TarefaExportacao, t).status for t in (primeira, segunda)], ['concluida', 'concluida']
+            )
+        finally:
+            self.app.config['EXPORTACAO_MAX_FILA_POR_EMPRESA'] = 5
+            TarefaExportacao.query.delete()
+            db.session.commit()
+
+    def test_exportacao_reaproveita_o_resultado_da_tela(self):
+        filtros = 'data_ini=2026-03-01&data_fim=2026-03-31&conta_ini=1'
+        self.assertEqual(self.client.get(f'/relatorios/balancete?{filtros}').status_code, 200)
+        antes = estatisticas_cache_relatorios()
+        self._planilha(f'/relatorios/exportar/balancete?formato=xlsx&{filtros}')
+        self.assertEqual(estatisticas_cache_relatorios()['hits'], antes['hits'] + 1)
+
+        # Commit que altera a empresa muda a versão dos dados: a entrada antiga não é mais usada
+        lancamento = Lancamento.query.filter_by(numero_documento='REL-2').one()
+        lancamento.observacoes = 'alterado'
+        db.session.commit()
+        self._planilha(f'/relatorios/exportar/balancete?formato=xlsx&{filtros}')
+        self.assertEqual(estatisticas_cache_relatorios()['misses'], antes['misses'] + 1)
+
+    def test_data_referencia_gerada_pelo_banco(self):
+        lancamento = Lancamento.query.filter_by(numero_documento='REL-3').one()
+        self.assertEqual(lancamento.data_referencia, date(2026, 3, 20))
+        try:
+            # Pago em fevereiro: sai da listagem de março, mesmo vencendo em março
+            lancamento.data_pagamento = date(2026, 2, 27)
+            db.session.commit()
+            self.assertEqual(lancamento.data_referencia, date(2026, 2, 27))
+            response = self.client.get('/relatorios/fluxo-caixa-csv/download?data_inicio=2026-03-01&data_fim=2026-03-31')
+            self.assertNotIn('REL-3', response.get_data().decode('utf-8-sig'))
+        finally:
+            lancamento.data_pagamento = None
+            db.session.commit()
+
+    def _contar_consultas(self, url):
+        consultas = []
+
+        def contar(conn, cursor, statement, parameters, context, executemany):
+            consultas.append(statement)
+
+        # Contexto novo = sessão nova: lazy loads não são resolvidos pelo identity map do teste
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', contar)
+            try:
+                response = self.client.get(url)
+                response.get_data()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', contar)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def _criar_lancamentos(self, quantidade, inicio):
+        for numero in range(inicio, inicio + quantidade):
+            # Contas distintas por linha: um lazy load por linha apareceria na contagem
+            fluxo = FluxoContaModel(
+                empresa_id=self.empresa_id, codigo=f'9.{numero}', descricao=f'Conta {numero}', tipo='P', ativo=True
+            )
+            banco = ContaBanco(
+                empresa_id=self.empresa_id, nome=f'Banco {numero}', banco='B9', agencia='0009',
+                numero_conta=f'9{numero}', ativo=False, saldo_inicial=0,
+            )
+            db.session.add_all([fluxo, banco])
+            db.session.flush()
+            db.session.add(Lancamento(
+                empresa_id=self.empresa_id,
+                data_evento=date(2027, 1, 1),
+                data_vencimento=date(2027, 1, 1 + numero % 28),
+                data_pagamento=date(2027, 1, 1 + numero % 28),
+                status='pago',
+                fluxo_conta_id=fluxo.id,
+                conta_banco_id=banco.id,
+                entidade_id=self.entidade_id,
+                valor_real=10,
+                valor_pago=10,
+                numero_documento=f'N1-{numero}',
+            ))
+        db.session.commit()
+
+    def test_consultas_nao_crescem_com_as_linhas(self):
+        periodo = 'data_inicio=2027-01-01&data_fim=2027-12-31'
+        urls = [
+            f'/relatorios/fluxo-caixa?{periodo}',
+            f'/relatorios/fluxo-caixa-csv?{periodo}',
+            f'/relatorios/fluxo-caixa-csv/export?{periodo}',
+            f'/relatorios/fluxo-caixa-csv/download?{periodo}',
+            '/dashboard/api/ultimos-lancamentos',
+        ]
+        try:
+            self._criar_lancamentos(3, 0)
+            antes = {url: self._contar_consultas(url) for url in urls}
+            self._criar_lancamentos(12, 3)
+            depois = {url: self._contar_consultas(url) for url in urls}
+            self.assertEqual(depois, antes)
+        finally:
+            for lancamento in Lancamento.query.filter(Lancamento.numero_documento.like('N1-%')):
+                db.session.delete(lancamento)
+            db.session.commit()
+            # Contas criadas por _criar_lancamentos, depois que o consolidado deixou de referenciá-las
+            for fluxo in FluxoContaModel.query.filter(
+                FluxoContaModel.empresa_id == self.empresa_id, FluxoContaModel.codigo.like('9.%')
+            ):
+                db.session.delete(fluxo)
+            for banco in ContaBanco.query.filter_by(empresa_id=self.empresa_id, banco='B9'):
+                db.session.delete(banco)
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
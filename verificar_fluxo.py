@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Verificação do consolidado do fluxo de caixa - LiveSun Financeiro
+
+Compara, por partição (empresa, conta de fluxo, conta bancária), checksums
+calculados a partir dos lançamentos com os das tabelas consolidadas, e os
+fechamentos mensais de cada conta bancária. Com --corrigir, reconsolida apenas
+as partições divergentes e reconstrói os fechamentos das contas divergentes
+(autocorreção noturna em vez de um rebuild completo de todas as empresas).
+
+Uso:
+  python verificar_fluxo.py                   # Todas as empresas, só relatório
+  python verificar_fluxo.py --empresa 3       # Apenas a empresa 3
+  python verificar_fluxo.py --corrigir        # Reconsolida as partições divergentes
+"""
+
+import os
+import sys
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.app import create_app
+from src.models import (
+    db, Lancamento, FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta
+)
+from src.services.verificacao_consolidado import verificar_consolidado, verificar_saldos_mensais
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Verifica o consolidado do fluxo de caixa contra os lançamentos'
+    )
+    parser.add_argument(
+        '--empresa',
+        type=int,
+        action='append',
+        help='ID da empresa a verificar (pode ser repetido). Padrão: todas'
+    )
+    parser.add_argument(
+        '--corrigir',
+        action='store_true',
+        help='Reconsolida as partições divergentes e reconstrói os saldos mensais divergentes'
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.empresa:
+            empresa_ids = args.empresa
+        else:
+            # Inclui empresas que só têm consolidado, diário ou fechamentos
+            # (ex.: último lançamento apagado), para que as linhas órfãs sejam removidas
+            empresa_ids = sorted({
+                row[0]
+                for modelo in (Lancamento, FluxoCaixaRealizado, FluxoCaixaPrevisto, FluxoCaixaDiario, SaldoMensalConta)
+                for row in db.session.query(modelo.empresa_id).distinct()
+            })
+
+        print('=' * 70)
+        print(f'[VERIFICAÇÃO] Verificando {len(empresa_ids)} empresa(s)')
+        print('=' * 70)
+
+        total_divergentes = 0
+        falhas = 0
+        for empresa_id in empresa_ids:
+            try:
+                divergentes = verificar_consolidado(empresa_id, corrigir=args.corrigir)
+                # Depois das partições: a correção dos mensais parte do diário já corrigido
+                contas_mensais = verificar_saldos_mensais(empresa_id, corrigir=args.corrigir)
+            except Exception as exc:
+                db.session.rollback()
+                falhas += 1
+                print(f'  ✗ Empresa {empresa_id}: {exc}')
+                continue
+            if not divergentes and not contas_mensais:
+                print(f'  ✓ Empresa {empresa_id}: consolidado íntegro')
+                continue
+            total_divergentes += len(divergentes) + len(contas_mensais)
+            if divergentes:
+                acao = 'reconsolidada(s)' if args.corrigir else 'divergente(s)'
+                particoes = ', '.join(f'fluxo {fluxo}/banco {banco}' for fluxo, banco in divergentes)
+                print(f'  ✗ Empresa {empresa_id}: {len(divergentes)} partição(ões) {acao}: {particoes}')
+            if contas_mensais:
+                acao = 'reconstruídos' if args.corrigir else 'divergentes'
+                contas = ', '.join(f'banco {banco}' for banco in contas_mensais)
+                print(f'  ✗ Empresa {empresa_id}: saldos mensais {acao}: {contas}')
+
+        print(f'\n[VERIFICAÇÃO] Concluída: {total_divergentes} divergência(s), {falhas} empresa(s) com erro')
+        return falhas == 0 and (args.corrigir or total_divergentes == 0)
+
+
+if __name__ == '__main__':
+    ok = main()
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Worker de tarefas em segundo plano - LiveSun Financeiro
+
+Processa a fila de consolidação do fluxo de caixa. Solicitações repetidas da
+mesma empresa dentro da janela CONSOLIDACAO_JANELA_SEGUNDOS são agrupadas em
+uma única consolidação.
+
+Também gera as exportações em segundo plano (uma por varredura, para não
+atrasar a consolidação) e remove os arquivos expirados.
+
+Uso:
+  python worker.py                    # Loop contínuo
+  python worker.py --uma-vez          # Processa o que estiver pronto e sai
+  python worker.py --intervalo 2      # Intervalo entre varreduras (segundos)
+  python worker.py --fila exportacao  # Só exportações (workers dedicados)
+"""
+
+import os
+import sys
+import argparse
+import logging
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.app import create_app
+from src.models import db
+from src.services.fila_consolidacao import processar_pendentes
+from src.services.tarefas_exportacao import processar_exportacoes, limpar_exportacoes
+
+logger = logging.getLogger('worker')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker de consolidação do fluxo de caixa')
+    parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre varreduras da fila')
+    parser.add_argument('--uma-vez', action='store_true', help='Processa a fila uma vez e encerra')
+    parser.add_argument(
+        '--fila', choices=('todas', 'consolidacao', 'exportacao'), default='todas', help='Filas atendidas por este worker'
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    logger.info('Worker iniciado (intervalo=%ss, fila=%s)', args.intervalo, args.fila)
+
+    while True:
+        with app.app_context():
+            if args.fila in ('todas', 'consolidacao'):
+                try:
+                    processadas = processar_pendentes()
+                    if processadas:
+                        logger.info('Empresas consolidadas: %s', processadas)
+                except Exception as exc:
+                    logger.exception('Falha ao processar a fila de consolidação: %s', exc)
+                finally:
+                    db.session.remove()
+
+            if args.fila in ('todas', 'exportacao'):
+                try:
+                    limpar_exportacoes()
+                    exportadas = processar_exportacoes()
+                    if exportadas:
+                        logger.info('Exportações geradas: %s', exportadas)
+                except Exception as exc:
+                    logger.exception('Falha ao processar as exportações: %s', exc)
+                finally:
+                    db.session.remove()
+
+        if args.uma_vez:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == '__main__':
+    main()